@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from ScheduleToScript import compile_schedule
+from TravelCost import DEFAULT_DECK_LAYOUT
+
+
+CACHE_DIR = Path(".validation_cache")
+
+# Rough seconds each simulated command takes on an OT-2, keyed by run log text prefix
+SIMULATED_COMMAND_SECS = {
+    "Picking up tip": 4.0,
+    "Returning tip": 4.0,
+    "Dropping tip": 4.0,
+    "Aspirating": 2.5,
+    "Dispensing": 2.5,
+    "Mixing": 0.5,
+    "Blowing out": 1.5,
+    "Moving to": 1.5,
+    "Homing": 6.0,
+    "Setting Temperature": 0.0,
+    "Pausing": 0.0,
+    "Delaying": 0.0,
+}
+DELAY_PATTERN = re.compile(r"^Delaying for (\d+) minutes and ([\d.]+) seconds")
+
+
+def command_type(text: str) -> str:
+    for prefix in SIMULATED_COMMAND_SECS:
+        if text.startswith(prefix):
+            return prefix
+    return "Other"
+
+
+def estimate_duration_secs(command_texts: list[str]) -> float:
+    # Simulated time never advances, so sleep_seconds_after_start delays come
+    # out as the full offset from the start of the run rather than a gap
+    elapsed_secs = 0.0
+    for text in command_texts:
+        delay = DELAY_PATTERN.match(text)
+        if delay is None:
+            elapsed_secs += SIMULATED_COMMAND_SECS.get(command_type(text), 0.0)
+            continue
+        delay_secs = int(delay.group(1)) * 60 + float(delay.group(2))
+        if "Sleeping until" in text:
+            elapsed_secs = max(elapsed_secs, delay_secs)
+        else:
+            elapsed_secs += delay_secs
+    return elapsed_secs
+
+
+def script_hash(script: str) -> str:
+    import opentrons
+
+    # Simulator upgrades can change the outcome for the same script
+    return hashlib.sha256(f"{opentrons.__version__}\n{script}".encode()).hexdigest()
+
+
+def simulate_script(script: str, file_name: str) -> dict:
+    import io
+    import traceback
+
+    from opentrons.simulate import simulate
+
+    try:
+        runlog, _ = simulate(io.StringIO(script), file_name=file_name)
+    except Exception as error:
+        # Protocol Engine wraps the real error, so summarize it the way the CLI does
+        to_stderr_string = getattr(error, "to_stderr_string", None)
+        message = to_stderr_string() if to_stderr_string else f"{type(error).__name__}: {error}"
+        return {
+            "ok": False,
+            "error": message.strip(),
+            "traceback": traceback.format_exc(),
+            "command_count": 0,
+            "command_counts": {},
+            "estimated_duration_secs": None,
+        }
+
+    command_texts = [command["payload"].get("text", "") for command in runlog]
+    return {
+        "ok": True,
+        "error": None,
+        "traceback": None,
+        "command_count": len(command_texts),
+        "command_counts": dict(Counter(command_type(text) for text in command_texts)),
+        "estimated_duration_secs": estimate_duration_secs(command_texts),
+    }
+
+
+def validate_schedules(
+    schedule_paths: list[Path],
+    jobs: int | None = None,
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    cache_dir: Path = CACHE_DIR,
+) -> list[dict]:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    scripts_to_simulate = {}
+    for schedule_path in schedule_paths:
+        script, _ = compile_schedule(json.loads(schedule_path.read_text()), layout=layout)
+        digest = script_hash(script)
+        cache_path = cache_dir / f"{digest}.json"
+        if cache_path.exists():
+            results[schedule_path] = {
+                **json.loads(cache_path.read_text()),
+                "cached": True,
+            }
+        else:
+            results[schedule_path] = {"script_hash": digest, "cached": False}
+            # Identical scripts from different schedules only simulate once
+            scripts_to_simulate.setdefault(digest, script)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            digest: executor.submit(simulate_script, script, f"{digest[:12]}.py")
+            for digest, script in scripts_to_simulate.items()
+        }
+        simulated = {digest: future.result() for digest, future in futures.items()}
+
+    for digest, result in simulated.items():
+        (cache_dir / f"{digest}.json").write_text(
+            json.dumps({"script_hash": digest, **result})
+        )
+    for schedule_path, result in results.items():
+        if not result["cached"]:
+            result.update(simulated[result["script_hash"]])
+
+    return [
+        {"schedule": str(schedule_path), **result}
+        for schedule_path, result in results.items()
+    ]
+
+
+def summarize(results: list[dict]) -> str:
+    failures = [result for result in results if not result["ok"]]
+    lines = [
+        f"{len(results) - len(failures)}/{len(results)} schedules passed simulation "
+        f"({sum(result['cached'] for result in results)} from cache)"
+    ]
+    for result in results:
+        if result["ok"]:
+            duration = timedelta(seconds=round(result["estimated_duration_secs"]))
+            lines.append(
+                f"  ok    {result['schedule']}: {result['command_count']} commands, ~{duration}"
+            )
+        else:
+            lines.append(f"  FAIL  {result['schedule']}: {result['error']}")
+
+    if failures:
+        lines.append("Failures by error:")
+        for error, count in Counter(result["error"] for result in failures).most_common():
+            lines.append(f"  {count} x {error}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile schedules and check them with the Opentrons simulator"
+    )
+    parser.add_argument("schedule_paths", nargs="+", type=Path)
+    parser.add_argument("--jobs", type=int, help="simulator processes to run at once")
+    parser.add_argument(
+        "--layout",
+        type=Path,
+        help="deck layout JSON written by DeckLayoutOptimizer.py",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--json", type=Path, help="also write the results as JSON")
+    parser.add_argument("--store", type=Path, help="also record the results in a RunStore")
+    args = parser.parse_args()
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    results = validate_schedules(args.schedule_paths, args.jobs, layout, args.cache_dir)
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent="    "))
+    if args.store is not None:
+        from RunStore import RunStore
+
+        store = RunStore(args.store)
+        schedule_ids = store.add_schedules([Path(result["schedule"]) for result in results])
+        for schedule_id, result in zip(schedule_ids, results):
+            store.add_script(schedule_id, result["script_hash"], layout)
+        store.add_validation_results(results)
+        store.close()
+    print(summarize(results))
+    exit(0 if all(result["ok"] for result in results) else 1)
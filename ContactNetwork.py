@@ -0,0 +1,284 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from GenerateSchedule import DAY_DURATION, SHIFTS, WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT
+from RunLogParser import iter_schedule_events
+from ScheduleToScript import get_well_plate
+
+
+SECONDS_PER_DAY = DAY_DURATION.total_seconds()
+CATEGORIES = list(WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT)
+PLATES = ["patient", "staff", "equipment", "surface"]
+# The operator seeds the first patient well before the schedule starts
+SEED_CATEGORY = "patient"
+SEED_WELL_NUMBER = 0
+
+
+def plate_well_counts() -> dict[str, int]:
+    counts = dict.fromkeys(PLATES, 0)
+    for category, shift_ranges in WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT.items():
+        plate = get_well_plate(category)
+        counts[plate] = max(counts[plate], *(end for _, end in shift_ranges.values()))
+    return counts
+
+
+# Every physical well is a node, numbered plate by plate
+PLATE_OFFSETS = dict(zip(PLATES, np.cumsum([0, *plate_well_counts().values()])[:-1].tolist()))
+NODE_COUNT = sum(plate_well_counts().values())
+# Padding edges in an ensemble run between two spare nodes past the real ones
+PADDING_NODE = NODE_COUNT
+NODE_CATEGORIES = np.empty(NODE_COUNT + 1, dtype=object)
+for category, shift_ranges in WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT.items():
+    for start, end in shift_ranges.values():
+        offset = PLATE_OFFSETS[get_well_plate(category)]
+        NODE_CATEGORIES[offset + start : offset + end] = category
+
+
+def node(category: str, well_number: int) -> int:
+    return PLATE_OFFSETS[get_well_plate(category)] + well_number
+
+
+def contact_edges(events) -> dict[str, np.ndarray]:
+    # One edge per interaction, in schedule order
+    times, periods, sources, targets, volumes = [], [], [], [], []
+    for event in events:
+        if event["type"] != "interaction":
+            continue
+        info = event["interaction_info"]
+        times.append(event["seconds_after_start"])
+        periods.append(
+            int(event["seconds_after_start"] // SECONDS_PER_DAY) * len(SHIFTS)
+            + SHIFTS.index(info["shift"])
+        )
+        sources.append(node(info["source_category"], info["source_well_number"]))
+        targets.append(node(info["target_category"], info["target_well_number"]))
+        volumes.append(info["bacteria_transfer_ul"])
+    return {
+        "time": np.array(times, dtype=float),
+        "period": np.array(periods, dtype=int),
+        "source": np.array(sources, dtype=int),
+        "target": np.array(targets, dtype=int),
+        "volume_ul": np.array(volumes, dtype=float),
+    }
+
+
+def stack_edges(runs: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    # (runs x edges) arrays, shorter runs padded with zero volume edges
+    edge_count = max(len(run["time"]) for run in runs)
+    padding = {
+        "time": np.inf,
+        "period": -1,
+        "source": PADDING_NODE,
+        "target": PADDING_NODE,
+        "volume_ul": 0.0,
+    }
+    return {
+        name: np.stack(
+            [
+                np.pad(run[name], (0, edge_count - len(run[name])), constant_values=fill)
+                for run in runs
+            ]
+        )
+        for name, fill in padding.items()
+    }
+
+
+def day_periods(day: int) -> list[int]:
+    return [day * len(SHIFTS) + shift for shift in range(len(SHIFTS))]
+
+
+def adjacency(edges: dict[str, np.ndarray], periods: list[int] | None = None):
+    # Sparse (rows, cols, summed volume) of one run, optionally for some periods
+    # (a shift, or day_periods for a whole day). A transfer carries liquid both
+    # ways, so every edge is stored in both directions.
+    keep = np.isin(edges["period"], periods) if periods is not None else edges["period"] >= 0
+    rows = np.concatenate([edges["source"][keep], edges["target"][keep]])
+    cols = np.concatenate([edges["target"][keep], edges["source"][keep]])
+    volumes = np.concatenate([edges["volume_ul"][keep], edges["volume_ul"][keep]])
+    keys, inverse = np.unique(rows * (NODE_COUNT + 1) + cols, return_inverse=True)
+    return keys // (NODE_COUNT + 1), keys % (NODE_COUNT + 1), np.bincount(inverse, weights=volumes)
+
+
+def day_network(edges: dict[str, np.ndarray], day: int) -> dict:
+    # Degree and exposure of every well over one day of one run
+    rows, _, volumes = adjacency(edges, day_periods(day))
+    degree = np.bincount(rows, minlength=NODE_COUNT + 1)[:NODE_COUNT]
+    exposure_ul = np.bincount(rows, weights=volumes, minlength=NODE_COUNT + 1)[:NODE_COUNT]
+    categories = NODE_CATEGORIES[:NODE_COUNT]
+    return {
+        "day": day,
+        "contacted_wells": int((degree > 0).sum()),
+        "mean_degree": {
+            category: float(degree[categories == category].mean()) for category in CATEGORIES
+        },
+        "max_degree": {
+            category: int(degree[categories == category].max()) for category in CATEGORIES
+        },
+        "exposure_ul": {
+            category: float(exposure_ul[categories == category].sum()) for category in CATEGORIES
+        },
+    }
+
+
+def period_degrees(ensemble: dict[str, np.ndarray], period_count: int):
+    # Distinct contacts and exposure volume per (run, period, node)
+    run_count = ensemble["time"].shape[0]
+    runs = np.broadcast_to(np.arange(run_count)[:, None], ensemble["time"].shape)
+    valid = ensemble["period"] >= 0
+    run = np.concatenate([runs[valid]] * 2)
+    period = np.concatenate([ensemble["period"][valid]] * 2)
+    here = np.concatenate([ensemble["source"][valid], ensemble["target"][valid]])
+    there = np.concatenate([ensemble["target"][valid], ensemble["source"][valid]])
+    volume = np.concatenate([ensemble["volume_ul"][valid]] * 2)
+
+    node_slot = (run * period_count + period) * (NODE_COUNT + 1) + here
+    slot_count = run_count * period_count * (NODE_COUNT + 1)
+    shape = (run_count, period_count, NODE_COUNT + 1)
+    exposure_ul = np.bincount(node_slot, weights=volume, minlength=slot_count).reshape(shape)
+    contacts = np.unique(node_slot * (NODE_COUNT + 1) + there) // (NODE_COUNT + 1)
+    degree = np.bincount(contacts, minlength=slot_count).reshape(shape)
+    return degree[:, :, :NODE_COUNT], exposure_ul[:, :, :NODE_COUNT]
+
+
+def temporal_spread(ensemble: dict[str, np.ndarray]):
+    # Replays every run's interactions in time order at once. A well is reached
+    # when it shares a transfer with a reached well; path length counts transfers.
+    run_count, edge_count = ensemble["time"].shape
+    runs = np.arange(run_count)
+    arrival_secs = np.full((run_count, NODE_COUNT + 1), np.inf)
+    hops = np.full((run_count, NODE_COUNT + 1), np.iinfo(np.int32).max, dtype=np.int64)
+    seed = node(SEED_CATEGORY, SEED_WELL_NUMBER)
+    arrival_secs[:, seed] = 0.0
+    hops[:, seed] = 0
+    # Transfers that moved bacteria, counted per (source category, target category)
+    carrying = np.zeros((run_count, edge_count), dtype=bool)
+
+    for edge in range(edge_count):
+        source = ensemble["source"][:, edge]
+        target = ensemble["target"][:, edge]
+        time = ensemble["time"][:, edge]
+        source_reached = arrival_secs[runs, source] <= time
+        target_reached = arrival_secs[runs, target] <= time
+        carrying[:, edge] = (source_reached | target_reached) & (source != PADDING_NODE)
+
+        for here, there, here_reached in [
+            (source, target, source_reached),
+            (target, source, target_reached),
+        ]:
+            spreads = here_reached & (arrival_secs[runs, there] > time)
+            arrival_secs[runs[spreads], there[spreads]] = time[spreads]
+            shorter = here_reached & (hops[runs, here] + 1 < hops[runs, there])
+            hops[runs[shorter], there[shorter]] = hops[runs[shorter], here[shorter]] + 1
+
+    hops = np.where(np.isinf(arrival_secs), -1, hops)
+    return arrival_secs[:, :NODE_COUNT], hops[:, :NODE_COUNT], carrying
+
+
+def route_counts(ensemble: dict[str, np.ndarray], carrying: np.ndarray) -> list[dict[str, int]]:
+    routes = []
+    for run in range(carrying.shape[0]):
+        sources = NODE_CATEGORIES[ensemble["source"][run][carrying[run]]]
+        targets = NODE_CATEGORIES[ensemble["target"][run][carrying[run]]]
+        pairs, counts = np.unique(
+            np.char.add(np.char.add(sources.astype(str), "->"), targets.astype(str)),
+            return_counts=True,
+        )
+        routes.append(dict(zip(pairs.tolist(), counts.tolist())))
+    return routes
+
+
+def analyze_ensemble(schedule_paths: list[Path]) -> list[dict]:
+    ensemble = stack_edges(
+        [contact_edges(iter_schedule_events(path)) for path in schedule_paths]
+    )
+    period_count = int(ensemble["period"].max()) + 1
+    degree, exposure_ul = period_degrees(ensemble, period_count)
+    arrival_secs, hops, carrying = temporal_spread(ensemble)
+    routes = route_counts(ensemble, carrying)
+
+    day_count = -(-period_count // len(SHIFTS))
+    categories = NODE_CATEGORIES[:NODE_COUNT]
+    reports = []
+    for run, schedule_path in enumerate(schedule_paths):
+        run_edges = {name: edges[run] for name, edges in ensemble.items()}
+        reached = np.isfinite(arrival_secs[run])
+        reports.append(
+            {
+                "schedule": str(schedule_path),
+                "reached_wells": int(reached.sum()),
+                "reached_per_category": {
+                    category: int(reached[categories == category].sum())
+                    for category in CATEGORIES
+                },
+                "first_arrival_hours": {
+                    category: (
+                        float(arrival_secs[run][categories == category].min() / 60 / 60)
+                        if reached[categories == category].any()
+                        else None
+                    )
+                    for category in CATEGORIES
+                },
+                "max_path_length": int(hops[run].max()),
+                "mean_path_length": float(hops[run][reached].mean()),
+                "carrying_routes": routes[run],
+                "periods": [
+                    {
+                        "day": period // len(SHIFTS),
+                        "shift": SHIFTS[period % len(SHIFTS)],
+                        "mean_degree": {
+                            category: float(degree[run, period][categories == category].mean())
+                            for category in CATEGORIES
+                        },
+                        "exposure_ul": {
+                            category: float(exposure_ul[run, period][categories == category].sum())
+                            for category in CATEGORIES
+                        },
+                    }
+                    for period in range(period_count)
+                ],
+                "days": [day_network(run_edges, day) for day in range(day_count)],
+            }
+        )
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Analyze schedules as contact networks between wells"
+    )
+    parser.add_argument("schedule_paths", nargs="+", type=Path)
+    parser.add_argument(
+        "--route",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("SOURCE", "TARGET"),
+        help="categories to count carrying transfers between, e.g. equipment patient",
+    )
+    parser.add_argument("--json", type=Path, help="also write the full reports as JSON")
+    args = parser.parse_args()
+
+    reports = analyze_ensemble(args.schedule_paths)
+    if args.json is not None:
+        args.json.write_text(json.dumps(reports, indent="    "))
+    for report in reports:
+        arrivals = ", ".join(
+            f"{category} {hours:.1f}h" if hours is not None else f"{category} never"
+            for category, hours in report["first_arrival_hours"].items()
+        )
+        print(
+            f"{report['schedule']}: reached {report['reached_wells']}/{NODE_COUNT} wells "
+            f"in up to {report['max_path_length']} transfers; first reached {arrivals}"
+        )
+        for source, target in args.route:
+            count = report["carrying_routes"].get(f"{source}->{target}", 0)
+            print(f"  {source} -> {target}: {count} carrying transfers")
+        for day in report["days"]:
+            degrees = ", ".join(
+                f"{category} {degree:.1f} ({day['exposure_ul'][category]:.0f} µL)"
+                for category, degree in day["mean_degree"].items()
+            )
+            print(f"  Day {day['day'] + 1}: {day['contacted_wells']} wells in contact, mean degree {degrees}")
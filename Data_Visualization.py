@@ -1,8 +1,10 @@
-import json
-from collections import defaultdict
+import sys
+from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 
+from RunLogParser import ROWS, WellVolumeAccumulator, parse_run_log
+
 
 # Sample JSON log data (replace with your actual log data)
 log_data = {
@@ -16,38 +18,27 @@ log_data = {
     }
 }
 
-# Initialize a dictionary to store well volumes
-well_volumes = defaultdict(int)
-
-# Parse the log data to update well volumes
-for command in log_data["commands"]["data"]:
-    if command["commandType"] == "dispense":
-        well_name = command["params"]["wellName"]
-        volume = command["params"]["volume"]
-        well_volumes[well_name] += volume
-
-print(well_volumes)  # Check the parsed data
-
-# Define well plate dimensions
-rows = 'ABCDEFGH'
-cols = range(1, 13)
-
-# Create a 2D array to store well volumes
-heatmap_data = np.zeros((len(rows), len(cols)))
-
-# Map the well names to the 2D array
-for well, volume in well_volumes.items():
-    row = rows.index(well[0])
-    col = int(well[1:]) - 1
-    heatmap_data[row, col] = volume
-
-# Plot the heatmap
-plt.figure(figsize=(10, 8))
-plt.imshow(heatmap_data, cmap='viridis', interpolation='nearest')
-plt.colorbar(label='Volume (µL)')
-plt.xticks(ticks=np.arange(len(cols)), labels=cols)
-plt.yticks(ticks=np.arange(len(rows)), labels=rows)
-plt.xlabel('Column')
-plt.ylabel('Row')
-plt.title('Well Plate Volume Distribution')
-plt.show()
\ No newline at end of file
+if len(sys.argv) == 1:
+    accumulator = WellVolumeAccumulator().add_all(log_data["commands"]["data"])
+    plate_volumes = accumulator.plate_volumes()
+elif len(sys.argv) == 2:
+    plate_volumes = parse_run_log(Path(sys.argv[1]))
+else:
+    print("usage: python Data_Visualization.py [RUN_LOG_JSON_PATH]")
+    exit(1)
+
+# Plot one dispensed volume heatmap per plate
+fig, axes = plt.subplots(
+    1, len(plate_volumes), figsize=(10 * len(plate_volumes), 8), squeeze=False
+)
+for ax, (plate, (aspirated, dispensed)) in zip(axes[0], plate_volumes.items()):
+    print(plate, dispensed.sum())  # Check the parsed data
+    rows, cols = dispensed.shape
+    image = ax.imshow(dispensed, cmap='viridis', interpolation='nearest')
+    fig.colorbar(image, ax=ax, label='Volume (µL)')
+    ax.set_xticks(ticks=np.arange(cols), labels=range(1, cols + 1))
+    ax.set_yticks(ticks=np.arange(rows), labels=ROWS[:rows])
+    ax.set_xlabel('Column')
+    ax.set_ylabel('Row')
+    ax.set_title(f'Well Plate Volume Distribution\n{plate}')
+plt.show()
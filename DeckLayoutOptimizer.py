@@ -0,0 +1,108 @@
+import argparse
+import json
+import random
+from datetime import timedelta
+from pathlib import Path
+
+from ScheduleReader import ScheduleReader
+from ScheduleToScript import events_to_operations
+from TravelCost import DECK_SLOT_ORIGINS, DEFAULT_DECK_LAYOUT, TravelModel
+
+
+LAYOUT_OUTPUT_PATH = Path("deck_layout.json")
+LABWARE_ROLES = ["patient", "staff", "equipment", "surface", "reservoir"]
+
+
+def layout_to_slots(layout: dict) -> dict[str, str]:
+    # One role per slot, with each tip rack as its own role
+    slots = {layout[role]: role for role in LABWARE_ROLES}
+    for rack_number, slot in enumerate(layout["tipracks"]):
+        slots[slot] = f"tiprack_{rack_number}"
+    return slots
+
+
+def slots_to_layout(slots: dict[str, str]) -> dict:
+    roles = {role: slot for slot, role in slots.items()}
+    return {
+        **{role: roles[role] for role in LABWARE_ROLES},
+        "tipracks": [
+            roles[f"tiprack_{rack_number}"]
+            for rack_number in range(len(DEFAULT_DECK_LAYOUT["tipracks"]))
+        ],
+    }
+
+
+def layout_cost(layout: dict, operations: list) -> float:
+    # Compiled scripts take tips whichever way is shorter for the layout
+    model = TravelModel(layout)
+    return min(model.estimate_travel_secs(operations, nearest_tiprack) for nearest_tiprack in (True, False))
+
+
+def optimize_layout(
+    operations: list, restarts: int = 4, seed: int | None = None
+) -> tuple[dict, float]:
+    rng = random.Random(seed)
+    slot_names = list(DECK_SLOT_ORIGINS)
+
+    best_layout = DEFAULT_DECK_LAYOUT
+    best_cost = layout_cost(best_layout, operations)
+    for restart in range(restarts):
+        slots = layout_to_slots(DEFAULT_DECK_LAYOUT)
+        if restart != 0:
+            # Start later restarts from a shuffled deck to escape local minima
+            roles = list(slots.values())
+            rng.shuffle(roles)
+            slots = dict(zip(slot_names, roles))
+        cost = layout_cost(slots_to_layout(slots), operations)
+
+        # Swap the contents of two slots while that shortens the travel
+        improved = True
+        while improved:
+            improved = False
+            for i, first_slot in enumerate(slot_names):
+                for second_slot in slot_names[i + 1 :]:
+                    candidate = dict(slots)
+                    candidate[first_slot], candidate[second_slot] = (
+                        slots[second_slot],
+                        slots[first_slot],
+                    )
+                    candidate_cost = layout_cost(slots_to_layout(candidate), operations)
+                    if candidate_cost < cost:
+                        slots, cost = candidate, candidate_cost
+                        improved = True
+
+        if cost < best_cost:
+            best_layout, best_cost = slots_to_layout(slots), cost
+    return best_layout, best_cost
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search deck slot assignments that shorten head travel for a schedule"
+    )
+    parser.add_argument(
+        "events_json_log_path",
+        nargs="?",
+        type=Path,
+        default=Path("simulation_events.json"),
+    )
+    parser.add_argument(
+        "layout_output_path", nargs="?", type=Path, default=LAYOUT_OUTPUT_PATH
+    )
+    parser.add_argument("--restarts", type=int, default=4)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--day", type=int, help="optimize for only this day, starting at 0")
+    parser.add_argument("--shift", help="optimize for only this shift, of every day unless --day is given")
+    args = parser.parse_args()
+
+    operations = events_to_operations(ScheduleReader(args.events_json_log_path).events(args.day, args.shift))
+    default_cost = layout_cost(DEFAULT_DECK_LAYOUT, operations)
+    layout, cost = optimize_layout(operations, args.restarts, args.seed)
+    args.layout_output_path.write_text(json.dumps(layout, indent="    "))
+
+    print(json.dumps(layout))
+    print(
+        f"Estimated head travel: {timedelta(seconds=round(default_cost))} with the default layout, "
+        f"{timedelta(seconds=round(cost))} optimized "
+        f"(saved {timedelta(seconds=round(default_cost - cost))})"
+    )
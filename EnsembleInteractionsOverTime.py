@@ -0,0 +1,119 @@
+import argparse
+from collections.abc import Iterable
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from ScheduleReader import SECONDS_PER_DAY, ScheduleReader
+
+
+CATEGORIES = ["doctor", "nurse", "patient", "equipment", "surface"]
+# Cumulative counts are evaluated on this many evenly spaced times
+GRID_POINTS = 20000
+# Points drawn per curve after downsampling
+PLOT_POINTS = 1000
+BANDS = [(5, 95), (25, 75)]
+
+
+def interaction_times(events: Iterable[dict]) -> dict[str, np.ndarray]:
+    # Sorted interaction times touching each category, counting both ends
+    interactions = [event for event in events if event["type"] == "interaction"]
+    times = np.array([event["seconds_after_start"] for event in interactions], dtype=float)
+    sources = np.array([event["interaction_info"]["source_category"] for event in interactions])
+    targets = np.array([event["interaction_info"]["target_category"] for event in interactions])
+    return {
+        category: np.sort(np.concatenate([times[sources == category], times[targets == category]]))
+        for category in CATEGORIES
+    }
+
+
+def cumulative_counts(
+    schedule_paths: list[Path],
+    grid_points: int = GRID_POINTS,
+    day: int | None = None,
+    shift: str | None = None,
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    # One (runs x grid_points) array of cumulative interactions per category,
+    # counted from the start of the day when only one day is read
+    runs = [interaction_times(ScheduleReader(path).events(day, shift)) for path in schedule_paths]
+    end_secs = max(
+        (times[-1] for run in runs for times in run.values() if len(times)), default=0.0
+    )
+    start_secs = 0.0 if day is None else day * SECONDS_PER_DAY
+    grid = np.linspace(start_secs, max(end_secs, start_secs), grid_points)
+    counts = {
+        category: np.stack(
+            [np.searchsorted(run[category], grid, side="right") for run in runs]
+        )
+        for category in CATEGORIES
+    }
+    return grid, counts
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: keeps the point in each bucket that forms
+    # the biggest triangle with its neighbours, so steps and bends survive
+    if points >= len(x) or points < 3:
+        return np.arange(len(x))
+    bucket_edges = np.linspace(1, len(x) - 1, points - 1).astype(int)
+    indices = np.zeros(points, dtype=int)
+    indices[-1] = len(x) - 1
+    for bucket in range(points - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        next_end = bucket_edges[bucket + 2] if bucket + 2 < len(bucket_edges) else len(x)
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        previous = indices[bucket]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        indices[bucket + 1] = start + np.argmax(areas)
+    return indices
+
+
+def plot_ensemble(
+    grid: np.ndarray, counts: dict[str, np.ndarray], plot_points: int = PLOT_POINTS
+):
+    hours = grid / 60 / 60
+    for category, category_counts in counts.items():
+        median = np.median(category_counts, axis=0)
+        bands = {band: np.percentile(category_counts, band, axis=0) for band in BANDS}
+        # Every band uses the median's points so the fills line up with it
+        keep = lttb_indices(hours, median, plot_points)
+        (line,) = plt.plot(hours[keep], median[keep], label=category)
+        for (low, high), alpha in zip(BANDS, [0.15, 0.3]):
+            low_counts, high_counts = bands[(low, high)]
+            plt.fill_between(
+                hours[keep], low_counts[keep], high_counts[keep], color=line.get_color(), alpha=alpha
+            )
+
+    band_labels = ", ".join(f"{low}-{high}" for low, high in BANDS)
+    plt.title(
+        f"Cumulative Interactions per Category Over Time\n"
+        f"median and {band_labels} percentile bands of {len(category_counts)} runs"
+    )
+    plt.ylabel("Cumulative Interactions")
+    plt.xlabel("Hours")
+    plt.legend(loc="upper left")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plot cumulative interactions per category across many schedules"
+    )
+    parser.add_argument("schedule_paths", nargs="+", type=Path)
+    parser.add_argument("--grid-points", type=int, default=GRID_POINTS)
+    parser.add_argument("--plot-points", type=int, default=PLOT_POINTS)
+    parser.add_argument("--output", type=Path, help="save the figure instead of showing it")
+    parser.add_argument("--day", type=int, help="plot only this day, starting at 0")
+    parser.add_argument("--shift", help="plot only this shift, of every day unless --day is given")
+    args = parser.parse_args()
+
+    grid, counts = cumulative_counts(args.schedule_paths, args.grid_points, args.day, args.shift)
+    plot_ensemble(grid, counts, args.plot_points)
+    if args.output is not None:
+        plt.savefig(args.output)
+    else:
+        plt.show()
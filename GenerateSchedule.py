@@ -1,8 +1,9 @@
-import json
 from datetime import timedelta
 from pathlib import Path
 import random
 
+from ScheduleReader import write_schedule
+
 # Constants
 EVENTS_PATH = Path("simulation_events.json")
 
@@ -106,6 +107,34 @@ WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT = {
 }
 
 
+def clean_deadline_secs(day: int, shift: str) -> float:
+    # End of shift cleans have no time of their own, they are due by the end of
+    # the shift's cleaning window
+    return (
+        DAY_DURATION * day
+        + (SHIFT_DURATION + END_OF_SHIFT_CLEAN_DURATION) * (SHIFTS.index(shift) + 1)
+    ).total_seconds()
+
+
+def schedule_parameters() -> dict:
+    # Saved next to every schedule, since these constants change between runs
+    return {
+        "days": DAYS,
+        "shifts": SHIFTS,
+        "shift_secs": SHIFT_DURATION.total_seconds(),
+        "end_of_shift_clean_secs": END_OF_SHIFT_CLEAN_DURATION.total_seconds(),
+        "end_of_day_clean_secs": END_OF_DAY_CLEAN_DURATION.total_seconds(),
+        "interactions_per_shift": INTERACTIONS_PER_SHIFT,
+        "interaction_probabilities": INTERACTION_PROBABILITIES,
+        "cleaning_probabilities": CLEANING_PROBABILITIES,
+        "bacteria_transfer_base_ul": BACTERIA_TRANSFER_BASE_UL,
+        "bacteria_transfer_gauss_mul": BACTERIA_TRANSFER_GAUSS_MUL,
+        "cleaning_amount_base_ul": CLEANING_AMOUNT_BASE_UL,
+        "cleaning_amount_gauss_mul": CLEANING_AMOUNT_GAUSS_MUL,
+        "wells_numbers_range_of_type_per_shift": WELLS_NUMBERS_RANGE_OF_TYPE_PER_SHIFT,
+    }
+
+
 def clamped_gaussian(mu: float, sigma: float, minval: float, maxval: float) -> float:
     val = random.gauss(mu, sigma)
     val = min(val, maxval)
@@ -286,7 +315,7 @@ if __name__ == "__main__":
             for i in range(1, len(simulation_events))
         )
     )
-    EVENTS_PATH.write_text(json.dumps(simulation_events, indent="    "))
+    write_schedule(simulation_events, EVENTS_PATH, schedule_parameters())
 
     print(
         f"{SHIFT_DURATION} long shifts ({SHIFT_DURATION + END_OF_SHIFT_CLEAN_DURATION} including end of shift cleaning)"
@@ -1,9 +1,17 @@
-import json
+import argparse
 from pathlib import Path
 import matplotlib.pyplot as plt
 
+from ScheduleReader import ScheduleReader
 
-events = json.loads(Path("simulation_events.json").read_text())
+
+parser = argparse.ArgumentParser(description="Plot cumulative interactions per category")
+parser.add_argument("events_json_log_path", nargs="?", type=Path, default=Path("simulation_events.json"))
+parser.add_argument("--day", type=int, help="plot only this day, starting at 0")
+parser.add_argument("--shift", help="plot only this shift, of every day unless --day is given")
+args = parser.parse_args()
+
+events = ScheduleReader(args.events_json_log_path).events(args.day, args.shift)
 
 interactions = [e for e in events if e["type"] == "interaction"]
 interaction_times_per_category: dict[str, list[float]] = {
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import math
+
+from LiquidLevel import level_table
+from SimulationConstants import (
+    BACTERIA_TRANSFER_SETTLE_WAIT_SECS,
+    BLEACH_CONTACT_WAIT_SECS,
+    BLEACH_MIX_UL,
+    FILLED_WELL_COUNTS,
+    INITIAL_MEDIA_UL,
+    MEDIA_TUBE_UL,
+    MIX_REPITITIONS,
+    MODULE_TEMPERATURE_C,
+)
+from TravelCost import (
+    DEFAULT_DECK_LAYOUT,
+    BLEACH_WELL,
+    MEDIA_WELL,
+    RESERVOIR_LOAD_NAME,
+    TEMPERATURE_MODULE_PLATES,
+    TIPRACK_LOAD_NAME,
+    WELL_PLATE_LOAD_NAME,
+    WASTE_WELL,
+    TravelModel,
+    load_labware_definition,
+)
+
+
+PIPETTE_ID = "p300"
+# Default p300_single_gen2 flow rate in uL/s, the same for every action
+FLOW_RATE_UL_PER_SEC = 92.86
+TRASH_LOAD_NAME = "opentrons_1_trash_1100ml_fixed"
+# Opentrons' default distance above the well bottom for aspirating and dispensing
+WELL_BOTTOM_CLEARANCE_MM = 1.0
+# A JSON protocol has no clock to sleep against, so schedule waits are worked
+# out ahead of time from these rough per command durations
+COMMAND_SECS = {
+    "pickUpTip": 4.0,
+    "dropTip": 4.0,
+    "aspirate": 2.5,
+    "dispense": 2.5,
+    "blowout": 1.5,
+    "home": 6.0,
+}
+
+
+def labware_uri(load_name: str) -> str:
+    definition = load_labware_definition(load_name)
+    return f"{definition['namespace']}/{load_name}/{definition['version']}"
+
+
+def well_names(load_name: str) -> list[str]:
+    # Column by column, like labware.wells()
+    return [name for column in load_labware_definition(load_name)["ordering"] for name in column]
+
+
+class JsonProtocolBuilder:
+    def __init__(self, layout: dict = DEFAULT_DECK_LAYOUT, time_scale: float = 1.0, nearest_tiprack: bool = True):
+        self.layout = layout
+        self.time_scale = time_scale
+        self.nearest_tiprack = nearest_tiprack
+        self.model = TravelModel(layout)
+        self.commands = []
+        self.load_names = set()
+        self.elapsed_secs = 0.0
+        self.media_volume_ul = MEDIA_TUBE_UL
+        self.media_levels = level_table(MEDIA_TUBE_UL)
+        self.head = None
+        self.setup_labware()
+
+    def command(self, command_type: str, **params):
+        self.commands.append(
+            {"commandType": command_type, "key": str(len(self.commands)), "params": params}
+        )
+        self.elapsed_secs += COMMAND_SECS.get(command_type, 0.0)
+
+    def load_labware(self, labware_id: str, load_name: str, location: dict, display_name: str | None = None):
+        self.load_names.add(load_name)
+        definition = load_labware_definition(load_name)
+        params = {
+            "labwareId": labware_id,
+            "loadName": load_name,
+            "namespace": definition["namespace"],
+            "version": definition["version"],
+            "location": location,
+        }
+        if display_name is not None:
+            params["displayName"] = display_name
+        self.command("loadLabware", **params)
+
+    def setup_labware(self):
+        for plate in TEMPERATURE_MODULE_PLATES:
+            self.command(
+                "loadModule",
+                moduleId=f"{plate}_module",
+                model="temperatureModuleV1",
+                location={"slotName": self.layout[plate]},
+            )
+        for plate in ["patient", "staff", "equipment", "surface"]:
+            if plate in TEMPERATURE_MODULE_PLATES:
+                location = {"moduleId": f"{plate}_module"}
+            else:
+                location = {"slotName": self.layout[plate]}
+            self.load_labware(plate, WELL_PLATE_LOAD_NAME, location, f"{plate.title()} Plate")
+        self.load_labware("reservoir", RESERVOIR_LOAD_NAME, {"slotName": self.layout["reservoir"]})
+        for rack_index, slot in enumerate(self.layout["tipracks"]):
+            self.load_labware(f"tiprack_{rack_index}", TIPRACK_LOAD_NAME, {"slotName": slot})
+        self.load_labware("trash", TRASH_LOAD_NAME, {"slotName": "12"})
+        self.command("loadPipette", pipetteId=PIPETTE_ID, pipetteName="p300_single_gen2", mount="right")
+
+        self.tip_names = well_names(TIPRACK_LOAD_NAME)
+        self.plate_well_names = well_names(WELL_PLATE_LOAD_NAME)
+        self.reservoir_well_names = well_names(RESERVOIR_LOAD_NAME)
+        self.next_tips = [0] * len(self.layout["tipracks"])
+
+    def well(self, labware_id: str, well_name: str, origin: str = "bottom", z: float = WELL_BOTTOM_CLEARANCE_MM) -> dict:
+        return {
+            "pipetteId": PIPETTE_ID,
+            "labwareId": labware_id,
+            "wellName": well_name,
+            "wellLocation": {"origin": origin, "offset": {"x": 0, "y": 0, "z": z}},
+        }
+
+    def reservoir(self, well_index: int, origin: str = "bottom", z: float = WELL_BOTTOM_CLEARANCE_MM) -> dict:
+        return self.well("reservoir", self.reservoir_well_names[well_index], origin, z)
+
+    def media(self) -> dict:
+        # Mirrors HospitalSimulation.media_aspiration_height_mm
+        height_mm = next(
+            height for volume_ul, height in reversed(self.media_levels)
+            if volume_ul <= max(self.media_volume_ul, 0)
+        )
+        return self.reservoir(MEDIA_WELL, z=height_mm)
+
+    def plate_well(self, plate: str, well_number: int) -> dict:
+        return self.well(plate, self.plate_well_names[well_number])
+
+    def aspirate(self, volume_ul: float, location: dict):
+        self.command("aspirate", **location, volume=volume_ul, flowRate=FLOW_RATE_UL_PER_SEC)
+
+    def dispense(self, volume_ul: float, location: dict):
+        self.command("dispense", **location, volume=volume_ul, flowRate=FLOW_RATE_UL_PER_SEC)
+
+    def blow_out(self, location: dict):
+        self.command("blowout", **location, flowRate=FLOW_RATE_UL_PER_SEC)
+
+    def delay(self, seconds: float, message: str):
+        seconds *= self.time_scale
+        if seconds > 0:
+            self.command("waitForDuration", seconds=seconds, message=message)
+            self.elapsed_secs += seconds
+
+    def pick_up_tip(self, first_stop) -> dict:
+        # The same rack choice HospitalSimulation.pick_up_tip makes at run time
+        def tip_detour(rack: int) -> float:
+            tip = self.model.tiprack_wells[rack][self.next_tips[rack]]
+            detour = math.dist(tip, first_stop)
+            if self.head is not None:
+                detour += math.dist(self.head, tip)
+            return detour
+
+        racks_with_tips = [
+            rack for rack, next_tip in enumerate(self.next_tips) if next_tip < len(self.tip_names)
+        ]
+        if not racks_with_tips:
+            raise ValueError("schedule uses more tips than the tip racks hold")
+        rack = min(racks_with_tips, key=tip_detour) if self.nearest_tiprack else racks_with_tips[0]
+        tip = {
+            "pipetteId": PIPETTE_ID,
+            "labwareId": f"tiprack_{rack}",
+            "wellName": self.tip_names[self.next_tips[rack]],
+        }
+        self.command("pickUpTip", **tip)
+        self.head = self.model.tiprack_wells[rack][self.next_tips[rack]]
+        self.next_tips[rack] += 1
+        return tip
+
+    def return_tip(self, tip: dict):
+        self.command("dropTip", **tip)
+
+    def bleach_tip(self):
+        for _ in range(MIX_REPITITIONS):
+            self.aspirate(BLEACH_MIX_UL, self.reservoir(BLEACH_WELL, "top", -40))
+            self.dispense(BLEACH_MIX_UL, self.reservoir(BLEACH_WELL, "top", -40))
+        self.blow_out(self.reservoir(BLEACH_WELL, "top", 0))
+        self.delay(BLEACH_CONTACT_WAIT_SECS, "for bleach contact")
+
+    def initialize(self):
+        self.command("comment", message="Initializing Hospital Simulation...")
+        self.command("comment", message="Starting simulation setup...")
+        for plate in TEMPERATURE_MODULE_PLATES:
+            self.command(
+                "temperatureModule/setTargetTemperature",
+                moduleId=f"{plate}_module",
+                celsius=MODULE_TEMPERATURE_C,
+            )
+            self.command("temperatureModule/waitForTemperature", moduleId=f"{plate}_module")
+
+        self.command("comment", message="Filling all wells with initial media...")
+        tip = self.pick_up_tip(self.model.reservoir_wells[MEDIA_WELL])
+        for plate, well_count in FILLED_WELL_COUNTS.items():
+            for well_number in range(well_count):
+                self.aspirate(INITIAL_MEDIA_UL, self.media())
+                self.dispense(INITIAL_MEDIA_UL, self.plate_well(plate, well_number))
+                self.blow_out(self.plate_well(plate, well_number))
+                self.media_volume_ul -= INITIAL_MEDIA_UL
+        self.bleach_tip()
+        self.return_tip(tip)
+        self.command("home")
+        self.command("comment", message="All wells filled with initial media.")
+        self.command(
+            "waitForResume",
+            message="Media distribution complete. Please manually add initial bacteria "
+            "to the first well of the patient plate, then resume the protocol.",
+        )
+        # The schedule clock starts once the bacteria are in
+        self.elapsed_secs = 0.0
+
+    def sleep_seconds_after_start(self, seconds_after_start: float, message: str | None = None):
+        seconds = seconds_after_start - self.elapsed_secs / self.time_scale
+        if seconds <= 0:
+            if message is not None:
+                self.comment(message)
+            return
+        reason = f"Sleeping until {seconds_after_start:g} seconds after the start"
+        if message is not None:
+            reason += f": {message}"
+        self.delay(seconds, reason)
+
+    def comment(self, text: str):
+        self.command("comment", message=text)
+
+    def transfer(self, source_plate: str, target_plate: str, source_number: int, target_number: int, transfer_ul: float):
+        source = self.plate_well(source_plate, source_number)
+        target = self.plate_well(target_plate, target_number)
+        tip = self.pick_up_tip(self.model.plate_wells[source_plate][source_number])
+        # transfer() does nothing for no volume, but the tip is still used
+        if transfer_ul > 0:
+            self.aspirate(transfer_ul, source)
+            self.dispense(transfer_ul, target)
+        self.delay(BACTERIA_TRANSFER_SETTLE_WAIT_SECS, "for bacteria to settle")
+        if transfer_ul > 0:
+            self.aspirate(transfer_ul, target)
+            self.dispense(transfer_ul, source)
+        self.bleach_tip()
+        self.return_tip(tip)
+
+    def clean(self, plate: str, well_number: int, clean_ul: float, due_secs: float):
+        well = self.plate_well(plate, well_number)
+        tip = self.pick_up_tip(self.model.reservoir_wells[MEDIA_WELL])
+        self.aspirate(clean_ul, self.media())
+        self.dispense(clean_ul, well)
+        self.media_volume_ul -= clean_ul
+        self.aspirate(clean_ul, well)
+        self.dispense(clean_ul, self.reservoir(WASTE_WELL, "top", 0))
+        self.bleach_tip()
+        self.return_tip(tip)
+
+    def wait_for_continue(self, resume_at: float):
+        self.command("waitForResume", message="Pausing for maintenance")
+        # Assume the operator resumes on time
+        self.elapsed_secs = max(self.elapsed_secs, resume_at * self.time_scale)
+        self.sleep_seconds_after_start(resume_at)
+
+    def end_of_day_restock(self):
+        self.next_tips = [0] * len(self.next_tips)
+        self.media_volume_ul = MEDIA_TUBE_UL
+
+    def protocol(self, name: str) -> dict:
+        commands_text = json.dumps(self.commands, sort_keys=True)
+        return {
+            "$otSharedSchema": "#/protocol/schemas/8",
+            "schemaVersion": 8,
+            "metadata": {
+                "protocolName": name,
+                "author": "Jonnathan Saavedra",
+                "description": "Optimized simulation of hospital environment",
+                "tags": [hashlib.sha256(commands_text.encode()).hexdigest()],
+            },
+            "robot": {"model": "OT-2 Standard", "deckId": "ot2_standard"},
+            "labwareDefinitionSchemaId": "opentronsLabwareSchemaV2",
+            "labwareDefinitions": {
+                labware_uri(load_name): load_labware_definition(load_name)
+                for load_name in sorted(self.load_names)
+            },
+            "liquidSchemaId": "opentronsLiquidSchemaV1",
+            "liquids": {},
+            "commandSchemaId": "opentronsCommandSchemaV8",
+            "commands": self.commands,
+            "commandAnnotationSchemaId": "opentronsCommandAnnotationSchemaV1",
+            "commandAnnotations": [],
+        }
+
+
+def compile_json_protocol(
+    operations: list[tuple[str, tuple]],
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    time_scale: float = 1.0,
+    nearest_tiprack: bool = True,
+) -> dict:
+    builder = JsonProtocolBuilder(layout, time_scale, nearest_tiprack)
+    builder.initialize()
+    for name, args in operations:
+        getattr(builder, name)(*args)
+    return builder.protocol("Generated Hospital Simulation")
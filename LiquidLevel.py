@@ -0,0 +1,68 @@
+import argparse
+import math
+
+from TravelCost import load_labware_definition
+
+
+FALCON_RACK_LOAD_NAME = "3dprinted_6_tuberack_50000ul"
+# Height of the conical tip of a 50 mL falcon tube, below its straight wall
+FALCON_CONE_HEIGHT_MM = 21.2
+TABLE_STEP_UL = 500
+# How far below the meniscus the tip goes, enough for one full aspiration
+SUBMERGE_MM = 2.0
+# Never closer to the bottom than the Opentrons default aspirate clearance
+MIN_HEIGHT_MM = 1.0
+
+
+def falcon_geometry(load_name: str = FALCON_RACK_LOAD_NAME) -> tuple[float, float, float]:
+    # (radius, cone height, total depth) of the tubes in a falcon rack
+    well = load_labware_definition(load_name)["wells"]["A1"]
+    return well["diameter"] / 2, FALCON_CONE_HEIGHT_MM, well["depth"]
+
+
+def volume_at_height_ul(height_mm: float, geometry: tuple[float, float, float]) -> float:
+    radius, cone_height, _ = geometry
+    if height_mm <= cone_height:
+        # The cone narrows to a point, so its radius grows linearly with height
+        return math.pi * (radius * height_mm / cone_height) ** 2 * height_mm / 3
+    cone_ul = math.pi * radius**2 * cone_height / 3
+    return cone_ul + math.pi * radius**2 * (height_mm - cone_height)
+
+
+def height_at_volume_mm(volume_ul: float, geometry: tuple[float, float, float]) -> float:
+    radius, cone_height, depth = geometry
+    cone_ul = math.pi * radius**2 * cone_height / 3
+    if volume_ul <= cone_ul:
+        return (3 * max(volume_ul, 0) * cone_height**2 / (math.pi * radius**2)) ** (1 / 3)
+    return min(cone_height + (volume_ul - cone_ul) / (math.pi * radius**2), depth)
+
+
+def level_table(
+    max_volume_ul: float = 50000,
+    step_ul: float = TABLE_STEP_UL,
+    geometry: tuple[float, float, float] | None = None,
+) -> list[list[float]]:
+    # [volume, aspiration height above the tube bottom] pairs for the templates
+    geometry = geometry or falcon_geometry()
+    return [
+        [
+            volume_ul,
+            round(max(height_at_volume_mm(volume_ul, geometry) - SUBMERGE_MM, MIN_HEIGHT_MM), 1),
+        ]
+        for volume_ul in range(0, int(max_volume_ul) + 1, int(step_ul))
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the aspiration height for each falcon tube volume"
+    )
+    parser.add_argument("--step-ul", type=float, default=TABLE_STEP_UL)
+    args = parser.parse_args()
+
+    geometry = falcon_geometry()
+    for volume_ul, aspiration_mm in level_table(step_ul=args.step_ul, geometry=geometry):
+        print(
+            f"{volume_ul / 1000:5.1f} mL: meniscus {height_at_volume_mm(volume_ul, geometry):5.1f} mm, "
+            f"aspirate at {aspiration_mm:5.1f} mm from the bottom"
+        )
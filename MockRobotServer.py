@@ -0,0 +1,272 @@
+import argparse
+import email
+import email.policy
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+
+ROBOT_SERVER_PORT = 31950
+# Statuses a run can still change from, so no new run may be created
+ACTIVE_RUN_STATUSES = {"idle", "running", "paused"}
+DEFAULT_PAGE_LENGTH = 20
+
+
+class MockRobot:
+    # In-memory stand-in for the parts of an OT-2 robot server RobotFleet.py
+    # and RunHarvester.py use. Runs play back replay_commands over run_secs.
+    def __init__(
+        self,
+        analysis_secs: float = 0.5,
+        run_secs: float = 5.0,
+        replay_commands: list[dict] | None = None,
+    ):
+        self.analysis_secs = analysis_secs
+        self.run_secs = run_secs
+        self.replay_commands = replay_commands or []
+        self.protocols = {}
+        self.runs = {}
+        self.current_run_id = None
+        self.lock = threading.Lock()
+
+    def add_protocol(self, files: dict[str, bytes]) -> dict:
+        protocol_id = str(uuid.uuid4())
+        analysis_id = str(uuid.uuid4())
+        # Labware definitions ride along as JSON files, JSON protocols name a command schema
+        main_files = [
+            name for name, content in files.items()
+            if name.endswith(".py") or b"commandSchemaId" in content
+        ]
+        errors = []
+        if len(main_files) != 1:
+            errors.append({"detail": f"expected one protocol file, got {len(main_files)}"})
+        elif main_files[0].endswith(".py") and b"def run(" not in files[main_files[0]]:
+            errors.append({"detail": f"{main_files[0]} has no run function"})
+        protocol = {
+            "id": protocol_id,
+            "createdAt": time.time(),
+            "files": [{"name": name, "role": "main" if name in main_files else "labware"} for name in files],
+            "protocolType": "json" if main_files and main_files[0].endswith(".json") else "python",
+            "analysis_id": analysis_id,
+            "analysis_errors": errors,
+        }
+        with self.lock:
+            self.protocols[protocol_id] = protocol
+        return self.protocol_data(protocol)
+
+    def analysis(self, protocol: dict) -> dict:
+        if time.time() - protocol["createdAt"] < self.analysis_secs:
+            return {"id": protocol["analysis_id"], "status": "pending"}
+        return {
+            "id": protocol["analysis_id"],
+            "status": "completed",
+            "result": "not-ok" if protocol["analysis_errors"] else "ok",
+            "errors": protocol["analysis_errors"],
+        }
+
+    def protocol_data(self, protocol: dict) -> dict:
+        analysis = self.analysis(protocol)
+        return {
+            "id": protocol["id"],
+            "files": protocol["files"],
+            "protocolType": protocol["protocolType"],
+            "analysisSummaries": [{"id": analysis["id"], "status": analysis["status"]}],
+        }
+
+    def run_data(self, run: dict) -> dict:
+        if run["status"] == "running" and time.time() - run["startedAt"] >= self.run_secs:
+            run["status"] = "succeeded"
+        return {
+            **{key: value for key, value in run.items() if key != "startedAt"},
+            "current": run["id"] == self.current_run_id,
+        }
+
+    def run_commands(self, run: dict) -> list[dict]:
+        status = self.run_data(run)["status"]
+        if status == "idle":
+            return []
+        if status != "running":
+            return self.replay_commands
+        progress = (time.time() - run["startedAt"]) / self.run_secs
+        commands = self.replay_commands[: int(len(self.replay_commands) * progress) + 1]
+        # The command being executed has not finished yet
+        return [*commands[:-1], {**commands[-1], "status": "running", "completedAt": None}]
+
+    def create_run(self, protocol_id: str) -> tuple[int, dict]:
+        with self.lock:
+            if protocol_id not in self.protocols:
+                return 404, {"errors": [{"id": "ProtocolNotFound", "detail": protocol_id}]}
+            if self.current_run_id is not None:
+                current_run = self.run_data(self.runs[self.current_run_id])
+                if current_run["status"] in ACTIVE_RUN_STATUSES:
+                    return 409, {"errors": [{"id": "RunAlreadyActive", "detail": self.current_run_id}]}
+            run = {"id": str(uuid.uuid4()), "protocolId": protocol_id, "status": "idle", "startedAt": None}
+            self.runs[run["id"]] = run
+            self.current_run_id = run["id"]
+        return 201, {"data": self.run_data(run)}
+
+    def run_action(self, run_id: str, action_type: str) -> tuple[int, dict]:
+        with self.lock:
+            if run_id not in self.runs:
+                return 404, {"errors": [{"id": "RunNotFound", "detail": run_id}]}
+            run = self.runs[run_id]
+            if action_type != "play" or run["status"] != "idle":
+                return 409, {"errors": [{"id": "RunActionNotAllowed", "detail": action_type}]}
+            run["status"] = "running"
+            run["startedAt"] = time.time()
+        return 201, {"data": {"id": str(uuid.uuid4()), "actionType": action_type}}
+
+
+class MockRobotHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def check_version(self) -> bool:
+        # The real robot server refuses requests that do not pick an API version
+        if "Opentrons-Version" not in self.headers:
+            self.send_json(400, {"errors": [{"id": "OpentronsVersionMissing"}]})
+            return False
+        return True
+
+    def do_GET(self):
+        # Drained so the next request on the connection starts cleanly
+        self.read_body()
+        if not self.check_version():
+            return
+        robot = self.server.robot
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts == ["health"]:
+            self.send_json(200, {"name": f"mock-{self.server.server_port}", "api_version": "mock"})
+        elif len(parts) == 4 and parts[0] == "protocols" and parts[2] == "analyses":
+            protocol = robot.protocols.get(parts[1])
+            if protocol is None or parts[3] != protocol["analysis_id"]:
+                self.send_json(404, {"errors": [{"id": "AnalysisNotFound"}]})
+            else:
+                self.send_json(200, {"data": robot.analysis(protocol)})
+        elif parts == ["runs"]:
+            runs = [robot.run_data(run) for run in list(robot.runs.values())]
+            self.send_json(200, {"data": runs, "meta": {"cursor": 0, "totalLength": len(runs)}})
+        elif len(parts) == 2 and parts[0] == "runs" and parts[1] in robot.runs:
+            self.send_json(200, {"data": robot.run_data(robot.runs[parts[1]])})
+        elif len(parts) == 3 and parts[0] == "runs" and parts[1] in robot.runs and parts[2] == "commands":
+            query = parse_qs(urlsplit(self.path).query)
+            commands = robot.run_commands(robot.runs[parts[1]])
+            cursor = int(query.get("cursor", [0])[0])
+            page_length = int(query.get("pageLength", [DEFAULT_PAGE_LENGTH])[0])
+            self.send_json(
+                200,
+                {
+                    "data": commands[cursor : cursor + page_length],
+                    "meta": {"cursor": cursor, "totalLength": len(commands)},
+                },
+            )
+        else:
+            self.send_json(404, {"errors": [{"id": "NotFound", "detail": self.path}]})
+
+    def do_POST(self):
+        body = self.read_body()
+        if not self.check_version():
+            return
+        robot = self.server.robot
+        parts = self.path.strip("/").split("/")
+        if parts == ["protocols"]:
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body,
+                policy=email.policy.HTTP,
+            )
+            files = {
+                part.get_filename(): part.get_payload(decode=True)
+                for part in message.iter_parts()
+                if part.get_param("name", header="content-disposition") == "files"
+            }
+            self.send_json(201, {"data": robot.add_protocol(files)})
+        elif parts == ["runs"]:
+            self.send_json(*robot.create_run(json.loads(body)["data"]["protocolId"]))
+        elif len(parts) == 3 and parts[0] == "runs" and parts[2] == "actions":
+            self.send_json(*robot.run_action(parts[1], json.loads(body)["data"]["actionType"]))
+        else:
+            self.send_json(404, {"errors": [{"id": "NotFound", "detail": self.path}]})
+
+
+def start_mock_robots(
+    count: int,
+    analysis_secs: float = 0.5,
+    run_secs: float = 5.0,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    replay_commands: list[dict] | None = None,
+) -> list[ThreadingHTTPServer]:
+    # Serves each robot from a daemon thread; port 0 picks free ports. With
+    # replay_commands every robot starts out playing a run of them.
+    servers = []
+    for index in range(count):
+        server = ThreadingHTTPServer((host, port + index if port else 0), MockRobotHandler)
+        server.daemon_threads = True
+        server.robot = MockRobot(analysis_secs, run_secs, replay_commands)
+        if replay_commands:
+            protocol = server.robot.add_protocol({"replay.py": b"def run(protocol): pass"})
+            _, run = server.robot.create_run(protocol["id"])
+            server.robot.run_action(run["data"]["id"], "play")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def server_address(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve stand-ins for OT-2 robot servers to test RobotFleet.py and RunHarvester.py offline"
+    )
+    parser.add_argument("--robots", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=ROBOT_SERVER_PORT,
+        help="port of the first robot, the others take the ports after it",
+    )
+    parser.add_argument("--analysis-secs", type=float, default=0.5)
+    parser.add_argument("--run-secs", type=float, default=5.0)
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        help="run log whose commands every robot plays back over --run-secs, starting now",
+    )
+    args = parser.parse_args()
+
+    replay_commands = None
+    if args.replay is not None:
+        from RunLogParser import iter_run_log_commands
+
+        replay_commands = list(iter_run_log_commands(args.replay))
+    servers = start_mock_robots(
+        args.robots, args.analysis_secs, args.run_secs, args.host, args.port, replay_commands
+    )
+    print("Mock robots at " + " ".join(server_address(server) for server in servers))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
@@ -0,0 +1,250 @@
+import argparse
+import json
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from RunLogParser import iter_run_log_commands
+from ScheduleReader import ScheduleReader
+from ScheduleToScript import events_to_operations
+from TravelCost import BLEACH_WELL, MEDIA_WELL, RESERVOIR_LOAD_NAME, load_labware_definition
+
+
+COST_TABLE_PATH = Path("operation_costs.json")
+RESERVOIR_LOAD_NAMES = [RESERVOIR_LOAD_NAME, "3dprinted_6_tuberack_50000ul"]
+PERCENTILES = [50, 90, 99]
+# Time spent waiting on a timer or a person rather than moving
+WAITING_COMMAND_TYPES = ["waitForDuration", "waitForResume"]
+
+# Comments HospitalSimulation.fill_all_wells_with_media starts and ends with
+FILL_START_COMMENT = "Filling all wells with initial media..."
+FILL_END_COMMENT = "All wells filled with initial media."
+
+
+def reservoir_well_name(load_name: str, well_index: int) -> str:
+    ordering = load_labware_definition(load_name)["ordering"]
+    return [name for column in ordering for name in column][well_index]
+
+
+def command_secs(command: dict) -> float:
+    if not command.get("startedAt") or not command.get("completedAt"):
+        return 0.0
+    started = datetime.fromisoformat(command["startedAt"])
+    completed = datetime.fromisoformat(command["completedAt"])
+    return (completed - started).total_seconds()
+
+
+def span_secs(commands: list[dict]) -> float:
+    timed = [command for command in commands if command.get("startedAt")]
+    if not timed:
+        return 0.0
+    started = datetime.fromisoformat(timed[0]["startedAt"])
+    completed = datetime.fromisoformat(timed[-1].get("completedAt") or timed[-1]["startedAt"])
+    return (completed - started).total_seconds()
+
+
+def iter_operations(commands: Iterable[dict]) -> Iterator[tuple[str, list[dict]]]:
+    # Splits a run log into the HospitalSimulation operations that issued it.
+    # Every transfer and clean runs from picking up a tip to returning it.
+    reservoirs = {}
+    in_media_fill = False
+    fill_commands = []
+    tip_commands = None
+    for command in commands:
+        command_type = command.get("commandType")
+        params = command.get("params", {})
+        if command_type == "loadLabware" and params.get("loadName") in RESERVOIR_LOAD_NAMES:
+            reservoirs[command["result"]["labwareId"]] = params["loadName"]
+        elif command_type == "comment" and params.get("message") == FILL_START_COMMENT:
+            in_media_fill = True
+        elif command_type == "comment" and params.get("message") == FILL_END_COMMENT:
+            in_media_fill = False
+            yield "media_fill", fill_commands
+            fill_commands = []
+
+        if in_media_fill:
+            fill_commands.append(command)
+        elif command_type == "pickUpTip":
+            tip_commands = [command]
+        elif tip_commands is not None:
+            tip_commands.append(command)
+            if command_type == "dropTip":
+                yield classify_tip_cycle(tip_commands, reservoirs), tip_commands
+                tip_commands = None
+
+        if in_media_fill or tip_commands is not None:
+            bleach_commands = bleach_mix_commands(
+                fill_commands if in_media_fill else tip_commands, reservoirs
+            )
+            if bleach_commands is not None:
+                yield "bleach_mix", bleach_commands
+
+
+def classify_tip_cycle(commands: list[dict], reservoirs: dict[str, str]) -> str:
+    first_aspirate = next(
+        (command for command in commands if command["commandType"] == "aspirate"), None
+    )
+    if first_aspirate is not None:
+        params = first_aspirate["params"]
+        load_name = reservoirs.get(params["labwareId"])
+        if load_name and params["wellName"] == reservoir_well_name(load_name, MEDIA_WELL):
+            return "clean"
+    return "transfer"
+
+
+def bleach_mix_commands(commands: list[dict], reservoirs: dict[str, str]) -> list[dict] | None:
+    # The mix in bleach ends with a blow out, so only report it once that arrives
+    if not commands or commands[-1]["commandType"] != "blowout":
+        return None
+    mix_commands = [commands[-1]]
+    for command in reversed(commands[:-1]):
+        params = command.get("params", {})
+        load_name = reservoirs.get(params.get("labwareId"))
+        if (
+            command["commandType"] not in ("aspirate", "dispense")
+            or load_name is None
+            or params["wellName"] != reservoir_well_name(load_name, BLEACH_WELL)
+        ):
+            break
+        mix_commands.insert(0, command)
+    return mix_commands if len(mix_commands) > 1 else None
+
+
+def profile_run_logs(run_log_paths: list[Path]) -> dict:
+    samples = defaultdict(lambda: {"motion": [], "total": []})
+    for run_log_path in run_log_paths:
+        for operation, commands in iter_operations(iter_run_log_commands(run_log_path)):
+            motion_secs = sum(
+                command_secs(command)
+                for command in commands
+                if command["commandType"] not in WAITING_COMMAND_TYPES
+            )
+            samples[operation]["motion"].append(motion_secs)
+            samples[operation]["total"].append(span_secs(commands))
+
+    cost_table = {}
+    for operation, durations in samples.items():
+        cost_table[operation] = {"count": len(durations["total"])}
+        for kind, values in durations.items():
+            values = np.array(values)
+            cost_table[operation][kind] = {
+                "mean_secs": float(values.mean()),
+                "std_secs": float(values.std()),
+                **{
+                    f"p{percentile}_secs": float(np.percentile(values, percentile))
+                    for percentile in PERCENTILES
+                },
+            }
+    return cost_table
+
+
+def missing_costs(operations: list[tuple[str, tuple]], cost_table: dict, percentile: int) -> list[str]:
+    # The media fill and every kind of operation the schedule runs need a cost
+    needed = ["media_fill", *dict.fromkeys(name for name, _ in operations if name in ("transfer", "clean"))]
+    key = f"p{percentile}_secs"
+    return [name for name in needed if key not in cost_table.get(name, {}).get("total", {})]
+
+
+def new_day_report(setup_secs: float = 0.0) -> dict:
+    return {
+        "late_events": 0,
+        "worst_lateness_secs": 0.0,
+        "late_cleans": 0,
+        "worst_clean_lateness_secs": 0.0,
+        "busy_secs": setup_secs,
+        "setup_secs": setup_secs,
+    }
+
+
+def check_feasibility(events: Iterable[dict], cost_table: dict, percentile: int = 90) -> list[dict]:
+    # Replays the schedule with measured operation times to see how late it runs:
+    # events that start after their time, and cleans that finish after their
+    # shift's cleaning window. The media fill comes first, but the schedule clock only starts once it is
+    # done, so it adds to the first day without making any event late.
+    operations = events_to_operations(events)
+    missing = missing_costs(operations, cost_table, percentile)
+    if missing:
+        raise ValueError(
+            f"cost table has no p{percentile}_secs for {', '.join(missing)}; "
+            "profile run logs that include them"
+        )
+    day_reports = []
+    elapsed_secs = 0.0
+    setup_secs = cost_table["media_fill"]["total"][f"p{percentile}_secs"]
+    day = new_day_report(setup_secs)
+    for name, args in operations:
+        if name in ("sleep_seconds_after_start", "wait_for_continue"):
+            lateness_secs = elapsed_secs - args[0]
+            if lateness_secs > 0:
+                day["late_events"] += 1
+                day["worst_lateness_secs"] = max(day["worst_lateness_secs"], lateness_secs)
+            elapsed_secs = max(elapsed_secs, args[0])
+        elif name in ("transfer", "clean"):
+            operation_secs = cost_table[name]["total"][f"p{percentile}_secs"]
+            elapsed_secs += operation_secs
+            day["busy_secs"] += operation_secs
+            if name == "clean" and elapsed_secs > args[3]:
+                day["late_cleans"] += 1
+                day["worst_clean_lateness_secs"] = max(day["worst_clean_lateness_secs"], elapsed_secs - args[3])
+        elif name == "end_of_day_restock":
+            day["finished_secs"] = elapsed_secs
+            day_reports.append(day)
+            day = new_day_report()
+    # A single shift ends without a restock
+    if day["busy_secs"] > day["setup_secs"]:
+        day["finished_secs"] = elapsed_secs
+        day_reports.append(day)
+    return day_reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure HospitalSimulation operation durations from run logs"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    profile_parser = subparsers.add_parser("profile", help="write a cost table")
+    profile_parser.add_argument("run_log_paths", nargs="+", type=Path)
+    profile_parser.add_argument("--output", type=Path, default=COST_TABLE_PATH)
+
+    check_parser = subparsers.add_parser("check", help="check a schedule against a cost table")
+    check_parser.add_argument("events_json_log_path", type=Path)
+    check_parser.add_argument("--costs", type=Path, default=COST_TABLE_PATH)
+    check_parser.add_argument("--percentile", type=int, choices=PERCENTILES, default=90)
+    check_parser.add_argument("--day", type=int, help="check only this day, starting at 0")
+    check_parser.add_argument("--shift", help="check only this shift of --day")
+    args = parser.parse_args()
+
+    if args.command == "profile":
+        cost_table = profile_run_logs(args.run_log_paths)
+        args.output.write_text(json.dumps(cost_table, indent="    "))
+        for operation, costs in cost_table.items():
+            print(
+                f"{operation}: {costs['count']} samples, "
+                f"median {costs['total']['p50_secs']:.1f}s "
+                f"({costs['motion']['p50_secs']:.1f}s moving)"
+            )
+    elif args.command == "check":
+        if args.shift is not None and args.day is None:
+            parser.error("--shift needs --day")
+        reader = ScheduleReader(args.events_json_log_path)
+        events = reader if args.day is None else reader.day_events(args.day, args.shift)
+        first_day = args.day or 0
+        cost_table = json.loads(args.costs.read_text())
+        try:
+            day_reports = check_feasibility(events, cost_table, args.percentile)
+        except ValueError as error:
+            parser.error(f"{args.costs}: {error}")
+        for day_number, day in enumerate(day_reports):
+            setup = f" after a {timedelta(seconds=round(day['setup_secs']))} media fill" if day["setup_secs"] else ""
+            print(
+                f"Day {first_day + day_number + 1}: busy {timedelta(seconds=round(day['busy_secs']))}{setup}, "
+                f"finished at {timedelta(seconds=round(day['finished_secs']))}, "
+                f"{day['late_events']} late events "
+                f"(worst {timedelta(seconds=round(day['worst_lateness_secs']))}), "
+                f"{day['late_cleans']} cleans finished after their window "
+                f"(worst {timedelta(seconds=round(day['worst_clean_lateness_secs']))})"
+            )
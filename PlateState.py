@@ -0,0 +1,202 @@
+import argparse
+import json
+import time
+from collections.abc import Iterable
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+
+from ContactNetwork import PLATES, SEED_CATEGORY, SEED_WELL_NUMBER, plate_well_counts
+from ScheduleReader import ScheduleReader, file_signature
+from ScheduleToScript import get_well_plate
+from SimulationConstants import INITIAL_MEDIA_UL
+
+
+# Bump when the state arrays change so old snapshot files are rebuilt
+SNAPSHOT_VERSION = 1
+# Bacteria are counted relative to the seeded well, anything below this is clean
+DETECTABLE_FRACTION = 1e-6
+
+
+def snapshot_path(schedule_path: Path) -> Path:
+    return schedule_path.with_name(schedule_path.name + ".snapshots.npz")
+
+
+class PlateState:
+    # Per plate arrays of what every well holds, built up one event at a time.
+    # Wells start with INITIAL_MEDIA_UL of media and are well mixed, so a
+    # transfer and the return trip mix source and target, and a clean dilutes.
+    def __init__(self, arrays: dict[str, np.ndarray] | None = None, seconds_after_start: float = 0.0):
+        self.seconds_after_start = seconds_after_start
+        if arrays is None:
+            arrays = {}
+            for plate, well_count in plate_well_counts().items():
+                arrays[f"{plate}/bacteria"] = np.zeros(well_count)
+                arrays[f"{plate}/exposure_ul"] = np.zeros(well_count)
+                arrays[f"{plate}/transfers"] = np.zeros(well_count, dtype=int)
+                arrays[f"{plate}/cleans"] = np.zeros(well_count, dtype=int)
+                arrays[f"{plate}/last_touched_secs"] = np.full(well_count, np.nan)
+            arrays[f"{get_well_plate(SEED_CATEGORY)}/bacteria"][SEED_WELL_NUMBER] = 1.0
+        self.arrays = arrays
+
+    def copy(self) -> "PlateState":
+        return PlateState({name: array.copy() for name, array in self.arrays.items()}, self.seconds_after_start)
+
+    def apply(self, event: dict):
+        self.seconds_after_start = event.get("seconds_after_start", self.seconds_after_start)
+        if event["type"] == "interaction":
+            info = event["interaction_info"]
+            self.transfer(
+                get_well_plate(info["source_category"]),
+                info["source_well_number"],
+                get_well_plate(info["target_category"]),
+                info["target_well_number"],
+                info["bacteria_transfer_ul"],
+            )
+        elif event["type"] == "clean_well":
+            info = event["clean_target_info"]
+            self.clean(get_well_plate(info["well_category"]), info["well_number"], info["clean_ul"])
+
+    def touch(self, plate: str, well_number: int, volume_ul: float):
+        self.arrays[f"{plate}/exposure_ul"][well_number] += volume_ul
+        self.arrays[f"{plate}/last_touched_secs"][well_number] = self.seconds_after_start
+
+    def transfer(self, source_plate: str, source_well: int, target_plate: str, target_well: int, volume_ul: float):
+        source_bacteria = self.arrays[f"{source_plate}/bacteria"]
+        target_bacteria = self.arrays[f"{target_plate}/bacteria"]
+        target_bacteria[target_well] = (
+            target_bacteria[target_well] * INITIAL_MEDIA_UL + source_bacteria[source_well] * volume_ul
+        ) / (INITIAL_MEDIA_UL + volume_ul)
+        source_bacteria[source_well] = (
+            source_bacteria[source_well] * (INITIAL_MEDIA_UL - volume_ul)
+            + target_bacteria[target_well] * volume_ul
+        ) / INITIAL_MEDIA_UL
+        for plate, well_number in [(source_plate, source_well), (target_plate, target_well)]:
+            self.arrays[f"{plate}/transfers"][well_number] += 1
+            self.touch(plate, well_number, volume_ul)
+
+    def clean(self, plate: str, well_number: int, clean_ul: float):
+        self.arrays[f"{plate}/bacteria"][well_number] *= INITIAL_MEDIA_UL / (INITIAL_MEDIA_UL + clean_ul)
+        self.arrays[f"{plate}/cleans"][well_number] += 1
+        self.touch(plate, well_number, clean_ul)
+
+    def summary(self) -> dict[str, dict]:
+        summary = {}
+        for plate in PLATES:
+            bacteria = self.arrays[f"{plate}/bacteria"]
+            summary[plate] = {
+                "contaminated_wells": int((bacteria >= DETECTABLE_FRACTION).sum()),
+                "wells": len(bacteria),
+                "max_bacteria": float(bacteria.max()),
+                "exposure_ul": float(self.arrays[f"{plate}/exposure_ul"].sum()),
+                "transfers": int(self.arrays[f"{plate}/transfers"].sum()),
+                "cleans": int(self.arrays[f"{plate}/cleans"].sum()),
+            }
+        return summary
+
+
+class PlateStateIndex:
+    # Snapshots of the plate state at the start of every slice of the schedule
+    # index (every shift and the end of every day), so the state at any time is
+    # the nearest snapshot plus the events of at most one slice.
+    def __init__(self, schedule_path: Path):
+        self.reader = ScheduleReader(schedule_path)
+        self.slices = self.reader.ensure_index()
+        self.snapshots = self.load_snapshots()
+        if self.snapshots is None:
+            self.snapshots = self.build_snapshots()
+
+    def load_snapshots(self) -> dict[str, np.ndarray] | None:
+        path = snapshot_path(self.reader.schedule_path)
+        if not path.exists():
+            return None
+        with np.load(path) as cached:
+            snapshots = dict(cached)
+        signature = file_signature(self.reader.schedule_path)
+        if snapshots["version"] != SNAPSHOT_VERSION or snapshots["signature"].tolist() != [
+            signature["size"],
+            signature["mtime_ns"],
+        ]:
+            return None
+        return snapshots
+
+    def build_snapshots(self) -> dict[str, np.ndarray]:
+        first_events = {entry["first_event"] for entry in self.slices}
+        state = PlateState()
+        taken = []
+        for event_index, event in enumerate(self.reader):
+            if event_index in first_events:
+                taken.append(state.copy())
+            state.apply(event)
+        signature = file_signature(self.reader.schedule_path)
+        snapshots = {
+            "version": np.array(SNAPSHOT_VERSION),
+            "signature": np.array([signature["size"], signature["mtime_ns"]]),
+            "secs": np.array([snapshot.seconds_after_start for snapshot in taken]),
+            **{name: np.stack([snapshot.arrays[name] for snapshot in taken]) for name in state.arrays},
+        }
+        np.savez(snapshot_path(self.reader.schedule_path), **snapshots)
+        return snapshots
+
+    def snapshot(self, slice_index: int) -> PlateState:
+        return PlateState(
+            {
+                name: self.snapshots[name][slice_index].copy()
+                for name in self.snapshots
+                if "/" in name
+            },
+            float(self.snapshots["secs"][slice_index]),
+        )
+
+    def at(self, seconds_after_start: float) -> PlateState:
+        # State after every event up to and including seconds_after_start
+        slice_index = max(int(np.searchsorted(self.snapshots["secs"], seconds_after_start, side="right")) - 1, 0)
+        state = self.snapshot(slice_index)
+        replay(state, self.reader.read_slices(self.slices[slice_index:]), seconds_after_start)
+        return state
+
+
+def replay(state: PlateState, events: Iterable[dict], until_secs: float = np.inf):
+    for event in events:
+        if event.get("seconds_after_start", state.seconds_after_start) > until_secs:
+            break
+        state.apply(event)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show what the plates hold at some time into a schedule, from snapshots next to it"
+    )
+    parser.add_argument("schedule_path", type=Path)
+    parser.add_argument("hours", type=float, nargs="+", help="hours after the start of the schedule")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the snapshots even if they are current")
+    parser.add_argument("--wells", action="store_true", help="also list every contaminated well")
+    parser.add_argument("--json", type=Path, help="also write the summaries as JSON")
+    args = parser.parse_args()
+
+    started_at = time.monotonic()
+    index = PlateStateIndex(args.schedule_path)
+    if args.rebuild:
+        index.snapshots = index.build_snapshots()
+    print(f"{len(index.snapshots['secs'])} snapshots ready in {time.monotonic() - started_at:.2f} s")
+
+    summaries = []
+    for hours in args.hours:
+        started_at = time.monotonic()
+        state = index.at(timedelta(hours=hours).total_seconds())
+        summary = state.summary()
+        summaries.append({"hours": hours, "plates": summary})
+        print(f"At {timedelta(hours=hours)} ({(time.monotonic() - started_at) * 1000:.1f} ms):")
+        for plate, plate_summary in summary.items():
+            print(
+                f"  {plate:9}  {plate_summary['contaminated_wells']:3}/{plate_summary['wells']} wells "
+                f"contaminated, max {plate_summary['max_bacteria']:.3g}, "
+                f"{plate_summary['transfers']} transfers, {plate_summary['cleans']} cleans"
+            )
+            if args.wells:
+                bacteria = state.arrays[f"{plate}/bacteria"]
+                for well_number in np.flatnonzero(bacteria >= DETECTABLE_FRACTION):
+                    print(f"    {well_number:3}  {bacteria[well_number]:.3g}")
+    if args.json is not None:
+        args.json.write_text(json.dumps(summaries, indent="    "))
@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+from RunLogParser import ROWS, WellVolumeAccumulator, iter_run_log_commands, iter_schedule_events
+from ScheduleAligner import ExecutedOperations
+from TravelCost import DEFAULT_DECK_LAYOUT
+
+
+CACHE_DIR = Path(".report_cache")
+# Bump when the derived arrays change so old cache entries are ignored
+CACHE_VERSION = 2
+CATEGORIES = ["doctor", "nurse", "patient", "equipment", "surface"]
+
+
+def file_hash(path: Path, layout: dict = DEFAULT_DECK_LAYOUT) -> str:
+    # The layout decides which plate a run log's labware is
+    digest = hashlib.sha256(f"report {CACHE_VERSION} {json.dumps(layout, sort_keys=True)}\n".encode())
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_run_log(path: Path) -> bool:
+    # Run logs are JSON objects, schedules are bare lists of events
+    with open(path) as file:
+        return file.read(4096).lstrip().startswith("{")
+
+
+def schedule_arrays(events: Iterable[dict]) -> dict[str, np.ndarray]:
+    interaction_secs = {category: [] for category in CATEGORIES}
+    transfer_ul = []
+    clean_ul = []
+    for event in events:
+        if event["type"] == "interaction":
+            info = event["interaction_info"]
+            interaction_secs[info["source_category"]].append(event["seconds_after_start"])
+            interaction_secs[info["target_category"]].append(event["seconds_after_start"])
+            transfer_ul.append(info["bacteria_transfer_ul"])
+        elif event["type"] == "clean_well":
+            clean_ul.append(event["clean_target_info"]["clean_ul"])
+    return {
+        **{
+            f"interaction_secs/{category}": np.sort(np.array(times, dtype=float))
+            for category, times in interaction_secs.items()
+        },
+        "transfer_ul": np.array(transfer_ul, dtype=float),
+        "clean_ul": np.array(clean_ul, dtype=float),
+    }
+
+
+def run_log_arrays(commands: Iterable[dict], layout: dict = DEFAULT_DECK_LAYOUT) -> dict[str, np.ndarray]:
+    accumulator = WellVolumeAccumulator()
+
+    def accumulate(commands: Iterable[dict]) -> Iterator[dict]:
+        # Well volumes are added up as the operations stream past
+        for command in commands:
+            accumulator.add(command)
+            yield command
+
+    operation_secs = {"transfer": [], "clean": []}
+    volumes_ul = {"transfer": [], "clean": []}
+    executed = ExecutedOperations(accumulate(commands), layout)
+    for operation in executed:
+        volumes_ul[operation["operation"]].append(operation["volume_ul"])
+        if operation["executed_secs"] is not None:
+            operation_secs[operation["operation"]].append(operation["executed_secs"])
+
+    arrays = {
+        "transfer_ul": np.array(volumes_ul["transfer"], dtype=float),
+        "clean_ul": np.array(volumes_ul["clean"], dtype=float),
+        "transfer_secs": np.array(operation_secs["transfer"], dtype=float),
+        "clean_secs": np.array(operation_secs["clean"], dtype=float),
+    }
+    # Only the well plates, not the reservoir or tip racks
+    for plate, (aspirated, dispensed) in accumulator.plate_volumes(executed.plates).items():
+        arrays[f"aspirated_ul/{plate}"] = aspirated
+        arrays[f"dispensed_ul/{plate}"] = dispensed
+    return arrays
+
+
+def derived_arrays(
+    path: Path, cache_dir: Path = CACHE_DIR, layout: dict = DEFAULT_DECK_LAYOUT
+) -> dict[str, np.ndarray]:
+    cache_path = cache_dir / f"{file_hash(path, layout)}.npz"
+    if cache_path.exists():
+        with np.load(cache_path) as cached:
+            return dict(cached)
+
+    if is_run_log(path):
+        arrays = run_log_arrays(iter_run_log_commands(path), layout)
+    else:
+        arrays = schedule_arrays(iter_schedule_events(path))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(cache_path, **arrays)
+    return arrays
+
+
+def plot_cumulative(ax, series: dict[str, np.ndarray], ylabel: str):
+    for label, times in series.items():
+        ax.plot(times / 60 / 60, np.arange(1, len(times) + 1), label=label)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel("Hours")
+    ax.legend(loc="upper left")
+
+
+def render_report(arrays: dict[str, np.ndarray], output_dir: Path, title: str) -> list[Path]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    figure_paths = []
+
+    def save(fig, name: str):
+        path = output_dir / f"{name}.png"
+        fig.savefig(path)
+        plt.close(fig)
+        figure_paths.append(path)
+
+    interaction_secs = {
+        name.split("/", 1)[1]: times
+        for name, times in arrays.items()
+        if name.startswith("interaction_secs/")
+    }
+    if interaction_secs:
+        fig, ax = plt.subplots()
+        plot_cumulative(ax, interaction_secs, "Cumulative Interactions")
+        ax.set_title(f"Cumulative Interactions per Category Over Time\n{title}")
+        save(fig, "interactions_over_time")
+    if "transfer_secs" in arrays:
+        fig, ax = plt.subplots()
+        plot_cumulative(
+            ax,
+            {"transfer": arrays["transfer_secs"], "clean": arrays["clean_secs"]},
+            "Cumulative Operations",
+        )
+        ax.set_title(f"Operations Run Over Time\n{title}")
+        save(fig, "operations_over_time")
+
+    for name, label in [("transfer_ul", "Interactions"), ("clean_ul", "Cleans")]:
+        fig, ax = plt.subplots()
+        ax.hist(arrays[name], bins=20)
+        ax.set_title(f"{label} histogram\n{title}")
+        ax.set_xlabel("Volume (µL)")
+        save(fig, f"{name}_histogram")
+
+    for name, dispensed in arrays.items():
+        if not name.startswith("dispensed_ul/"):
+            continue
+        plate = name.split("/", 1)[1]
+        rows, cols = dispensed.shape
+        fig, ax = plt.subplots(figsize=(10, 8))
+        image = ax.imshow(dispensed, cmap="viridis", interpolation="nearest")
+        fig.colorbar(image, ax=ax, label="Volume (µL)")
+        ax.set_xticks(ticks=np.arange(cols), labels=range(1, cols + 1))
+        ax.set_yticks(ticks=np.arange(rows), labels=ROWS[:rows])
+        ax.set_xlabel("Column")
+        ax.set_ylabel("Row")
+        ax.set_title(f"Well Plate Volume Distribution\n{plate}")
+        safe_name = "".join(c if c.isalnum() else "_" for c in plate).strip("_")
+        save(fig, f"plate_volumes_{safe_name}")
+    return figure_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render every figure for a schedule or run log to image files"
+    )
+    parser.add_argument("path", type=Path, help="schedule or run log JSON")
+    parser.add_argument("--output-dir", type=Path, help="defaults to <path stem>_report")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--layout", type=Path, help="deck layout JSON a run log's script was compiled with")
+    args = parser.parse_args()
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    output_dir = args.output_dir or args.path.with_name(f"{args.path.stem}_report")
+    arrays = derived_arrays(args.path, args.cache_dir, layout)
+    for figure_path in render_report(arrays, output_dir, args.path.name):
+        print(f"Wrote {figure_path}")
@@ -0,0 +1,247 @@
+import argparse
+import http.client
+import json
+import queue
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from MockRobotServer import ROBOT_SERVER_PORT
+
+
+OPENTRONS_VERSION = "3"
+POLL_SECS = 1.0
+ANALYSIS_TIMEOUT_SECS = 600
+REQUEST_TIMEOUT_SECS = 60
+
+
+class RobotApiError(Exception):
+    def __init__(self, status: int, body: dict):
+        errors = body.get("errors") or [{}]
+        super().__init__(f"HTTP {status}: {errors[0].get('id', '')} {errors[0].get('detail', '')}".strip())
+        self.status = status
+        self.body = body
+
+
+def multipart_body(files: list[Path]) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = b""
+    for path in files:
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{path.name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        body += path.read_bytes() + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class RobotClient:
+    # Talks to one robot server, reusing keep-alive connections across threads
+    def __init__(self, address: str, pool_size: int = 4, timeout: float = REQUEST_TIMEOUT_SECS):
+        host, _, port = address.partition(":")
+        self.address = address
+        self.host = host
+        self.port = int(port or ROBOT_SERVER_PORT)
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.connections_opened = 0
+
+    def connection(self) -> http.client.HTTPConnection:
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            self.connections_opened += 1
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def release(self, connection: http.client.HTTPConnection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method: str, path: str, body: bytes | None = None, content_type: str = "application/json") -> dict:
+        headers = {"Opentrons-Version": OPENTRONS_VERSION}
+        if body is not None:
+            headers["Content-Type"] = content_type
+        connection = self.connection()
+        try:
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle pooled connection, so retry on a new one
+                connection.close()
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            payload = response.read()
+        except Exception:
+            connection.close()
+            raise
+        self.release(connection)
+        result = json.loads(payload) if payload else {}
+        if response.status >= 400:
+            raise RobotApiError(response.status, result)
+        return result
+
+    def upload_protocol(self, files: list[Path]) -> dict:
+        body, content_type = multipart_body(files)
+        return self.request("POST", "/protocols", body, content_type)["data"]
+
+    def wait_for_analysis(self, protocol: dict, timeout_secs: float = ANALYSIS_TIMEOUT_SECS) -> dict:
+        analysis_id = protocol["analysisSummaries"][-1]["id"]
+        deadline = time.monotonic() + timeout_secs
+        while True:
+            analysis = self.request("GET", f"/protocols/{protocol['id']}/analyses/{analysis_id}")["data"]
+            if analysis["status"] == "completed":
+                return analysis
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"analysis of {protocol['id']} still pending after {timeout_secs:g} s")
+            time.sleep(POLL_SECS)
+
+    def start_run(self, protocol_id: str) -> dict:
+        run = self.request("POST", "/runs", json.dumps({"data": {"protocolId": protocol_id}}).encode())["data"]
+        self.request("POST", f"/runs/{run['id']}/actions", json.dumps({"data": {"actionType": "play"}}).encode())
+        return run
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+
+def submit_protocol(
+    client: RobotClient,
+    protocol_path: Path,
+    labware_paths: list[Path],
+    start: bool,
+    analysis_timeout_secs: float = ANALYSIS_TIMEOUT_SECS,
+) -> dict:
+    result = {
+        "robot": client.address,
+        "protocol": str(protocol_path),
+        "ok": False,
+        "error": None,
+        "protocol_id": None,
+        "run_id": None,
+    }
+    started_at = time.monotonic()
+    try:
+        protocol = client.upload_protocol([protocol_path, *labware_paths])
+        result["protocol_id"] = protocol["id"]
+        analysis = client.wait_for_analysis(protocol, analysis_timeout_secs)
+        if analysis["result"] != "ok":
+            errors = analysis.get("errors") or [{}]
+            result["error"] = f"analysis {analysis['result']}: {errors[0].get('detail', '')}".strip()
+        else:
+            if start:
+                result["run_id"] = client.start_run(protocol["id"])["id"]
+            result["ok"] = True
+    except (OSError, RobotApiError, TimeoutError) as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+    result["secs"] = time.monotonic() - started_at
+    return result
+
+
+def assign_protocols(protocol_paths: list[Path], robots: list[str], every_robot: bool) -> list[tuple[str, Path]]:
+    if every_robot:
+        return [(robot, path) for path in protocol_paths for robot in robots]
+    return [(robots[index % len(robots)], path) for index, path in enumerate(protocol_paths)]
+
+
+def submit_fleet(
+    assignments: list[tuple[str, Path]],
+    labware_paths: list[Path] | None = None,
+    start: bool = False,
+    jobs: int = 16,
+    analysis_timeout_secs: float = ANALYSIS_TIMEOUT_SECS,
+) -> list[dict]:
+    clients = {robot: RobotClient(robot) for robot, _ in assignments}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                submit_protocol, clients[robot], path, labware_paths or [], start, analysis_timeout_secs
+            )
+            for robot, path in assignments
+        ]
+        results = [future.result() for future in futures]
+    for client in clients.values():
+        client.close()
+    return results
+
+
+def summarize(results: list[dict], elapsed_secs: float) -> str:
+    failures = [result for result in results if not result["ok"]]
+    robot_count = len({result["robot"] for result in results})
+    lines = [
+        f"{len(results) - len(failures)}/{len(results)} protocols accepted by {robot_count} robots "
+        f"in {elapsed_secs:.1f} s ({len(results) / elapsed_secs:.1f} per second)"
+    ]
+    for result in results:
+        if result["ok"]:
+            started = f", run {result['run_id']}" if result["run_id"] else ""
+            lines.append(f"  ok    {result['robot']} {result['protocol']}: {result['secs']:.1f} s{started}")
+        else:
+            lines.append(f"  FAIL  {result['robot']} {result['protocol']}: {result['error']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Upload generated protocols to OT-2 robots, wait for analysis and start runs"
+    )
+    parser.add_argument("protocol_paths", nargs="+", type=Path)
+    parser.add_argument(
+        "--robot",
+        action="append",
+        default=[],
+        help=f"robot address as host or host:port (port {ROBOT_SERVER_PORT} by default), repeatable",
+    )
+    parser.add_argument(
+        "--mock",
+        type=int,
+        metavar="ROBOTS",
+        help="submit to this many local MockRobotServer.py robots instead, to benchmark offline",
+    )
+    parser.add_argument("--mock-analysis-secs", type=float, default=0.5)
+    parser.add_argument(
+        "--labware",
+        type=Path,
+        nargs="*",
+        default=[],
+        help="custom labware definitions to upload with every protocol",
+    )
+    parser.add_argument(
+        "--every-robot",
+        action="store_true",
+        help="send each protocol to every robot rather than spreading them over the fleet",
+    )
+    parser.add_argument("--start", action="store_true", help="start a run once analysis passes")
+    parser.add_argument("--jobs", type=int, default=16, help="submissions to run at once")
+    parser.add_argument("--analysis-timeout", type=float, default=ANALYSIS_TIMEOUT_SECS)
+    parser.add_argument("--json", type=Path, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    robots = args.robot
+    if args.mock is not None:
+        from MockRobotServer import server_address, start_mock_robots
+
+        robots = [
+            server_address(server)
+            for server in start_mock_robots(args.mock, analysis_secs=args.mock_analysis_secs)
+        ]
+    if not robots:
+        parser.error("give at least one --robot, or --mock")
+
+    assignments = assign_protocols(args.protocol_paths, robots, args.every_robot)
+    if args.start and len({robot for robot, _ in assignments}) < len(assignments):
+        parser.error("--start can only run one protocol per robot")
+
+    started_at = time.monotonic()
+    results = submit_fleet(assignments, args.labware, args.start, args.jobs, args.analysis_timeout)
+    elapsed_secs = time.monotonic() - started_at
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent="    "))
+    print(summarize(results, elapsed_secs))
+    exit(0 if all(result["ok"] for result in results) else 1)
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from pathlib import Path
+from urllib.parse import urlencode
+
+from MockRobotServer import ROBOT_SERVER_PORT
+from RobotFleet import OPENTRONS_VERSION, REQUEST_TIMEOUT_SECS, RobotApiError
+from RunStore import STORE_PATH, RunStore
+
+
+PAGE_LENGTH = 1000
+POLL_SECS = 30.0
+# A command never changes again once it reaches one of these, nor does a run
+FINAL_COMMAND_STATUSES = {"succeeded", "failed"}
+FINAL_RUN_STATUSES = {"succeeded", "failed", "stopped"}
+
+
+class AsyncRobotClient:
+    # One keep-alive connection per robot, used by one request at a time
+    def __init__(self, address: str, timeout: float = REQUEST_TIMEOUT_SECS):
+        host, _, port = address.partition(":")
+        self.address = address
+        self.host = host
+        self.port = int(port or ROBOT_SERVER_PORT)
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def get(self, path: str) -> dict:
+        async with self.lock:
+            for attempt in range(2):
+                if self.writer is None:
+                    self.reader, self.writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout
+                    )
+                try:
+                    return await asyncio.wait_for(self.exchange(path), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # The robot dropped the idle connection, so retry once on a new one
+                    await self.close()
+                    if attempt:
+                        raise
+
+    async def exchange(self, path: str) -> dict:
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Opentrons-Version: {OPENTRONS_VERSION}\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError(f"{self.address} closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        result = json.loads(body) if body else {}
+        if status >= 400:
+            raise RobotApiError(status, result)
+        return result
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def settled_commands(commands: list[dict]) -> list[dict]:
+    # Stops at the first command still queued or running, so the cursor only
+    # ever moves past commands that will not change
+    for index, command in enumerate(commands):
+        if command.get("status") not in FINAL_COMMAND_STATUSES:
+            return commands[:index]
+    return commands
+
+
+async def fetch_commands(
+    client: AsyncRobotClient, run_id: str, cursor: int, page_length: int = PAGE_LENGTH
+) -> list[dict]:
+    commands = []
+    while True:
+        query = urlencode({"cursor": cursor + len(commands), "pageLength": page_length})
+        page = await client.get(f"/runs/{run_id}/commands?{query}")
+        commands.extend(page["data"])
+        if not page["data"] or cursor + len(commands) >= page["meta"]["totalLength"]:
+            return commands
+
+
+async def harvest_robot(client: AsyncRobotClient, store: RunStore, page_length: int = PAGE_LENGTH) -> dict:
+    stored_runs = store.robot_runs(client.address)
+    runs = (await client.get("/runs"))["data"]
+    result = {"robot": client.address, "runs": len(runs), "active_runs": 0, "new_commands": 0, "error": None}
+    for run in runs:
+        stored = stored_runs.get(run["id"])
+        if stored is not None and stored["status"] in FINAL_RUN_STATUSES:
+            # Harvested after it finished, so nothing new can come
+            continue
+        if run["status"] not in FINAL_RUN_STATUSES:
+            result["active_runs"] += 1
+        cursor = 0 if stored is None else stored["command_cursor"]
+        commands = settled_commands(await fetch_commands(client, run["id"], cursor, page_length))
+        # SQLite writes are quick next to the network, so they stay on the event loop
+        store.add_run_commands(client.address, run, cursor, commands)
+        result["new_commands"] += len(commands)
+    return result
+
+
+async def harvest_rounds(
+    robots: list[str],
+    store: RunStore,
+    page_length: int = PAGE_LENGTH,
+    poll_secs: float = POLL_SECS,
+) -> AsyncIterator[tuple[list[dict], float]]:
+    # Polls every robot at once each round, forever, yielding what each round
+    # found and how long it took
+    clients = [AsyncRobotClient(robot) for robot in robots]
+    try:
+        while True:
+            started_at = time.monotonic()
+            outcomes = await asyncio.gather(
+                *(harvest_robot(client, store, page_length) for client in clients),
+                return_exceptions=True,
+            )
+            results = []
+            for client, outcome in zip(clients, outcomes):
+                if isinstance(outcome, Exception):
+                    await client.close()
+                    outcome = {
+                        "robot": client.address,
+                        "runs": 0,
+                        "active_runs": 0,
+                        "new_commands": 0,
+                        "error": f"{type(outcome).__name__}: {outcome}",
+                    }
+                results.append(outcome)
+            round_secs = time.monotonic() - started_at
+            yield results, round_secs
+            await asyncio.sleep(max(poll_secs - round_secs, 0))
+    finally:
+        for client in clients:
+            await client.close()
+
+
+def summarize_round(round_index: int, results: list[dict], elapsed_secs: float) -> str:
+    failures = [result for result in results if result["error"]]
+    lines = [
+        f"Round {round_index}: {sum(result['new_commands'] for result in results)} new commands "
+        f"from {len(results) - len(failures)}/{len(results)} robots, "
+        f"{sum(result['active_runs'] for result in results)} runs active ({elapsed_secs:.1f} s)"
+    ]
+    for result in failures:
+        lines.append(f"  FAIL  {result['robot']}: {result['error']}")
+    return "\n".join(lines)
+
+
+async def main(args: argparse.Namespace, robots: list[str]):
+    store = RunStore(args.store)
+    round_index = 0
+    rounds = harvest_rounds(robots, store, args.page_length, args.interval)
+    try:
+        async for results, round_secs in rounds:
+            round_index += 1
+            print(summarize_round(round_index, results, round_secs))
+            if args.once:
+                break
+            if args.until_done and not any(result["active_runs"] or result["error"] for result in results):
+                break
+    finally:
+        await rounds.aclose()
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep a RunStore in sync with the run logs of a fleet of OT-2 robots"
+    )
+    parser.add_argument(
+        "robots",
+        nargs="*",
+        help=f"robot addresses as host or host:port (port {ROBOT_SERVER_PORT} by default)",
+    )
+    parser.add_argument("--store", type=Path, default=STORE_PATH)
+    parser.add_argument("--page-length", type=int, default=PAGE_LENGTH)
+    parser.add_argument("--interval", type=float, default=POLL_SECS, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    parser.add_argument(
+        "--until-done", action="store_true", help="exit once no robot has a run in progress"
+    )
+    parser.add_argument(
+        "--mock",
+        type=int,
+        metavar="ROBOTS",
+        help="harvest from this many local MockRobotServer.py robots replaying --replay",
+    )
+    parser.add_argument("--replay", type=Path, help="run log the mock robots play back")
+    parser.add_argument("--mock-run-secs", type=float, default=60.0)
+    args = parser.parse_args()
+
+    robots = args.robots
+    if args.mock is not None:
+        from MockRobotServer import server_address, start_mock_robots
+        from RunLogParser import iter_run_log_commands
+
+        if args.replay is None:
+            parser.error("--mock needs a --replay run log")
+        replay_commands = list(iter_run_log_commands(args.replay))
+        servers = start_mock_robots(args.mock, run_secs=args.mock_run_secs, replay_commands=replay_commands)
+        robots = [server_address(server) for server in servers]
+    if not robots:
+        parser.error("give at least one robot, or --mock")
+
+    try:
+        asyncio.run(main(args, robots))
+    except KeyboardInterrupt:
+        pass
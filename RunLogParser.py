@@ -0,0 +1,181 @@
+import json
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+
+
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 1 << 16
+ROWS = "ABCDEFGHIJKLMNOP"
+
+# Exported run logs keep the commands under "commands", the robot HTTP API
+# under "data" (and the sample in Data_Visualization.py under both)
+COMMAND_ARRAY_START = re.compile(r'"(?:commands|data)"\s*:\s*\[')
+# Schedules written by GenerateSchedule.py are a bare list of events
+EVENT_ARRAY_START = re.compile(r"^\s*\[")
+WELL_NAME = re.compile(r"^([A-Z])(\d+)$")
+
+
+def iter_run_log_commands(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    return iter_json_array(path, COMMAND_ARRAY_START, chunk_size)
+
+
+def iter_schedule_events(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    return iter_json_array(path, EVENT_ARRAY_START, chunk_size)
+
+
+def iter_json_array(
+    path: Path, array_start_pattern: re.Pattern, chunk_size: int = CHUNK_SIZE
+) -> Iterator[dict]:
+    for _, _, item in iter_json_array_spans(path, array_start_pattern, chunk_size):
+        yield item
+
+
+def iter_json_array_spans(
+    path: Path,
+    array_start_pattern: re.Pattern,
+    chunk_size: int = CHUNK_SIZE,
+    encoding: str | None = None,
+) -> Iterator[tuple[int, int, dict]]:
+    # Decodes one item at a time so the whole file never sits in memory, along
+    # with where in the file each item starts and ends. The offsets count
+    # characters, which are bytes with encoding="latin-1".
+    decoder = json.JSONDecoder()
+    with open(path, encoding=encoding, newline="") as json_file:
+        buffer = ""
+        buffer_offset = 0
+        array_start = None
+        while array_start is None:
+            chunk = json_file.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"{path} has no list to read")
+            buffer += chunk
+            array_start = array_start_pattern.search(buffer)
+
+        position = array_start.end()
+        end_of_file = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("out of data", buffer, position)
+                start = position
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item runs past the end of the buffer, read some more
+                if end_of_file:
+                    raise ValueError(f"{path} ends in the middle of an item")
+                chunk = json_file.read(chunk_size)
+                end_of_file = not chunk
+                buffer_offset += position
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield buffer_offset + start, buffer_offset + position, item
+
+
+def labware_label(command: dict, module_slots: dict[str, str]) -> str:
+    params = command["params"]
+    location = params.get("location", {})
+    if isinstance(location, dict):
+        slot = location.get("slotName") or module_slots.get(location.get("moduleId"))
+    else:
+        slot = location
+    name = params.get("displayName") or params.get("loadName", "labware")
+    return f"{name} (slot {slot})" if slot else name
+
+
+class WellVolumeAccumulator:
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        # Every (labwareId, wellName) seen gets the next dense index
+        self.well_indices: dict[tuple[str, str], int] = {}
+        self.well_keys: list[tuple[str, str]] = []
+        self.labware_labels: dict[str, str] = {}
+        self.module_slots: dict[str, str] = {}
+        self.aspirated_ul = np.zeros(0)
+        self.dispensed_ul = np.zeros(0)
+        self.batch_wells: list[int] = []
+        self.batch_volumes: list[float] = []
+        self.batch_is_dispense: list[bool] = []
+
+    def add(self, command: dict):
+        command_type = command.get("commandType")
+        if command_type == "loadModule" and "result" in command:
+            self.module_slots[command["result"]["moduleId"]] = command["params"][
+                "location"
+            ]["slotName"]
+        elif command_type == "loadLabware" and "result" in command:
+            self.labware_labels[command["result"]["labwareId"]] = labware_label(
+                command, self.module_slots
+            )
+        elif command_type in ("aspirate", "dispense"):
+            params = command["params"]
+            key = (params["labwareId"], params["wellName"])
+            well_index = self.well_indices.get(key)
+            if well_index is None:
+                well_index = self.well_indices[key] = len(self.well_keys)
+                self.well_keys.append(key)
+            self.batch_wells.append(well_index)
+            self.batch_volumes.append(params["volume"])
+            self.batch_is_dispense.append(command_type == "dispense")
+            if len(self.batch_wells) >= self.batch_size:
+                self.flush()
+
+    def add_all(self, commands: Iterable[dict]) -> "WellVolumeAccumulator":
+        for command in commands:
+            self.add(command)
+        self.flush()
+        return self
+
+    def flush(self):
+        if not self.batch_wells:
+            return
+        wells = np.array(self.batch_wells)
+        volumes = np.array(self.batch_volumes, dtype=float)
+        is_dispense = np.array(self.batch_is_dispense)
+        well_count = len(self.well_keys)
+        self.aspirated_ul = np.pad(self.aspirated_ul, (0, well_count - len(self.aspirated_ul)))
+        self.dispensed_ul = np.pad(self.dispensed_ul, (0, well_count - len(self.dispensed_ul)))
+        self.aspirated_ul += np.bincount(
+            wells[~is_dispense], weights=volumes[~is_dispense], minlength=well_count
+        )
+        self.dispensed_ul += np.bincount(
+            wells[is_dispense], weights=volumes[is_dispense], minlength=well_count
+        )
+        self.batch_wells = []
+        self.batch_volumes = []
+        self.batch_is_dispense = []
+
+    def plate_volumes(self, labware_names: dict[str, str] | None = None) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        # Aspirated and dispensed volume grids per labware, laid out like the
+        # plate; with labware_names only for those labware, under those names
+        self.flush()
+        positions = [WELL_NAME.match(well_name) for _, well_name in self.well_keys]
+        rows = np.array([ROWS.index(position.group(1)) for position in positions], dtype=int)
+        columns = np.array([int(position.group(2)) - 1 for position in positions], dtype=int)
+        labware_ids = np.array([labware_id for labware_id, _ in self.well_keys])
+
+        plates = {}
+        for labware_id in dict.fromkeys(labware_ids.tolist()):
+            if labware_names is not None and labware_id not in labware_names:
+                continue
+            on_plate = labware_ids == labware_id
+            shape = (max(8, rows[on_plate].max() + 1), max(12, columns[on_plate].max() + 1))
+            aspirated = np.zeros(shape)
+            dispensed = np.zeros(shape)
+            np.add.at(aspirated, (rows[on_plate], columns[on_plate]), self.aspirated_ul[on_plate])
+            np.add.at(dispensed, (rows[on_plate], columns[on_plate]), self.dispensed_ul[on_plate])
+            name = (labware_names or self.labware_labels).get(labware_id, labware_id)
+            plates[name] = (aspirated, dispensed)
+        return plates
+
+
+def parse_run_log(path: Path) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    return WellVolumeAccumulator().add_all(iter_run_log_commands(path)).plate_volumes()
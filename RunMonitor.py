@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import re
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from OperationProfiler import (
+    FILL_END_COMMENT,
+    RESERVOIR_LOAD_NAMES,
+    classify_tip_cycle,
+    reservoir_well_name,
+)
+from RunHarvester import POLL_SECS, AsyncRobotClient, fetch_commands, settled_commands
+from RunLogParser import iter_run_log_commands
+from ScheduleReader import ScheduleReader
+from ScheduleAligner import LOOKAHEAD, format_secs, planned_operations, same_operation, well_number
+from SimulationConstants import MEDIA_TUBE_UL
+from TravelCost import DEFAULT_DECK_LAYOUT, MEDIA_WELL, TIPRACK_LOAD_NAME, load_labware_definition
+
+
+REFRESH_SECS = 2.0
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+# HospitalSimulation pauses with this once the media tube runs dry, and the
+# operator resumes with a full tube
+MEDIA_REFILL_PAUSE_MESSAGE = "No liquid in media reservoir. Please refill."
+# HospitalSimulation.load_checkpoint comments with this on a --resume run,
+# which skips the media fill and keeps the original run's clock
+RESUME_COMMENT = re.compile(r"Resuming after event \d+ of the run started .* \(start epoch ([\d.]+)\)")
+
+
+class RunMonitor:
+    # Follows a run one command at a time against its schedule. Everything
+    # about the schedule is worked out up front, so each update does a bounded
+    # amount of work however long the run gets.
+    def __init__(
+        self,
+        events: list[dict],
+        layout: dict = DEFAULT_DECK_LAYOUT,
+        time_scale: float = 1.0,
+        first_day: int = 0,
+    ):
+        self.time_scale = time_scale
+        self.planned = list(planned_operations(events, first_day))
+        restock_indices = [index for index, event in enumerate(events) if event["type"] == "end_of_day_restock"]
+        # (event index, planned seconds the pause comes at, seconds it resumes at)
+        waits = []
+        seconds_after_start = 0.0
+        for event_index, event in enumerate(events):
+            seconds_after_start = event.get("seconds_after_start", seconds_after_start)
+            if event["type"] == "wait_for_continue":
+                waits.append((event_index, seconds_after_start, event["resume_at"]))
+
+        # For each planned operation, the restocks before it and the first pause after it
+        self.restocks_before = []
+        self.next_wait = []
+        restock_position = 0
+        wait_position = 0
+        for operation in self.planned:
+            while restock_position < len(restock_indices) and restock_indices[restock_position] < operation["event_index"]:
+                restock_position += 1
+            while wait_position < len(waits) and waits[wait_position][0] < operation["event_index"]:
+                wait_position += 1
+            self.restocks_before.append(restock_position)
+            self.next_wait.append(waits[wait_position] if wait_position < len(waits) else None)
+
+        self.plates_by_slot = {
+            layout[plate]: plate for plate in ["patient", "staff", "equipment", "surface"]
+        }
+        self.module_slots = {}
+        self.plates = {}
+        self.reservoirs = {}
+        self.media_wells = set()
+        self.tip_capacity = 0
+        self.media_filled = False
+        self.schedule_start = None
+        self.resumed = False
+        self.tip_cycle = None
+
+        self.position = 0
+        self.restocks = 0
+        self.tips_used = 0
+        self.media_used_ul = 0.0
+        self.matched = 0
+        self.missing = 0
+        self.extra = 0
+        self.drift_secs = None
+        self.worst_lateness_secs = None
+        self.last_command = None
+
+    def update(self, command: dict):
+        command_type = command.get("commandType")
+        params = command.get("params", {})
+        self.last_command = command
+        if command_type == "loadModule":
+            self.module_slots[command["result"]["moduleId"]] = params["location"]["slotName"]
+        elif command_type == "loadLabware":
+            location = params["location"]
+            slot = location.get("slotName") or self.module_slots.get(location.get("moduleId"))
+            labware_id = command["result"]["labwareId"]
+            if slot in self.plates_by_slot:
+                self.plates[labware_id] = self.plates_by_slot[slot]
+            elif params["loadName"] in RESERVOIR_LOAD_NAMES:
+                self.media_wells.add((labware_id, reservoir_well_name(params["loadName"], MEDIA_WELL)))
+                self.reservoirs[labware_id] = params["loadName"]
+            elif params["loadName"] == TIPRACK_LOAD_NAME:
+                self.tip_capacity += len(load_labware_definition(TIPRACK_LOAD_NAME)["wells"])
+        elif command_type == "comment" and params.get("message") == FILL_END_COMMENT:
+            self.media_filled = True
+        elif command_type == "comment" and (resume := RESUME_COMMENT.fullmatch(params.get("message", ""))):
+            self.schedule_start = datetime.fromtimestamp(float(resume.group(1)), timezone.utc)
+            self.resumed = True
+        elif command_type == "waitForResume" and params.get("message") == MEDIA_REFILL_PAUSE_MESSAGE:
+            self.media_used_ul = 0.0
+        elif command_type == "waitForResume" and self.media_filled:
+            if self.schedule_start is None:
+                # HospitalSimulation starts its clock once the bacteria are added
+                self.schedule_start = datetime.fromisoformat(command["completedAt"])
+        elif command_type == "pickUpTip":
+            self.tips_used += 1
+            if self.schedule_start is not None:
+                self.tip_cycle = []
+        elif command_type == "aspirate" and (params.get("labwareId"), params.get("wellName")) in self.media_wells:
+            self.media_used_ul += params["volume"]
+
+        if self.tip_cycle is not None:
+            self.tip_cycle.append(command)
+            if command_type == "dropTip":
+                self.finish_operation(self.tip_cycle)
+                self.tip_cycle = None
+
+    def executed_operation(self, commands: list[dict]) -> dict:
+        operation = classify_tip_cycle(commands, self.reservoirs)
+        plate_commands = [
+            command for command in commands
+            if command["commandType"] in ("aspirate", "dispense")
+            and command["params"].get("labwareId") in self.plates
+        ]
+        if operation == "transfer":
+            well_commands = plate_commands[:2]
+        else:
+            well_commands = [command for command in plate_commands if command["commandType"] == "dispense"][:1]
+        return {
+            "operation": operation,
+            "wells": tuple(
+                (self.plates[command["params"]["labwareId"]], well_number(command["params"]["wellName"]))
+                for command in well_commands
+            ),
+            "volume_ul": well_commands[0]["params"]["volume"] if well_commands else 0.0,
+            "executed_secs": (
+                datetime.fromisoformat(commands[0]["startedAt"]) - self.schedule_start
+            ).total_seconds() / self.time_scale,
+            "tips": sum(command["commandType"] == "pickUpTip" for command in commands),
+            "media_ul": sum(
+                command["params"]["volume"] for command in commands
+                if command["commandType"] == "aspirate"
+                and (command["params"].get("labwareId"), command["params"].get("wellName")) in self.media_wells
+            ),
+        }
+
+    def resume_position(self, executed: dict) -> int | None:
+        # A resumed run picks up partway through the plan, at the matching
+        # operation planned closest to when this one ran
+        matches = [
+            index
+            for index in range(self.position, len(self.planned))
+            if same_operation(self.planned[index], executed)
+        ]
+        return min(
+            matches,
+            key=lambda index: abs(self.planned[index]["planned_secs"] - executed["executed_secs"]),
+            default=None,
+        )
+
+    def finish_operation(self, commands: list[dict]):
+        executed = self.executed_operation(commands)
+        if self.resumed:
+            # The operations before it ran before the resume, not missing
+            self.resumed = False
+            position = self.resume_position(executed)
+            if position is not None:
+                self.position = position
+                self.restocks = self.restocks_before[position]
+        for skip in range(min(LOOKAHEAD, len(self.planned) - self.position)):
+            planned = self.planned[self.position + skip]
+            if same_operation(planned, executed):
+                break
+        else:
+            self.extra += 1
+            return
+
+        self.missing += skip
+        self.matched += 1
+        self.position += skip + 1
+        if self.restocks_before[self.position - 1] > self.restocks:
+            # The tips and media were topped up before this operation started
+            self.restocks = self.restocks_before[self.position - 1]
+            self.tips_used = executed["tips"]
+            self.media_used_ul = executed["media_ul"]
+        self.drift_secs = executed["executed_secs"] - planned["planned_secs"]
+        if self.worst_lateness_secs is None or self.drift_secs > self.worst_lateness_secs:
+            self.worst_lateness_secs = self.drift_secs
+
+    def schedule_secs(self, now: datetime) -> float | None:
+        if self.schedule_start is None:
+            return None
+        return (now - self.schedule_start).total_seconds() / self.time_scale
+
+    def snapshot(self, now: datetime) -> dict:
+        schedule_secs = self.schedule_secs(now)
+        current = self.planned[self.position - 1] if self.position else None
+        upcoming = self.planned[self.position] if self.position < len(self.planned) else None
+
+        lateness_secs = self.drift_secs
+        if upcoming is not None and schedule_secs is not None and schedule_secs > upcoming["planned_secs"]:
+            # Still waiting on an operation that is already due
+            lateness_secs = max(lateness_secs or 0.0, schedule_secs - upcoming["planned_secs"])
+
+        next_wait = self.next_wait[self.position] if upcoming is not None else None
+        pause = None
+        if next_wait is not None and schedule_secs is not None:
+            event_index, pause_secs, resume_at = next_wait
+            projected_secs = pause_secs + max(lateness_secs or 0.0, 0.0)
+            pause = {
+                "event_index": event_index,
+                "planned_secs": pause_secs,
+                "projected_secs": projected_secs,
+                "eta_secs": (projected_secs - schedule_secs) * self.time_scale,
+                "resume_at": resume_at,
+            }
+        return {
+            "now": now.isoformat(),
+            "started": self.schedule_start is not None,
+            "schedule_secs": schedule_secs,
+            "current": current,
+            "upcoming": upcoming,
+            "done": self.position,
+            "planned": len(self.planned),
+            "matched": self.matched,
+            "missing": self.missing,
+            "extra": self.extra,
+            "lateness_secs": lateness_secs,
+            "drift_secs": self.drift_secs,
+            "worst_lateness_secs": self.worst_lateness_secs,
+            "tips_remaining": self.tip_capacity - self.tips_used,
+            "media_remaining_ul": MEDIA_TUBE_UL - self.media_used_ul,
+            "next_pause": pause,
+            "last_command": self.last_command.get("commandType") if self.last_command else None,
+        }
+
+
+def render(snapshot: dict) -> str:
+    if not snapshot["started"]:
+        return f"{snapshot['now']}  waiting for the media fill to finish (last command {snapshot['last_command']})"
+
+    def describe(operation: dict | None) -> str:
+        if operation is None:
+            return "-"
+        wells = ", ".join(f"{plate} {number}" for plate, number in operation["wells"])
+        return (
+            f"event {operation['event_index']} {operation['operation']} {wells} "
+            f"({operation['volume_ul']:.1f} µL), day {operation['day'] + 1} {operation['shift']}, "
+            f"due at {format_secs(operation['planned_secs'])}"
+        )
+
+    lines = [
+        f"{snapshot['now']}  schedule clock {format_secs(snapshot['schedule_secs'])}",
+        f"Progress    {snapshot['done']}/{snapshot['planned']} operations "
+        f"({snapshot['matched']} matched, {snapshot['missing']} missing, {snapshot['extra']} extra)",
+        f"Current     {describe(snapshot['current'])}",
+        f"Next        {describe(snapshot['upcoming'])}",
+        f"Lateness    {format_secs(snapshot['lateness_secs'])} now, "
+        f"drift {format_secs(snapshot['drift_secs'])}, worst {format_secs(snapshot['worst_lateness_secs'])}",
+        f"Tips left   {snapshot['tips_remaining']}",
+        f"Media left  {snapshot['media_remaining_ul'] / 1000:.1f} mL",
+    ]
+    pause = snapshot["next_pause"]
+    if pause is not None:
+        lines.append(
+            f"Next pause  event {pause['event_index']} at {format_secs(pause['projected_secs'])} "
+            f"(planned {format_secs(pause['planned_secs'])}), in {format_secs(pause['eta_secs'])}, "
+            f"resumes at {format_secs(pause['resume_at'])}"
+        )
+    else:
+        lines.append("Next pause  none left")
+    lines.append(f"Last        {snapshot['last_command']}")
+    return "\n".join(lines)
+
+
+async def robot_feed(
+    client: AsyncRobotClient, run_id: str | None = None, poll_secs: float = POLL_SECS
+) -> AsyncIterator[tuple[list[dict], datetime]]:
+    if run_id is None:
+        runs = (await client.get("/runs"))["data"]
+        current_runs = [run for run in runs if run.get("current")]
+        if not current_runs:
+            raise ValueError(f"{client.address} has no current run")
+        run_id = current_runs[0]["id"]
+    cursor = 0
+    while True:
+        commands = settled_commands(await fetch_commands(client, run_id, cursor))
+        cursor += len(commands)
+        yield commands, datetime.now(timezone.utc)
+        await asyncio.sleep(poll_secs)
+
+
+async def replay_feed(
+    run_log_path: Path, speedup: float, refresh_secs: float = REFRESH_SECS
+) -> AsyncIterator[tuple[list[dict], datetime]]:
+    # Plays back an exported run log on its own clock, speedup times faster
+    batch = []
+    batch_end = None
+    for command in iter_run_log_commands(run_log_path):
+        completed_at = command.get("completedAt") or command.get("startedAt")
+        if completed_at is None:
+            batch.append(command)
+            continue
+        completed_at = datetime.fromisoformat(completed_at)
+        if batch_end is None:
+            batch_end = completed_at + timedelta(seconds=refresh_secs * speedup)
+        while completed_at > batch_end:
+            yield batch, batch_end
+            batch = []
+            batch_end += timedelta(seconds=refresh_secs * speedup)
+            await asyncio.sleep(refresh_secs)
+        batch.append(command)
+    if batch_end is not None:
+        yield batch, batch_end
+
+
+async def main(args: argparse.Namespace, events: list[dict], layout: dict):
+    monitor = RunMonitor(events, layout, args.time_scale, args.day or 0)
+    client = None
+    if args.replay is not None:
+        feed = replay_feed(args.replay, args.speedup, args.refresh)
+    else:
+        client = AsyncRobotClient(args.robot)
+        feed = robot_feed(client, args.run_id, args.refresh)
+    try:
+        async for commands, now in feed:
+            for command in commands:
+                monitor.update(command)
+            snapshot = monitor.snapshot(now)
+            if args.json:
+                print(json.dumps(snapshot), flush=True)
+            elif args.plain:
+                print(render(snapshot) + "\n", flush=True)
+            else:
+                print(CLEAR_SCREEN + render(snapshot), flush=True)
+    finally:
+        if client is not None:
+            await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Follow a running schedule live, showing how far behind it is and what is left"
+    )
+    parser.add_argument("events_json_log_path", type=Path)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--robot", help="robot address as host or host:port")
+    source.add_argument("--replay", type=Path, help="play back an exported run log instead")
+    parser.add_argument("--run-id", help="run to follow, the robot's current run by default")
+    parser.add_argument("--speedup", type=float, default=60.0, help="replay this many times faster")
+    parser.add_argument("--refresh", type=float, default=REFRESH_SECS, help="seconds between updates")
+    parser.add_argument("--layout", type=Path, help="deck layout JSON the schedule was compiled with")
+    parser.add_argument(
+        "--time-scale", type=float, default=1.0, help="the --time-scale the script was compiled with"
+    )
+    parser.add_argument("--day", type=int, help="the --day the script was compiled with")
+    parser.add_argument("--shift", help="the --shift the script was compiled with")
+    view = parser.add_mutually_exclusive_group()
+    view.add_argument("--plain", action="store_true", help="print each update below the last")
+    view.add_argument("--json", action="store_true", help="print each update as a JSON line")
+    args = parser.parse_args()
+    if args.shift is not None and args.day is None:
+        parser.error("--shift needs --day")
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    reader = ScheduleReader(args.events_json_log_path)
+    events = list(reader if args.day is None else reader.day_events(args.day, args.shift))
+    try:
+        asyncio.run(main(args, events, layout))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,414 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from ScheduleReader import parameters_path
+
+
+STORE_PATH = Path("runs.sqlite")
+SECONDS_PER_DAY = timedelta(days=1).total_seconds()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL UNIQUE,
+    event_count INTEGER NOT NULL,
+    parameters TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    schedule_id INTEGER NOT NULL REFERENCES schedules(id),
+    event_index INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    seconds_after_start REAL,
+    day INTEGER NOT NULL,
+    shift TEXT,
+    volume_ul REAL
+);
+-- One row per well an event touches: interactions have a source and a target
+CREATE TABLE IF NOT EXISTS event_wells (
+    event_id INTEGER NOT NULL REFERENCES events(id),
+    schedule_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    category TEXT NOT NULL,
+    well_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scripts (
+    script_hash TEXT NOT NULL,
+    schedule_id INTEGER NOT NULL REFERENCES schedules(id),
+    layout TEXT,
+    PRIMARY KEY (script_hash, schedule_id)
+);
+CREATE TABLE IF NOT EXISTS validations (
+    script_hash TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    error TEXT,
+    command_count INTEGER,
+    command_counts TEXT,
+    estimated_duration_secs REAL
+);
+CREATE TABLE IF NOT EXISTS run_logs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL UNIQUE,
+    schedule_id INTEGER REFERENCES schedules(id),
+    command_count INTEGER NOT NULL,
+    command_counts TEXT NOT NULL,
+    started_at TEXT,
+    completed_at TEXT,
+    error_count INTEGER NOT NULL
+);
+-- Runs harvested live from robot servers, command_cursor is how many
+-- commands from the start of the run have been stored
+CREATE TABLE IF NOT EXISTS robot_runs (
+    id INTEGER PRIMARY KEY,
+    robot TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    protocol_id TEXT,
+    status TEXT,
+    command_cursor INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (robot, run_id)
+);
+CREATE TABLE IF NOT EXISTS run_commands (
+    robot_run_id INTEGER NOT NULL REFERENCES robot_runs(id),
+    command_index INTEGER NOT NULL,
+    command_type TEXT NOT NULL,
+    status TEXT,
+    started_at TEXT,
+    completed_at TEXT,
+    command TEXT NOT NULL,
+    PRIMARY KEY (robot_run_id, command_index)
+);
+CREATE INDEX IF NOT EXISTS events_by_schedule_day_shift ON events(schedule_id, day, shift);
+CREATE INDEX IF NOT EXISTS events_by_day_shift ON events(day, shift);
+CREATE INDEX IF NOT EXISTS events_by_type ON events(type, day);
+CREATE INDEX IF NOT EXISTS event_wells_by_well ON event_wells(category, well_number);
+CREATE INDEX IF NOT EXISTS event_wells_by_event ON event_wells(event_id);
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def stored_parameters(schedule_path: Path) -> str | None:
+    # Written by GenerateSchedule.py next to the schedule; older schedules have none
+    path = parameters_path(schedule_path)
+    return path.read_text() if path.exists() else None
+
+
+def event_rows(events: list[dict]):
+    # Clean events carry no time of their own, they run after the previous event
+    seconds_after_start = 0.0
+    for event_index, event in enumerate(events):
+        seconds_after_start = event.get(
+            "seconds_after_start", event.get("resume_at", seconds_after_start)
+        )
+        day = int(seconds_after_start // SECONDS_PER_DAY)
+        shift = None
+        volume_ul = None
+        wells = []
+        if event["type"] == "interaction":
+            info = event["interaction_info"]
+            shift = info["shift"]
+            volume_ul = info["bacteria_transfer_ul"]
+            wells = [
+                ("source", info["source_category"], info["source_well_number"]),
+                ("target", info["target_category"], info["target_well_number"]),
+            ]
+        elif event["type"] == "clean_well":
+            info = event["clean_target_info"]
+            shift = info["shift"]
+            volume_ul = info["clean_ul"]
+            wells = [("clean", info["well_category"], info["well_number"])]
+        yield (
+            event_index,
+            event["type"],
+            event.get("seconds_after_start"),
+            day,
+            shift,
+            volume_ul,
+            wells,
+        )
+
+
+def summarize_run_log(run_log: dict) -> dict:
+    commands = run_log["commands"]
+    if isinstance(commands, dict):
+        commands = commands["data"]
+    started = [command["startedAt"] for command in commands if command.get("startedAt")]
+    completed = [
+        command["completedAt"] for command in commands if command.get("completedAt")
+    ]
+    return {
+        "command_count": len(commands),
+        "command_counts": dict(Counter(command["commandType"] for command in commands)),
+        "started_at": min(started, default=None),
+        "completed_at": max(completed, default=None),
+        "error_count": sum(command.get("error") is not None for command in commands),
+    }
+
+
+class RunStore:
+    def __init__(self, path: Path = STORE_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_schedules(self, schedule_paths: list[Path]) -> list[int]:
+        schedule_ids = []
+        with self.connection:
+            for schedule_path in schedule_paths:
+                text = schedule_path.read_text()
+                digest = content_hash(text)
+                existing = self.connection.execute(
+                    "SELECT id FROM schedules WHERE content_hash = ?", (digest,)
+                ).fetchone()
+                if existing is not None:
+                    schedule_ids.append(existing["id"])
+                    continue
+
+                events = json.loads(text)
+                schedule_id = self.connection.execute(
+                    "INSERT INTO schedules (path, content_hash, event_count, parameters) "
+                    "VALUES (?, ?, ?, ?)",
+                    (str(schedule_path), digest, len(events), stored_parameters(schedule_path)),
+                ).lastrowid
+                schedule_ids.append(schedule_id)
+                self.insert_events(schedule_id, events)
+        return schedule_ids
+
+    def insert_events(self, schedule_id: int, events: list[dict]):
+        rows = list(event_rows(events))
+        # Event ids are assigned in one block so the well rows can point at them
+        first_event_id = (
+            self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            + 1
+        )
+        self.connection.executemany(
+            "INSERT INTO events "
+            "(id, schedule_id, event_index, type, seconds_after_start, day, shift, volume_ul) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (first_event_id + i, schedule_id, *row[:-1])
+                for i, row in enumerate(rows)
+            ),
+        )
+        self.connection.executemany(
+            "INSERT INTO event_wells (event_id, schedule_id, role, category, well_number) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                (first_event_id + i, schedule_id, role, category, well_number)
+                for i, row in enumerate(rows)
+                for role, category, well_number in row[-1]
+            ),
+        )
+
+    def add_script(self, schedule_id: int, script_hash: str, layout: dict | None = None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO scripts (script_hash, schedule_id, layout) "
+                "VALUES (?, ?, ?)",
+                (script_hash, schedule_id, json.dumps(layout)),
+            )
+
+    def add_validation_results(self, results: list[dict]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO validations "
+                "(script_hash, ok, error, command_count, command_counts, estimated_duration_secs) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        result["script_hash"],
+                        result["ok"],
+                        result["error"],
+                        result["command_count"],
+                        json.dumps(result["command_counts"]),
+                        result["estimated_duration_secs"],
+                    )
+                    for result in results
+                ),
+            )
+
+    def add_run_log(self, run_log_path: Path, schedule_id: int | None = None) -> int:
+        text = run_log_path.read_text()
+        summary = summarize_run_log(json.loads(text))
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO run_logs "
+                "(path, content_hash, schedule_id, command_count, command_counts, "
+                "started_at, completed_at, error_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(run_log_path),
+                    content_hash(text),
+                    schedule_id,
+                    summary["command_count"],
+                    json.dumps(summary["command_counts"]),
+                    summary["started_at"],
+                    summary["completed_at"],
+                    summary["error_count"],
+                ),
+            )
+        return self.connection.execute(
+            "SELECT id FROM run_logs WHERE content_hash = ?", (content_hash(text),)
+        ).fetchone()["id"]
+
+    def robot_runs(self, robot: str) -> dict[str, sqlite3.Row]:
+        rows = self.connection.execute(
+            "SELECT * FROM robot_runs WHERE robot = ?", (robot,)
+        ).fetchall()
+        return {row["run_id"]: row for row in rows}
+
+    def add_run_commands(
+        self,
+        robot: str,
+        run: dict,
+        first_index: int,
+        commands: list[dict],
+    ) -> int:
+        # Appends the commands that follow the stored ones and moves the cursor past them
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO robot_runs (robot, run_id, protocol_id, status) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (robot, run_id) DO UPDATE SET status = excluded.status",
+                (robot, run["id"], run.get("protocolId"), run.get("status")),
+            )
+            robot_run_id = self.connection.execute(
+                "SELECT id FROM robot_runs WHERE robot = ? AND run_id = ?", (robot, run["id"])
+            ).fetchone()["id"]
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO run_commands "
+                "(robot_run_id, command_index, command_type, status, started_at, completed_at, command) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        robot_run_id,
+                        first_index + i,
+                        command["commandType"],
+                        command.get("status"),
+                        command.get("startedAt"),
+                        command.get("completedAt"),
+                        json.dumps(command),
+                    )
+                    for i, command in enumerate(commands)
+                ),
+            )
+            self.connection.execute(
+                "UPDATE robot_runs SET command_cursor = ? WHERE id = ?",
+                (first_index + len(commands), robot_run_id),
+            )
+        return robot_run_id
+
+    def run_commands(self, robot: str, run_id: str) -> list[dict]:
+        rows = self.connection.execute(
+            "SELECT run_commands.command FROM run_commands "
+            "JOIN robot_runs ON robot_runs.id = run_commands.robot_run_id "
+            "WHERE robot_runs.robot = ? AND robot_runs.run_id = ? "
+            "ORDER BY run_commands.command_index",
+            (robot, run_id),
+        ).fetchall()
+        return [json.loads(row["command"]) for row in rows]
+
+    def query_events(
+        self,
+        day: int | None = None,
+        shift: str | None = None,
+        category: str | None = None,
+        well_number: int | None = None,
+        event_type: str | None = None,
+        schedule_id: int | None = None,
+    ) -> list[sqlite3.Row]:
+        filters = []
+        params = []
+        for column, value in [
+            ("events.schedule_id", schedule_id),
+            ("events.day", day),
+            ("events.shift", shift),
+            ("events.type", event_type),
+        ]:
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+
+        if category is not None or well_number is not None:
+            well_filters = []
+            for column, value in [("category", category), ("well_number", well_number)]:
+                if value is not None:
+                    well_filters.append(f"event_wells.{column} = ?")
+                    params.append(value)
+            filters.append(
+                "events.id IN (SELECT event_id FROM event_wells WHERE "
+                + " AND ".join(well_filters)
+                + ")"
+            )
+
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        return self.connection.execute(
+            f"SELECT events.* FROM events {where} "
+            "ORDER BY events.schedule_id, events.event_index",
+            params,
+        ).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store schedules and run logs in a local SQLite database"
+    )
+    parser.add_argument("--store", type=Path, default=STORE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_schedules_parser = subparsers.add_parser("add-schedules")
+    add_schedules_parser.add_argument("schedule_paths", nargs="+", type=Path)
+
+    add_run_log_parser = subparsers.add_parser("add-run-log")
+    add_run_log_parser.add_argument("run_log_path", type=Path)
+    add_run_log_parser.add_argument("--schedule-id", type=int)
+
+    export_run_parser = subparsers.add_parser(
+        "export-run", help="write a harvested run as a run log the analysis scripts read"
+    )
+    export_run_parser.add_argument("robot")
+    export_run_parser.add_argument("run_id")
+    export_run_parser.add_argument("run_log_path", type=Path)
+
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("--day", type=int, help="day index, starting at 0")
+    query_parser.add_argument("--shift")
+    query_parser.add_argument("--category")
+    query_parser.add_argument("--well", type=int)
+    query_parser.add_argument("--type")
+    query_parser.add_argument("--schedule-id", type=int)
+    query_parser.add_argument("--count", action="store_true")
+    args = parser.parse_args()
+
+    store = RunStore(args.store)
+    if args.command == "add-schedules":
+        schedule_ids = store.add_schedules(args.schedule_paths)
+        print(f"Stored {len(schedule_ids)} schedules: {schedule_ids}")
+    elif args.command == "add-run-log":
+        print(f"Stored run log {store.add_run_log(args.run_log_path, args.schedule_id)}")
+    elif args.command == "export-run":
+        commands = store.run_commands(args.robot, args.run_id)
+        args.run_log_path.write_text(json.dumps({"commands": commands}))
+        print(f"Wrote {len(commands)} commands to {args.run_log_path}")
+    elif args.command == "query":
+        rows = store.query_events(
+            args.day, args.shift, args.category, args.well, args.type, args.schedule_id
+        )
+        if args.count:
+            print(len(rows))
+        else:
+            for row in rows:
+                print(json.dumps(dict(row)))
+    store.close()
@@ -0,0 +1,227 @@
+import argparse
+import json
+import math
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from GenerateSchedule import MANUAL_SERVICE_DURATION
+from ScheduleAligner import planned_operations
+from ScheduleReader import ScheduleReader
+from ScheduleToScript import render_script
+from SerialDilutionPlanner import snake_order
+from TravelCost import (
+    DECK_SLOT_ORIGINS,
+    DEFAULT_DECK_LAYOUT,
+    TEMPERATURE_MODULE_PLATES,
+    TIPRACK_LOAD_NAME,
+    WELL_PLATE_LOAD_NAME,
+    TravelModel,
+    load_labware_definition,
+    well_positions,
+)
+
+
+TEMPLATE_PATH = Path(__file__).parent / "SamplingTemplate.py"
+PLATE_LOAD_NAME = "appliedbiosystems_96_wellplate_200ul"
+# The sample block SerialDilutionPlanner.py dilutes from
+TUBE_LOAD_NAME = "opentrons_24_aluminumblock_nest_1.5ml_snapcap"
+PLATES = ["patient", "staff", "equipment", "surface"]
+TIPS_PER_RACK = 96
+# Fixed trash in slot 12, where every sampling tip is dropped
+TRASH_POSITION = (330.0, 350.0)
+# Picking up a tip, mixing, aspirating, dispensing and dropping the tip
+SAMPLE_HANDLING_SECS = 25.0
+
+
+def well_activity(events: list[dict], day: int) -> dict[tuple[str, int], dict]:
+    activity = defaultdict(lambda: {"exposure_ul": 0.0, "transfers": 0, "cleans": 0})
+    for operation in planned_operations(events):
+        if operation["day"] != day:
+            continue
+        for well in operation["wells"]:
+            if operation["operation"] == "transfer":
+                activity[well]["exposure_ul"] += operation["volume_ul"]
+                activity[well]["transfers"] += 1
+            else:
+                activity[well]["cleans"] += 1
+    return dict(activity)
+
+
+def choose_wells(activity: dict[tuple[str, int], dict], capacity: int) -> list[tuple[str, int]]:
+    # Most exposed wells first, cleaned but untouched wells after them
+    ranked = sorted(
+        activity,
+        key=lambda well: (-activity[well]["exposure_ul"], -activity[well]["cleans"], well),
+    )
+    return ranked[:capacity]
+
+
+def sampling_layout(layout: dict, sample_load_name: str, sample_count: int) -> dict:
+    # The hospital plates stay put; the sample labware and fresh tip racks take
+    # the tip rack slots closest to them
+    plate_slots = [layout[plate] for plate in PLATES]
+    centre = (
+        sum(DECK_SLOT_ORIGINS[slot][0] for slot in plate_slots) / len(plate_slots),
+        sum(DECK_SLOT_ORIGINS[slot][1] for slot in plate_slots) / len(plate_slots),
+    )
+    free_slots = sorted(
+        [*layout["tipracks"], layout["reservoir"]],
+        key=lambda slot: math.dist(DECK_SLOT_ORIGINS[slot], centre),
+    )
+    rack_count = math.ceil(sample_count / TIPS_PER_RACK)
+    if rack_count + 1 > len(free_slots):
+        raise ValueError(f"{sample_count} samples need more tip racks than the deck has room for")
+    return {
+        **{plate: layout[plate] for plate in PLATES},
+        "samples": free_slots[0],
+        "tipracks": free_slots[1 : 1 + rack_count],
+    }
+
+
+def order_wells(wells: list[tuple[str, int]], layout: dict) -> list[tuple[str, int]]:
+    # Nearest neighbour tour over the source wells, starting next to the tips
+    positions = {
+        plate: well_positions(WELL_PLATE_LOAD_NAME, layout[plate], plate in TEMPERATURE_MODULE_PLATES)
+        for plate in PLATES
+    }
+    position = well_positions(TIPRACK_LOAD_NAME, layout["tipracks"][0])[0]
+    remaining = set(wells)
+    ordered = []
+    while remaining:
+        well = min(remaining, key=lambda well: (math.dist(position, positions[well[0]][well[1]]), well))
+        ordered.append(well)
+        remaining.remove(well)
+        position = positions[well[0]][well[1]]
+    return ordered
+
+
+def estimate_secs(wells: list[tuple[str, int]], sample_well_names: list[str], layout: dict, sample_load_name: str) -> float:
+    model = TravelModel({**DEFAULT_DECK_LAYOUT, **layout})
+    tips = [tip for rack in model.tiprack_wells for tip in rack]
+    definition = load_labware_definition(sample_load_name)
+    sample_positions = dict(
+        zip(
+            [name for column in definition["ordering"] for name in column],
+            well_positions(sample_load_name, layout["samples"]),
+        )
+    )
+    secs = 0.0
+    for tip, (plate, number), sample_well_name in zip(tips, wells, sample_well_names):
+        stops = [
+            TRASH_POSITION,
+            tip,
+            model.plate_wells[plate][number],
+            sample_positions[sample_well_name],
+            TRASH_POSITION,
+        ]
+        secs += SAMPLE_HANDLING_SECS
+        secs += sum(model.move_secs(start, end) for start, end in zip(stops, stops[1:]))
+    return secs
+
+
+def plan_sampling(
+    events: list[dict],
+    day: int,
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    tubes: bool = False,
+    max_samples: int | None = None,
+) -> tuple[list[tuple[str, tuple]], dict]:
+    sample_load_name = TUBE_LOAD_NAME if tubes else PLATE_LOAD_NAME
+    sample_well_names = snake_order(sample_load_name)
+    capacity = min(len(sample_well_names), max_samples or len(sample_well_names))
+
+    activity = well_activity(events, day)
+    chosen = choose_wells(activity, capacity)
+    sampling_deck = sampling_layout(layout, sample_load_name, len(chosen))
+    ordered = order_wells(chosen, sampling_deck)
+    sample_well_names = sample_well_names[: len(ordered)]
+
+    operations = [("comment", (f"Sampling {len(ordered)} wells active on day {day + 1}",))]
+    for (plate, number), sample_well_name in zip(ordered, sample_well_names):
+        operations.append(("sample", (plate, number, sample_well_name)))
+
+    summary = {
+        "active_wells": len(activity),
+        "sampled_wells": ordered,
+        "sample_well_names": sample_well_names,
+        "sample_labware": sample_load_name,
+        "layout": sampling_deck,
+        "estimated_secs": estimate_secs(ordered, sample_well_names, sampling_deck, sample_load_name),
+    }
+    return operations, summary
+
+
+def compile_sampling(
+    events: list[dict],
+    day: int,
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    tubes: bool = False,
+    max_samples: int | None = None,
+    sample_ul: float = 50,
+) -> tuple[str, list[tuple[str, tuple]], dict]:
+    operations, summary = plan_sampling(events, day, layout, tubes, max_samples)
+    template_constants = {
+        "DECK_LAYOUT": summary["layout"],
+        "SAMPLE_LOAD_NAME": summary["sample_labware"],
+        "SAMPLE_UL": sample_ul,
+    }
+    return render_script(operations, template_constants, TEMPLATE_PATH), operations, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a protocol that samples the day's active wells"
+    )
+    parser.add_argument("events_json_log_path", type=Path)
+    parser.add_argument("day", type=int, help="day index, starting at 0")
+    parser.add_argument(
+        "script_output_path", nargs="?", type=Path, default=Path("GeneratedSampling.py")
+    )
+    parser.add_argument(
+        "--layout",
+        type=Path,
+        help="deck layout JSON the day's schedule ran with",
+    )
+    parser.add_argument(
+        "--tubes",
+        action="store_true",
+        help=f"sample into {TUBE_LOAD_NAME} for SerialDilutionPlanner.py instead of a 200 µL plate",
+    )
+    parser.add_argument("--max-samples", type=int)
+    parser.add_argument("--sample-ul", type=float, default=50)
+    parser.add_argument("--manifest", type=Path, help="write which well went where as JSON")
+    args = parser.parse_args()
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    # Only the day being sampled is read from the schedule
+    events = list(ScheduleReader(args.events_json_log_path).events(args.day))
+    script, operations, summary = compile_sampling(
+        events, args.day, layout, args.tubes, args.max_samples, args.sample_ul
+    )
+    args.script_output_path.write_text(script)
+    if args.manifest is not None:
+        args.manifest.write_text(
+            json.dumps(
+                [
+                    {"plate": plate, "well_number": number, "sample_well": sample_well_name}
+                    for (plate, number), sample_well_name in zip(
+                        summary["sampled_wells"], summary["sample_well_names"]
+                    )
+                ],
+                indent="    ",
+            )
+        )
+
+    print(
+        f"Sampling {len(summary['sampled_wells'])} of {summary['active_wells']} active wells "
+        f"into {summary['sample_labware']} (slot {summary['layout']['samples']}, "
+        f"tips in {', '.join(summary['layout']['tipracks'])})"
+    )
+    print(
+        f"About {timedelta(seconds=round(summary['estimated_secs']))} of robot time, "
+        f"out of a {MANUAL_SERVICE_DURATION} service window"
+    )
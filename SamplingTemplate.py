@@ -0,0 +1,68 @@
+from opentrons import protocol_api
+
+metadata = {
+    "protocolName": "Generated End of Day Sampling",
+    "author": "Jonnathan Saavedra",
+    "description": "Aliquots the day's active wells for plating, planned by SamplingPlanner.py",
+    "apiLevel": "2.14",
+}
+
+# Hospital plates stay where the day's run left them, set by SamplingPlanner.py
+DECK_LAYOUT = {
+    "patient": "10",
+    "staff": "7",
+    "equipment": "8",
+    "surface": "11",
+    "samples": "5",
+    "tipracks": ["6", "4"],
+}
+SAMPLE_LOAD_NAME = "appliedbiosystems_96_wellplate_200ul"
+SAMPLE_UL = 50
+MIX_UL = 100
+MIX_REPITITIONS = 3
+# Identifies the generated plan
+SCHEDULE_HASH = ""
+
+
+class Sampling:
+    def __init__(self, protocol: protocol_api.ProtocolContext):
+        self.protocol = protocol
+        # The modules are only loaded so the plates on them are placed correctly
+        patient_module = self.protocol.load_module("temperature module", DECK_LAYOUT["patient"])
+        staff_module = self.protocol.load_module("temperature module", DECK_LAYOUT["staff"])
+        self.plates_dict = {
+            "patient": patient_module.load_labware("corning_96_wellplate_360ul_flat"),
+            "staff": staff_module.load_labware("corning_96_wellplate_360ul_flat"),
+            "equipment": self.protocol.load_labware(
+                "corning_96_wellplate_360ul_flat", DECK_LAYOUT["equipment"], "Equipment Plate"
+            ),
+            "surface": self.protocol.load_labware(
+                "corning_96_wellplate_360ul_flat", DECK_LAYOUT["surface"], "Surface Plate"
+            ),
+        }
+        self.samples = self.protocol.load_labware(SAMPLE_LOAD_NAME, DECK_LAYOUT["samples"])
+        tipracks = [
+            self.protocol.load_labware("opentrons_96_tiprack_300ul", slot)
+            for slot in DECK_LAYOUT["tipracks"]
+        ]
+        self.p300 = self.protocol.load_instrument(
+            "p300_single_gen2", "right", tip_racks=tipracks
+        )
+        self.protocol.comment(f"Sampling plan {SCHEDULE_HASH[:12]}")
+
+    def sample(self, well_plate: str, well_number: int, sample_well_name: str):
+        # A fresh tip for every well, so no sample carries bacteria into another
+        source_well = self.plates_dict[well_plate].wells()[well_number]
+        self.p300.pick_up_tip()
+        self.p300.mix(MIX_REPITITIONS, MIX_UL, source_well)
+        self.p300.aspirate(SAMPLE_UL, source_well)
+        self.p300.dispense(SAMPLE_UL, self.samples[sample_well_name])
+        self.p300.blow_out(self.samples[sample_well_name].top())
+        self.p300.drop_tip()
+
+    def comment(self, text: str):
+        self.protocol.comment(text)
+
+
+def run(protocol: protocol_api.ProtocolContext):
+    simulation = Sampling(protocol)
@@ -0,0 +1,308 @@
+import argparse
+import json
+from collections import deque
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from GenerateSchedule import clean_deadline_secs
+from OperationProfiler import FILL_END_COMMENT, iter_operations
+from RunLogParser import ROWS, iter_run_log_commands, labware_label
+from ScheduleReader import ScheduleReader
+from ScheduleToScript import get_well_plate
+from TravelCost import DEFAULT_DECK_LAYOUT, WELL_PLATE_LOAD_NAME
+
+
+SECONDS_PER_DAY = timedelta(days=1).total_seconds()
+# How far ahead to look for a match before calling an operation missing or extra
+LOOKAHEAD = 20
+VOLUME_TOLERANCE_UL = 0.01
+
+
+def planned_operations(events: Iterable[dict], first_day: int = 0) -> Iterator[dict]:
+    # first_day is the day events rebased by ScheduleReader.day_events start on
+    seconds_after_start = 0.0
+    for event_index, event in enumerate(events):
+        seconds_after_start = event.get("seconds_after_start", seconds_after_start)
+        if event["type"] == "interaction":
+            info = event["interaction_info"]
+            operation = "transfer"
+            wells = (
+                (get_well_plate(info["source_category"]), info["source_well_number"]),
+                (get_well_plate(info["target_category"]), info["target_well_number"]),
+            )
+            volume_ul = info["bacteria_transfer_ul"]
+        elif event["type"] == "clean_well":
+            info = event["clean_target_info"]
+            operation = "clean"
+            wells = ((get_well_plate(info["well_category"]), info["well_number"]),)
+            volume_ul = info["clean_ul"]
+        else:
+            continue
+        day = int(seconds_after_start // SECONDS_PER_DAY)
+        yield {
+            "event_index": event_index,
+            "operation": operation,
+            "wells": wells,
+            "volume_ul": volume_ul,
+            # When the operation is due; for cleans the end of their shift's
+            # cleaning window, so one finished before it is early, not late
+            "planned_secs": (
+                clean_deadline_secs(day, info["shift"]) if operation == "clean" else seconds_after_start
+            ),
+            "day": first_day + day,
+            "shift": info["shift"],
+        }
+
+
+def well_number(well_name: str) -> int:
+    # Index into labware.wells(), which runs down each column in turn
+    return (int(well_name[1:]) - 1) * 8 + ROWS.index(well_name[0])
+
+
+class ExecutedOperations:
+    def __init__(self, commands: Iterable[dict], layout: dict = DEFAULT_DECK_LAYOUT):
+        self.commands = commands
+        self.plates_by_slot = {
+            layout[plate]: plate for plate in ["patient", "staff", "equipment", "surface"]
+        }
+        self.module_slots = {}
+        self.plates = {}
+        self.media_filled = False
+        self.schedule_start = None
+
+    def watch_setup(self) -> Iterator[dict]:
+        # Learns where the plates are and when the schedule clock started
+        for command in self.commands:
+            command_type = command.get("commandType")
+            params = command.get("params", {})
+            if command_type == "loadModule":
+                self.module_slots[command["result"]["moduleId"]] = params["location"][
+                    "slotName"
+                ]
+            elif command_type == "loadLabware" and params["loadName"] == WELL_PLATE_LOAD_NAME:
+                # Only well plates hold plate wells, whatever the layout puts
+                # in their slots; the layout names them
+                location = params["location"]
+                slot = location.get("slotName") or self.module_slots.get(
+                    location.get("moduleId")
+                )
+                self.plates[command["result"]["labwareId"]] = self.plates_by_slot.get(
+                    slot, labware_label(command, self.module_slots)
+                )
+            elif command_type == "comment" and params.get("message") == FILL_END_COMMENT:
+                self.media_filled = True
+            elif (
+                command_type == "waitForResume"
+                and self.media_filled
+                and self.schedule_start is None
+            ):
+                # HospitalSimulation starts its clock once the bacteria are added
+                self.schedule_start = datetime.fromisoformat(command["completedAt"])
+            yield command
+
+    def __iter__(self) -> Iterator[dict]:
+        for operation, commands in iter_operations(self.watch_setup()):
+            if operation not in ("transfer", "clean"):
+                continue
+            # The reservoir wells say nothing about which event this was
+            aspirates = []
+            dispenses = []
+            for command in commands:
+                if command["params"].get("labwareId") in self.plates:
+                    if command["commandType"] == "aspirate":
+                        aspirates.append(command)
+                    elif command["commandType"] == "dispense":
+                        dispenses.append(command)
+            if operation == "transfer":
+                # A zero volume transfer only picks up and returns a tip
+                well_commands = [aspirates[0], dispenses[0]] if aspirates else []
+                volume_ul = aspirates[0]["params"]["volume"] if aspirates else 0.0
+            else:
+                well_commands = dispenses[:1]
+                volume_ul = dispenses[0]["params"]["volume"] if dispenses else 0.0
+
+            executed_secs = None
+            if commands[0].get("startedAt") and self.schedule_start is not None:
+                executed_secs = (
+                    datetime.fromisoformat(commands[0]["startedAt"]) - self.schedule_start
+                ).total_seconds()
+            yield {
+                "operation": operation,
+                "wells": tuple(
+                    (
+                        self.plates.get(command["params"]["labwareId"]),
+                        well_number(command["params"]["wellName"]),
+                    )
+                    for command in well_commands
+                ),
+                "volume_ul": volume_ul,
+                "executed_secs": executed_secs,
+            }
+
+
+def same_operation(planned: dict, executed: dict) -> bool:
+    return (
+        planned["operation"] == executed["operation"]
+        and (planned["wells"] == executed["wells"] or not executed["wells"])
+        and abs(planned["volume_ul"] - executed["volume_ul"]) <= VOLUME_TOLERANCE_UL
+    )
+
+
+def align(planned: Iterable[dict], executed: Iterable[dict], lookahead: int = LOOKAHEAD) -> Iterator[dict]:
+    # One pass over both streams, holding at most a small window of each
+    planned = iter(planned)
+    executed = iter(executed)
+    planned_window = deque()
+    executed_window = deque()
+    recently_matched = deque(maxlen=lookahead)
+    last_planned = {"event_index": None, "day": None, "shift": None, "planned_secs": None}
+
+    def alignment(status: str, planned_operation: dict | None, executed_operation: dict | None) -> dict:
+        nonlocal last_planned
+        if planned_operation is not None:
+            last_planned = planned_operation
+        source = planned_operation or executed_operation
+        executed_secs = executed_operation["executed_secs"] if executed_operation else None
+        planned_secs = planned_operation["planned_secs"] if planned_operation else None
+        lateness_secs = None
+        if planned_secs is not None and executed_secs is not None:
+            lateness_secs = executed_secs - planned_secs
+        return {
+            "status": status,
+            "event_index": planned_operation["event_index"] if planned_operation else None,
+            "operation": source["operation"],
+            "wells": source["wells"],
+            "volume_ul": source["volume_ul"],
+            "day": last_planned["day"],
+            "shift": last_planned["shift"],
+            "planned_secs": planned_secs,
+            "executed_secs": executed_secs,
+            "lateness_secs": lateness_secs,
+        }
+
+    def unexpected(executed_operation: dict) -> dict:
+        if any(same_operation(matched, executed_operation) for matched in recently_matched):
+            return alignment("duplicate", None, executed_operation)
+        return alignment("extra", None, executed_operation)
+
+    while True:
+        while len(planned_window) <= lookahead and (next_planned := next(planned, None)):
+            planned_window.append(next_planned)
+        while len(executed_window) <= lookahead and (next_executed := next(executed, None)):
+            executed_window.append(next_executed)
+        if not planned_window and not executed_window:
+            return
+        if not executed_window:
+            yield alignment("missing", planned_window.popleft(), None)
+            continue
+        if not planned_window:
+            yield unexpected(executed_window.popleft())
+            continue
+
+        if same_operation(planned_window[0], executed_window[0]):
+            recently_matched.append(planned_window[0])
+            yield alignment("matched", planned_window.popleft(), executed_window.popleft())
+            continue
+
+        # Skip whichever side needs fewer skips to get back in step
+        executed_skip = next(
+            (skip for skip, executed_operation in enumerate(executed_window)
+             if same_operation(planned_window[0], executed_operation)),
+            None,
+        )
+        planned_skip = next(
+            (skip for skip, planned_operation in enumerate(planned_window)
+             if same_operation(planned_operation, executed_window[0])),
+            None,
+        )
+        if executed_skip is not None and (planned_skip is None or executed_skip <= planned_skip):
+            yield unexpected(executed_window.popleft())
+        elif planned_skip is not None:
+            yield alignment("missing", planned_window.popleft(), None)
+        else:
+            yield alignment("missing", planned_window.popleft(), None)
+            yield unexpected(executed_window.popleft())
+
+
+def summarize_shifts(alignments: Iterable[dict]) -> list[dict]:
+    shifts = {}
+    for aligned in alignments:
+        key = (aligned["day"], aligned["shift"])
+        shift = shifts.setdefault(
+            key,
+            {
+                "day": aligned["day"],
+                "shift": aligned["shift"],
+                "matched": 0,
+                "missing": 0,
+                "extra": 0,
+                "duplicate": 0,
+                "max_lateness_secs": None,
+                "drift_secs": None,
+            },
+        )
+        shift[aligned["status"]] += 1
+        if aligned["lateness_secs"] is not None:
+            # Drift is how late the shift's most recent operation started
+            shift["drift_secs"] = aligned["lateness_secs"]
+            if (
+                shift["max_lateness_secs"] is None
+                or aligned["lateness_secs"] > shift["max_lateness_secs"]
+            ):
+                shift["max_lateness_secs"] = aligned["lateness_secs"]
+    return list(shifts.values())
+
+
+def format_secs(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    sign = "-" if seconds < 0 else ""
+    return f"{sign}{timedelta(seconds=round(abs(seconds)))}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Match the events of a schedule to the operations in its run log"
+    )
+    parser.add_argument("events_json_log_path", type=Path)
+    parser.add_argument("run_log_path", type=Path)
+    parser.add_argument(
+        "--layout",
+        type=Path,
+        help="deck layout JSON the schedule was compiled with",
+    )
+    parser.add_argument("--output", type=Path, help="write every alignment as JSON lines")
+    parser.add_argument("--day", type=int, help="the --day the script was compiled with")
+    parser.add_argument("--shift", help="the --shift the script was compiled with")
+    args = parser.parse_args()
+    if args.shift is not None and args.day is None:
+        parser.error("--shift needs --day")
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    reader = ScheduleReader(args.events_json_log_path)
+    if args.day is None:
+        planned = planned_operations(reader)
+    else:
+        planned = planned_operations(reader.day_events(args.day, args.shift), args.day)
+    alignments = align(
+        planned,
+        ExecutedOperations(iter_run_log_commands(args.run_log_path), layout),
+    )
+    if args.output is not None:
+        alignments = list(alignments)
+        with open(args.output, "w") as output_file:
+            for aligned in alignments:
+                output_file.write(json.dumps(aligned) + "\n")
+
+    for shift in summarize_shifts(alignments):
+        print(
+            f"Day {shift['day'] + 1} {shift['shift']}: {shift['matched']} matched, "
+            f"{shift['missing']} missing, {shift['extra']} extra, "
+            f"{shift['duplicate']} ran twice, "
+            f"worst lateness {format_secs(shift['max_lateness_secs'])}, "
+            f"drift {format_secs(shift['drift_secs'])}"
+        )
@@ -0,0 +1,213 @@
+import argparse
+import json
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from datetime import timedelta
+from pathlib import Path
+
+from RunLogParser import CHUNK_SIZE, EVENT_ARRAY_START, iter_json_array_spans, iter_schedule_events
+
+
+SECONDS_PER_DAY = timedelta(days=1).total_seconds()
+INDEX_VERSION = 1
+INDENT = "    "
+
+
+def index_path(schedule_path: Path) -> Path:
+    return schedule_path.with_name(schedule_path.name + ".index.json")
+
+
+def parameters_path(schedule_path: Path) -> Path:
+    return schedule_path.with_name(schedule_path.name + ".params.json")
+
+
+def event_shift(event: dict) -> str | None:
+    info = event.get("interaction_info") or event.get("clean_target_info")
+    return info["shift"] if info else None
+
+
+def slice_events(spans: Iterable[tuple[int, int, dict]]) -> Iterator[dict]:
+    # Groups events into contiguous runs of the same day and shift. Events
+    # without a shift of their own, like the comment before each interaction,
+    # go with the next event that has one on the same day; those left at the
+    # end of a day (the end of day comment and restock) get no shift.
+    seconds_after_start = 0.0
+    current = None
+    pending = []
+
+    def extend(key: tuple[int, str | None], start: int, end: int, event_index: int):
+        nonlocal current
+        if current is not None and (current["day"], current["shift"]) == key and current["end"] <= start:
+            current["end"] = end
+            current["event_count"] += 1
+            return None
+        finished = current
+        current = {
+            "day": key[0],
+            "shift": key[1],
+            "start": start,
+            "end": end,
+            "first_event": event_index,
+            "event_count": 1,
+        }
+        return finished
+
+    def flush(shift: str | None):
+        for day, start, end, event_index in pending:
+            if (finished := extend((day, shift), start, end, event_index)) is not None:
+                yield finished
+        pending.clear()
+
+    for event_index, (start, end, event) in enumerate(spans):
+        seconds_after_start = event.get(
+            "seconds_after_start", event.get("resume_at", seconds_after_start)
+        )
+        day = int(seconds_after_start // SECONDS_PER_DAY)
+        if pending and pending[-1][0] != day:
+            yield from flush(None)
+        shift = event_shift(event)
+        pending.append((day, start, end, event_index))
+        if shift is not None:
+            yield from flush(shift)
+    yield from flush(None)
+    if current is not None:
+        yield current
+
+
+def file_signature(schedule_path: Path) -> dict:
+    stat = schedule_path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_index(schedule_path: Path, slices: list[dict]):
+    index = {"version": INDEX_VERSION, "schedule": file_signature(schedule_path), "slices": slices}
+    index_path(schedule_path).write_text(json.dumps(index))
+
+
+def build_index(schedule_path: Path, chunk_size: int = CHUNK_SIZE) -> list[dict]:
+    # For schedules written before the index existed; latin-1 keeps the offsets in bytes
+    slices = list(
+        slice_events(iter_json_array_spans(schedule_path, EVENT_ARRAY_START, chunk_size, "latin-1"))
+    )
+    write_index(schedule_path, slices)
+    return slices
+
+
+def write_schedule(events: Iterable[dict], schedule_path: Path, parameters: dict | None = None):
+    # Same bytes as json.dumps(events, indent="    "), plus the sidecar index
+    # and the parameters the schedule was generated with
+    def spans() -> Iterator[tuple[int, int, dict]]:
+        offset = 0
+        with open(schedule_path, "w", encoding="ascii", newline="") as schedule_file:
+            separator = "[\n"
+            for event in events:
+                text = INDENT + json.dumps(event, indent=INDENT).replace("\n", "\n" + INDENT)
+                schedule_file.write(separator + text)
+                offset += len(separator)
+                yield offset + len(INDENT), offset + len(text), event
+                offset += len(text)
+                separator = ",\n"
+            schedule_file.write("\n]" if separator == ",\n" else "[]")
+
+    slices = list(slice_events(spans()))
+    write_index(schedule_path, slices)
+    if parameters is None:
+        parameters_path(schedule_path).unlink(missing_ok=True)
+    else:
+        parameters_path(schedule_path).write_text(json.dumps(parameters, indent="    "))
+
+
+class ScheduleReader:
+    def __init__(self, schedule_path: Path, chunk_size: int = CHUNK_SIZE):
+        self.schedule_path = schedule_path
+        self.chunk_size = chunk_size
+        self.slices = self.load_index()
+
+    def load_index(self) -> list[dict] | None:
+        try:
+            index = json.loads(index_path(self.schedule_path).read_text())
+        except FileNotFoundError:
+            return None
+        # An index left behind by an older copy of the schedule is ignored
+        if index.get("version") != INDEX_VERSION or index["schedule"] != file_signature(self.schedule_path):
+            return None
+        return index["slices"]
+
+    def ensure_index(self) -> list[dict]:
+        if self.slices is None:
+            self.slices = build_index(self.schedule_path, self.chunk_size)
+        return self.slices
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter_schedule_events(self.schedule_path, self.chunk_size)
+
+    def days(self) -> list[int]:
+        return sorted({entry["day"] for entry in self.ensure_index()})
+
+    def shifts(self, day: int) -> list[str]:
+        return list(dict.fromkeys(entry["shift"] for entry in self.matching_slices(day, None) if entry["shift"]))
+
+    def matching_slices(self, day: int | None, shift: str | None) -> list[dict]:
+        return [
+            entry
+            for entry in self.ensure_index()
+            if (day is None or entry["day"] == day) and (shift is None or entry["shift"] == shift)
+        ]
+
+    def events(self, day: int | None = None, shift: str | None = None) -> Iterator[dict]:
+        # Reads only the parts of the file holding the day and shift asked for
+        if day is None and shift is None:
+            yield from self
+            return
+        yield from self.read_slices(self.matching_slices(day, shift))
+
+    def day_events(self, day: int, shift: str | None = None) -> Iterator[dict]:
+        # One day or one of its shifts on a clock that starts with the day, the
+        # way a script compiled from them runs
+        offset_secs = day * SECONDS_PER_DAY
+        for event in self.events(day, shift):
+            for key in ("seconds_after_start", "resume_at"):
+                if key in event:
+                    event[key] -= offset_secs
+            yield event
+
+    def read_slices(self, slices: Iterable[dict]) -> Iterator[dict]:
+        decoder = json.JSONDecoder()
+        with open(self.schedule_path, "rb") as schedule_file:
+            for entry in slices:
+                schedule_file.seek(entry["start"])
+                text = schedule_file.read(entry["end"] - entry["start"]).decode()
+                position = 0
+                for _ in range(entry["event_count"]):
+                    while text[position] in " \t\r\n,":
+                        position += 1
+                    event, position = decoder.raw_decode(text, position)
+                    yield event
+
+    def event_count(self, day: int | None = None, shift: str | None = None) -> int:
+        return sum(entry["event_count"] for entry in self.matching_slices(day, shift))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Index a schedule by day and shift, or print one slice of it"
+    )
+    parser.add_argument("schedule_path", type=Path)
+    parser.add_argument("--day", type=int, help="day index, starting at 0")
+    parser.add_argument("--shift")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index even if it is current")
+    args = parser.parse_args()
+
+    reader = ScheduleReader(args.schedule_path)
+    if args.rebuild:
+        reader.slices = build_index(args.schedule_path)
+    if args.day is None and args.shift is None:
+        for day in reader.days():
+            shift_counts = defaultdict(int)
+            for entry in reader.matching_slices(day, None):
+                shift_counts[entry["shift"] or "end of day"] += entry["event_count"]
+            shifts = ", ".join(f"{shift} {count}" for shift, count in shift_counts.items())
+            print(f"Day {day}: {reader.event_count(day)} events ({shifts})")
+    else:
+        for event in reader.events(args.day, args.shift):
+            print(json.dumps(event))
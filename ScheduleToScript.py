@@ -1,29 +1,43 @@
+import argparse
+import hashlib
 import json
-import sys
+import re
+from collections import Counter
+from collections.abc import Iterable
 from pathlib import Path
 
 from typing import Literal
 
+from GenerateSchedule import DAY_DURATION, clean_deadline_secs
+from JsonProtocol import compile_json_protocol
+from LiquidLevel import level_table
+from ScheduleReader import ScheduleReader
+from SimulationConstants import MEDIA_TUBE_UL, simulation_constants
+from TravelCost import DEFAULT_DECK_LAYOUT, TravelModel, nearest_tiprack_saves, travel_report
 
-events_json_log_path = Path("simulation_events.json")
-script_output_path = Path("GeneratedScript.py")
 
-if len(sys.argv) == 1:
-    pass
-elif len(sys.argv) == 2:
-    events_json_log_path = Path(sys.argv[1])
-elif len(sys.argv) == 3:
-    events_json_log_path = Path(sys.argv[1])
-    script_output_path = Path(sys.argv[2])
-else:
-    print(
-        "usage: python ScheduleToScript.py [EVENTS_JSON_PATH] [GENERATED_SCRIPT_PATH]"
-    )
-    exit(1)
+TEMPLATE_PATH = Path(__file__).parent / "ScheduleToScriptTemplate.py"
+GENERATED_HEADER = """
+################################################################
+### THIS SCRIPT WAS MACHINE GENERATED. DO NOT EDIT IT BY HAND. #
+################################################################
+
+"""
 
 
-events = json.loads(events_json_log_path.read_text())
-generated_lines = []
+# Used by --shed-load. Cleans give way first, then contacts that do not involve
+# a patient, and only the smallest transfers are ever dropped. Lateness counts
+# from an interaction's own time and from the end of a clean's cleaning window.
+DEFAULT_SHED_RULES = [
+    {"operation": "clean", "late_secs": 300, "action": "defer"},
+    {
+        "operation": "transfer",
+        "plates": ["staff", "equipment", "surface"],
+        "late_secs": 900,
+        "action": "defer",
+    },
+    {"operation": "transfer", "max_ul": 5, "late_secs": 1800, "action": "drop"},
+]
 
 
 PlateTypes = (
@@ -45,50 +59,323 @@ def get_well_plate(category: str) -> PlateTypes:
     raise ValueError(f"unexpected category {category}")
 
 
-for event in events:
-    if "seconds_after_start" in event:
-        generated_lines.append(
-            f"""    simulation.sleep_seconds_after_start({event['seconds_after_start']})"""
-        )
+def events_to_operations(events: Iterable[dict]) -> list[tuple[str, tuple]]:
+    operations = []
+    seconds_after_start = 0.0
+    for event in events:
+        if "seconds_after_start" in event:
+            seconds_after_start = event["seconds_after_start"]
+            operations.append(
+                ("sleep_seconds_after_start", (event["seconds_after_start"],))
+            )
 
-    if event["type"] == "comment":
-        generated_lines.append(f"""    simulation.comment("{event['comment']}")""")
-    elif event["type"] == "interaction":
-        # TODO: Count tips used
-        interaction = event["interaction_info"]
-        source_well_plate = get_well_plate(interaction["source_category"])
-        target_well_plate = get_well_plate(interaction["target_category"])
-        source_well_number = interaction["source_well_number"]
-        target_well_number = interaction["target_well_number"]
-        transfer_ul = interaction["bacteria_transfer_ul"]
-        generated_lines.append(
-            f"""    simulation.transfer("{source_well_plate}", "{target_well_plate}", {source_well_number}, {target_well_number}, {transfer_ul})"""
-        )
-    elif event["type"] == "clean_well":
-        clean_info = event["clean_target_info"]
-        well_plate = get_well_plate(clean_info["well_category"])
-        well_number = clean_info["well_number"]
-        clean_ul = clean_info["clean_ul"]
-        generated_lines.append(
-            f"""    simulation.clean("{well_plate}", {well_number}, {clean_ul})"""
-        )
-    elif event["type"] == "wait_for_continue":
-        generated_lines.append(f"    simulation.wait_for_continue({event['resume_at']})")
-    elif event["type"] == "end_of_day_restock":
-        generated_lines.append("    simulation.end_of_day_restock()")
-    else:
-        raise ValueError(f"unexpected event type {event['type']}")
+        if event["type"] == "comment":
+            operations.append(("comment", (event["comment"],)))
+        elif event["type"] == "interaction":
+            # TODO: Count tips used
+            interaction = event["interaction_info"]
+            operations.append(
+                (
+                    "transfer",
+                    (
+                        get_well_plate(interaction["source_category"]),
+                        get_well_plate(interaction["target_category"]),
+                        interaction["source_well_number"],
+                        interaction["target_well_number"],
+                        interaction["bacteria_transfer_ul"],
+                    ),
+                )
+            )
+        elif event["type"] == "clean_well":
+            clean_info = event["clean_target_info"]
+            # Cleans carry the time of the shift's last interaction
+            day = int(seconds_after_start // DAY_DURATION.total_seconds())
+            operations.append(
+                (
+                    "clean",
+                    (
+                        get_well_plate(clean_info["well_category"]),
+                        clean_info["well_number"],
+                        clean_info["clean_ul"],
+                        clean_deadline_secs(day, clean_info["shift"]),
+                    ),
+                )
+            )
+        elif event["type"] == "wait_for_continue":
+            operations.append(("wait_for_continue", (event["resume_at"],)))
+        elif event["type"] == "end_of_day_restock":
+            operations.append(("end_of_day_restock", ()))
+        else:
+            raise ValueError(f"unexpected event type {event['type']}")
+    return operations
 
-template = Path("ScheduleToScriptTemplate.py").read_text()
 
-script_output_path.write_text(
-    """
-################################################################
-### THIS SCRIPT WAS MACHINE GENERATED. DO NOT EDIT IT BY HAND. #
-################################################################
+def render_operation(name: str, args: tuple) -> str:
+    # json.dumps keeps the double quoted strings valid Python literals
+    rendered_args = ", ".join(
+        json.dumps(arg) if isinstance(arg, str) else repr(arg) for arg in args
+    )
+    return f"    simulation.{name}({rendered_args})"
 
-"""
-    + template
-    + "\n"
-    + "\n".join(generated_lines)
-)
+
+def set_template_constant(template: str, name: str, value) -> str:
+    # Matches a one line assignment or a dict or list spanning up to its
+    # closing bracket at the start of a line
+    pattern = re.compile(
+        rf"^{name} = (\{{\n.*?^\}}|\[\n.*?^\]|.*?)$", re.MULTILINE | re.DOTALL
+    )
+    if not pattern.search(template):
+        raise ValueError(f"template has no constant {name}")
+    return pattern.sub(lambda _: f"{name} = {value!r}", template, count=1)
+
+
+def render_script(
+    operations: list[tuple[str, tuple]],
+    template_constants: dict | None = None,
+    template_path: Path = TEMPLATE_PATH,
+) -> str:
+    generated_lines = [render_operation(name, args) for name, args in operations]
+    template_constants = template_constants or {}
+    # A checkpoint only resumes under the same events, layout, time scale and
+    # so on; resuming is the one setting allowed to differ
+    hashed_constants = [
+        f"{name} = {value!r}"
+        for name, value in sorted(template_constants.items())
+        if name != "RESUME_FROM_CHECKPOINT"
+    ]
+    template_constants = {
+        "SCHEDULE_HASH": hashlib.sha256(
+            "\n".join([*hashed_constants, *generated_lines]).encode()
+        ).hexdigest(),
+        **template_constants,
+    }
+    template = template_path.read_text()
+    for name, value in template_constants.items():
+        template = set_template_constant(template, name, value)
+    # The operation log is flushed and closed however the run ends
+    body = ["    try:", *("    " + line for line in generated_lines), "    finally:", "        simulation.close()"]
+    return GENERATED_HEADER + template + "\n" + "\n".join(body)
+
+
+def quantize_secs(seconds: float, resolution_secs: float) -> float:
+    if resolution_secs <= 0:
+        return seconds
+    return round(round(seconds / resolution_secs) * resolution_secs, 6)
+
+
+def peephole_optimize(
+    operations: list[tuple[str, tuple]], sleep_resolution_secs: float = 0.0
+) -> list[tuple[str, tuple]]:
+    # Comments ride along as the message of the sleep next to them, or are
+    # joined into one comment before any other operation. A sleep to a time
+    # that has already passed does nothing, so only sleeps that move the
+    # schedule clock forward are kept, and of back to back sleeps only the last.
+    optimized = []
+    comments = []
+    slept_until = 0.0
+
+    def flush_comments():
+        if not comments:
+            return
+        if optimized and optimized[-1][0] == "sleep_seconds_after_start":
+            name, args = optimized.pop()
+            optimized.append((name, (args[0], "; ".join([*args[1:], *comments]))))
+        else:
+            optimized.append(("comment", ("; ".join(comments),)))
+        comments.clear()
+
+    for name, args in operations:
+        if name == "comment":
+            comments.append(args[0])
+        elif name == "sleep_seconds_after_start":
+            seconds_after_start = quantize_secs(args[0], sleep_resolution_secs)
+            if seconds_after_start <= slept_until:
+                continue
+            if optimized and optimized[-1][0] == "sleep_seconds_after_start":
+                comments[:0] = optimized.pop()[1][1:]
+            slept_until = seconds_after_start
+            if comments:
+                optimized.append((name, (seconds_after_start, "; ".join(comments))))
+                comments.clear()
+            else:
+                optimized.append((name, (seconds_after_start,)))
+        else:
+            flush_comments()
+            optimized.append((name, args))
+            if name == "wait_for_continue":
+                slept_until = max(slept_until, args[0])
+    flush_comments()
+    return optimized
+
+
+def command_count_report(operations: list, optimized_operations: list) -> str:
+    before = Counter(name for name, _ in operations)
+    after = Counter(name for name, _ in optimized_operations)
+    removed = len(operations) - len(optimized_operations)
+    return (
+        f"Generated commands: {len(operations)} in schedule order, "
+        f"{len(optimized_operations)} optimized (removed {removed}: "
+        f"{before['comment'] - after['comment']} comments, "
+        f"{before['sleep_seconds_after_start'] - after['sleep_seconds_after_start']} sleeps)"
+    )
+
+
+def schedule_operations(
+    events: list[dict],
+    sleep_resolution_secs: float | None = 1.0,
+) -> list[tuple[str, tuple]]:
+    # sleep_resolution_secs=None skips the peephole pass
+    operations = events_to_operations(events)
+    if sleep_resolution_secs is not None:
+        operations = peephole_optimize(operations, sleep_resolution_secs)
+    return operations
+
+
+def compile_schedule(
+    events: list[dict],
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    resume: bool = False,
+    time_scale: float = 1.0,
+    log_verbosity: int = 1,
+    sleep_resolution_secs: float | None = 1.0,
+    shed_rules: list[dict] | None = None,
+) -> tuple[str, list[tuple[str, tuple]]]:
+    if time_scale <= 0:
+        raise ValueError(f"time scale must be positive, got {time_scale}")
+    operations = schedule_operations(events, sleep_resolution_secs)
+    template_constants = {
+        "DECK_LAYOUT": layout,
+        "RESUME_FROM_CHECKPOINT": resume,
+        "TIME_SCALE": time_scale,
+        "LOG_VERBOSITY": log_verbosity,
+        "MEDIA_LEVEL_TABLE": level_table(MEDIA_TUBE_UL),
+        "SHED_RULES": shed_rules or [],
+        "NEAREST_TIPRACK": nearest_tiprack_saves(operations, TravelModel(layout)),
+        **simulation_constants(),
+    }
+    return render_script(operations, template_constants), operations
+
+
+def compile_schedule_json(
+    events: list[dict],
+    layout: dict = DEFAULT_DECK_LAYOUT,
+    time_scale: float = 1.0,
+    sleep_resolution_secs: float | None = 1.0,
+) -> tuple[str, list[tuple[str, tuple]]]:
+    if time_scale <= 0:
+        raise ValueError(f"time scale must be positive, got {time_scale}")
+    operations = schedule_operations(events, sleep_resolution_secs)
+    protocol = compile_json_protocol(
+        operations, layout, time_scale, nearest_tiprack_saves(operations, TravelModel(layout))
+    )
+    return json.dumps(protocol, indent="    "), operations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile a simulation schedule into an Opentrons protocol"
+    )
+    parser.add_argument(
+        "events_json_log_path",
+        nargs="?",
+        type=Path,
+        default=Path("simulation_events.json"),
+    )
+    parser.add_argument(
+        "script_output_path", nargs="?", type=Path, default=Path("GeneratedScript.py")
+    )
+    parser.add_argument(
+        "--layout",
+        type=Path,
+        help="deck layout JSON written by DeckLayoutOptimizer.py",
+    )
+    parser.add_argument(
+        "--day",
+        type=int,
+        help="compile only this day, starting at 0, with the script's clock starting at the day",
+    )
+    parser.add_argument("--shift", help="compile only this shift of --day")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an aborted run of the same schedule from its checkpoint",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="multiply the schedule and all waits by this, e.g. 0.05 for a dry run",
+    )
+    parser.add_argument(
+        "--log-verbosity",
+        type=int,
+        choices=[0, 1, 2],
+        default=1,
+        help="0 for no operation log, 2 to also comment on every media fill well",
+    )
+    parser.add_argument(
+        "--keep-commands",
+        action="store_true",
+        help="skip merging comments and dropping or coalescing redundant sleeps",
+    )
+    parser.add_argument(
+        "--sleep-resolution",
+        type=float,
+        default=1.0,
+        help="round sleep targets to this many seconds, 0 to keep them exact",
+    )
+    parser.add_argument(
+        "--shed-load",
+        nargs="?",
+        type=Path,
+        const=True,
+        metavar="RULES_JSON",
+        help="defer or drop events once the run falls behind, by the default rules or a JSON list of them",
+    )
+    parser.add_argument(
+        "--target",
+        choices=["python", "json"],
+        default="python",
+        help="json writes a static Opentrons JSON protocol, with schedule waits estimated ahead of time",
+    )
+    args = parser.parse_args()
+    if args.target == "json" and args.resume:
+        parser.error("--resume needs the checkpoints only the python target keeps")
+    if args.target == "json" and args.shed_load:
+        parser.error("--shed-load decides at run time, which a static JSON protocol cannot")
+    if args.shift is not None and args.day is None:
+        parser.error("--shift needs --day")
+
+    layout = DEFAULT_DECK_LAYOUT
+    if args.layout is not None:
+        layout = json.loads(args.layout.read_text())
+
+    reader = ScheduleReader(args.events_json_log_path)
+    events = list(reader if args.day is None else reader.day_events(args.day, args.shift))
+    sleep_resolution_secs = None if args.keep_commands else args.sleep_resolution
+    shed_rules = None
+    if args.shed_load is True:
+        shed_rules = DEFAULT_SHED_RULES
+    elif args.shed_load is not None:
+        shed_rules = json.loads(args.shed_load.read_text())
+    if args.target == "json":
+        script, operations = compile_schedule_json(
+            events,
+            layout=layout,
+            time_scale=args.time_scale,
+            sleep_resolution_secs=sleep_resolution_secs,
+        )
+    else:
+        script, operations = compile_schedule(
+            events,
+            layout=layout,
+            resume=args.resume,
+            time_scale=args.time_scale,
+            log_verbosity=args.log_verbosity,
+            sleep_resolution_secs=sleep_resolution_secs,
+            shed_rules=shed_rules,
+        )
+    args.script_output_path.write_text(script)
+
+    print(travel_report(operations, TravelModel(layout)))
+    print(command_count_report(events_to_operations(events), operations))
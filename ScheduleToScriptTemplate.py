@@ -1,5 +1,11 @@
 from opentrons import protocol_api
+from opentrons.protocol_api.labware import OutOfTipsError
 from datetime import datetime, timedelta
+import bisect
+import functools
+import json
+import math
+import os
 
 metadata = {
     "protocolName": "Generated Hospital Simulation",
@@ -8,24 +14,138 @@ metadata = {
     "apiLevel": "2.14",
 }
 
-# TODO: Get from generated schedule
+# Replaced by ScheduleToScript.py from SimulationConstants.py
 INITIAL_MEDIA_UL = 250
+MEDIA_TUBE_UL = 50000
 BACTERIA_TRANSFER_SETTLE_WAIT_SECS = 30
 BLEACH_CONTACT_WAIT_SECS = 30
 BLEACH_MIX_UL = 200
 MIX_REPITITIONS = 4
+MODULE_TEMPERATURE_C = 37
+FILLED_WELL_COUNTS = {"patient": 20, "staff": 54, "equipment": 20, "surface": 60}
+# Scales the schedule and every wait for dry runs, set by ScheduleToScript.py
+# --time-scale. Liquid handling still runs at full speed.
+TIME_SCALE = 1.0
+# [media volume (uL), aspiration height above the tube bottom (mm)] pairs
+# just below the meniscus, replaced by ScheduleToScript.py from LiquidLevel.py
+MEDIA_LEVEL_TABLE = [
+    [0, 1.0], [500, 8.4], [1000, 11.0], [1500, 12.9], [2000, 14.4], [2500, 15.7],
+    [3000, 16.8], [3500, 17.8], [4000, 18.7], [4500, 19.5], [5000, 20.4], [5500, 21.2],
+    [6000, 22.0], [6500, 22.8], [7000, 23.7], [7500, 24.5], [8000, 25.3], [8500, 26.1],
+    [9000, 27.0], [9500, 27.8], [10000, 28.6], [10500, 29.4], [11000, 30.2], [11500, 31.1],
+    [12000, 31.9], [12500, 32.7], [13000, 33.5], [13500, 34.4], [14000, 35.2], [14500, 36.0],
+    [15000, 36.8], [15500, 37.7], [16000, 38.5], [16500, 39.3], [17000, 40.1], [17500, 40.9],
+    [18000, 41.8], [18500, 42.6], [19000, 43.4], [19500, 44.2], [20000, 45.1], [20500, 45.9],
+    [21000, 46.7], [21500, 47.5], [22000, 48.4], [22500, 49.2], [23000, 50.0], [23500, 50.8],
+    [24000, 51.6], [24500, 52.5], [25000, 53.3], [25500, 54.1], [26000, 54.9], [26500, 55.8],
+    [27000, 56.6], [27500, 57.4], [28000, 58.2], [28500, 59.1], [29000, 59.9], [29500, 60.7],
+    [30000, 61.5], [30500, 62.3], [31000, 63.2], [31500, 64.0], [32000, 64.8], [32500, 65.6],
+    [33000, 66.5], [33500, 67.3], [34000, 68.1], [34500, 68.9], [35000, 69.8], [35500, 70.6],
+    [36000, 71.4], [36500, 72.2], [37000, 73.0], [37500, 73.9], [38000, 74.7], [38500, 75.5],
+    [39000, 76.3], [39500, 77.2], [40000, 78.0], [40500, 78.8], [41000, 79.6], [41500, 80.5],
+    [42000, 81.3], [42500, 82.1], [43000, 82.9], [43500, 83.7], [44000, 84.6], [44500, 85.4],
+    [45000, 86.2], [45500, 87.0], [46000, 87.9], [46500, 88.7], [47000, 89.5], [47500, 90.3],
+    [48000, 91.2], [48500, 92.0], [49000, 92.8], [49500, 93.6], [50000, 94.4],
+]
+# Deck slot of each piece of labware, replaced by ScheduleToScript.py --layout
+DECK_LAYOUT = {
+    "patient": "10",
+    "staff": "7",
+    "equipment": "8",
+    "surface": "11",
+    "reservoir": "3",
+    "tipracks": ["6", "5", "4", "1", "2", "9"],
+}
+# Whether tips come from the nearest rack rather than rack by rack, replaced by
+# ScheduleToScript.py with whichever its travel model says is shorter
+NEAREST_TIPRACK = True
+# Progress is saved here after every event so an aborted run can be resumed
+CHECKPOINT_PATH = "/data/user_storage/hospital_simulation_checkpoint.json"
+# One JSON line per operation with its start and end time, tips and volumes
+OPERATION_LOG_PATH = "/data/user_storage/hospital_simulation_operations.jsonl"
+# 0 logs nothing, 1 logs operations, 2 also comments on every well media fill.
+# Set by ScheduleToScript.py --log-verbosity
+LOG_VERBOSITY = 1
+# Set by ScheduleToScript.py --resume to continue from the checkpoint
+RESUME_FROM_CHECKPOINT = False
+# Identifies the compiled event list and settings, so a checkpoint is never
+# resumed against a different schedule, deck layout or time scale
+SCHEDULE_HASH = ""
+# What to do with events once the run falls behind, set by ScheduleToScript.py
+# --shed-load. The first rule whose operation, plates and volume match an event
+# at least late_secs past when it is due decides: "defer" runs it later in the slack before a
+# sleep, "drop" skips it. No rules keeps every event on the schedule.
+SHED_RULES = []
+# Slack needed before a deferred operation is run instead of sleeping
+DEFERRED_OPERATION_SECS = {"transfer": 150, "clean": 120}
+# Operations the shedding policy may defer, undecorated by simulation_event
+SHEDDABLE_OPERATIONS = {}
+
+
+def simulation_event(operation):
+    # Counts the generated calls so a resumed run can skip the completed ones
+    def run_event(self, *args):
+        self.event_index += 1
+        if self.event_index <= self.last_completed_event_index:
+            return
+        operation(self, *args)
+        self.last_completed_event_index = self.event_index
+        self.save_checkpoint()
+
+    return run_event
+
+
+def sheddable(operation):
+    # Asks the shedding policy first, so a late event can be dropped or deferred
+    SHEDDABLE_OPERATIONS[operation.__name__] = operation
+
+    @functools.wraps(operation)
+    def run_sheddable(self, *args):
+        if operation.__name__ == "transfer":
+            self.run_overdue_cleans()
+        else:
+            self.run_deferred_transfers(args[0], args[1])
+        if self.shed(operation.__name__, args):
+            return
+        operation(self, *args)
+
+    return run_sheddable
+
+
+def instrumented(operation):
+    # Records how long each operation took in the operation log
+    @functools.wraps(operation)
+    def run_instrumented(self, *args, **kwargs):
+        start = datetime.now().timestamp()
+        operation(self, *args, **kwargs)
+        self.log_operation(operation.__name__, start, [*args, *kwargs.values()])
+
+    return run_instrumented
 
 
 class HospitalSimulation:
     def __init__(self, protocol: protocol_api.ProtocolContext):
         self.protocol = protocol
+        self.event_index = -1
+        self.last_completed_event_index = -1
+        # Schedule seconds the current event is due at
+        self.deadline_secs = 0.0
+        self.deferred = []
+        self.reset_timing_report()
+        self.operation_log = None
+        if LOG_VERBOSITY >= 1 and not self.protocol.is_simulating():
+            self.operation_log = open(OPERATION_LOG_PATH, "a", buffering=1)
         self.setup_labware()
         self.setup_pipettes()
         self.setup_reagents()
 
     def setup_labware(self):
-        temp_module = self.protocol.load_module("temperature module", "10")
-        temp_module2 = self.protocol.load_module("temperature module", "7")
+        temp_module = self.protocol.load_module(
+            "temperature module", DECK_LAYOUT["patient"]
+        )
+        temp_module2 = self.protocol.load_module(
+            "temperature module", DECK_LAYOUT["staff"]
+        )
         assert isinstance(temp_module, protocol_api.TemperatureModuleContext)
         self.temp_module = temp_module
         self.temp_module2 = temp_module2
@@ -36,32 +156,18 @@ class HospitalSimulation:
             "corning_96_wellplate_360ul_flat"
         )
         self.equipment_plate = self.protocol.load_labware(
-            "corning_96_wellplate_360ul_flat", "8", "Equipment Plate"
+            "corning_96_wellplate_360ul_flat", DECK_LAYOUT["equipment"], "Equipment Plate"
         )
         self.surface_plate = self.protocol.load_labware(
-            "corning_96_wellplate_360ul_flat", "11", "Surface Plate"
-        )
-        self.tiprack_300_one = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "6"
-        )
-        self.tiprack_300_two = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "5"
-        )
-        self.tiprack_300_three = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "4"
-        )
-        self.tiprack_300_four = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "1"
-        )
-        self.tiprack_300_five = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "2"
-        )
-        self.tiprack_300_six = self.protocol.load_labware(
-            "opentrons_96_tiprack_300ul", "9"
+            "corning_96_wellplate_360ul_flat", DECK_LAYOUT["surface"], "Surface Plate"
         )
         self.reservoir = self.protocol.load_labware(
-            "opentrons_6_tuberack_falcon_50ml_conical", "3"
+            "opentrons_6_tuberack_falcon_50ml_conical", DECK_LAYOUT["reservoir"]
         )
+        self.tipracks = [
+            self.protocol.load_labware("opentrons_96_tiprack_300ul", slot)
+            for slot in DECK_LAYOUT["tipracks"]
+        ]
         self.plates_dict = {
             "patient": self.patient_plate,
             "staff": self.staff_plate,
@@ -73,15 +179,12 @@ class HospitalSimulation:
         self.p300 = self.protocol.load_instrument(
             "p300_single_gen2",
             "right",
-            tip_racks=[
-                self.tiprack_300_one,
-                self.tiprack_300_two,
-                self.tiprack_300_three,
-                self.tiprack_300_four,
-                self.tiprack_300_five,
-                self.tiprack_300_six,
-            ],
+            tip_racks=self.tipracks,
         )
+        # Where the head was left after returning the last tip
+        self.head_location = None
+        # Tracked here rather than by the pipette so a checkpoint can restore it
+        self.used_tips = [set() for _ in self.tipracks]
 
     def setup_reagents(self):
         self.media = self.reservoir.wells()[0]
@@ -91,56 +194,112 @@ class HospitalSimulation:
 
     def initialize(self):
         self.protocol.comment("Starting simulation setup...")
-        self.temp_module.set_temperature(37)
-        self.temp_module2.set_temperature(37)
+        self.temp_module.set_temperature(MODULE_TEMPERATURE_C)
+        self.temp_module2.set_temperature(MODULE_TEMPERATURE_C)
+        # The simulator has no checkpoint to read, so it checks the whole run
+        if RESUME_FROM_CHECKPOINT and not self.protocol.is_simulating():
+            self.load_checkpoint()
+            return
         self.fill_all_wells_with_media(iterations=1)
         self.start_time = datetime.now()
+        self.save_checkpoint()
+
+    def save_checkpoint(self):
+        if self.protocol.is_simulating():
+            return
+        checkpoint = {
+            "schedule_hash": SCHEDULE_HASH,
+            "last_completed_event_index": self.last_completed_event_index,
+            "start_epoch": self.start_time.timestamp(),
+            "used_tips": [sorted(used_tips) for used_tips in self.used_tips],
+            "source_well_volume": self.source_well_volume,
+            "deadline_secs": self.deadline_secs,
+            "deferred": self.deferred,
+        }
+        # Write then rename, so a crash mid write leaves the last checkpoint intact
+        temporary_path = CHECKPOINT_PATH + ".tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, CHECKPOINT_PATH)
+
+    def load_checkpoint(self):
+        with open(CHECKPOINT_PATH) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint["schedule_hash"] != SCHEDULE_HASH:
+            raise ValueError("checkpoint was saved by a different generated schedule")
 
+        self.last_completed_event_index = checkpoint["last_completed_event_index"]
+        # Sleeps line up with the original run instead of starting the clock over
+        self.start_time = datetime.fromtimestamp(checkpoint["start_epoch"])
+        self.used_tips = [set(used_tips) for used_tips in checkpoint["used_tips"]]
+        self.source_well_volume = checkpoint["source_well_volume"]
+        self.deadline_secs = checkpoint["deadline_secs"]
+        self.deferred = [(name, tuple(args)) for name, args in checkpoint["deferred"]]
+        self.protocol.comment(
+            f"Resuming after event {self.last_completed_event_index} "
+            f"of the run started {self.start_time} (start epoch {checkpoint['start_epoch']})"
+        )
+
+    def close(self):
+        if self.operation_log is not None:
+            self.operation_log.close()
+            self.operation_log = None
+
+    def log_operation(self, name, start, args):
+        if self.operation_log is None:
+            return
+        record = {
+            "op": name,
+            "event": self.event_index,
+            "start": round(start, 3),
+            "end": round(datetime.now().timestamp(), 3),
+            "tips": sum(len(used_tips) for used_tips in self.used_tips),
+            "media_ul": self.source_well_volume,
+            "args": args,
+        }
+        self.operation_log.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    @instrumented
     def fill_all_wells_with_media(self, iterations=1):
         self.protocol.comment("Filling all wells with initial media...")
         source_well = self.media
-        self.source_well_volume = 50000  # 50 ml reservoir
+        self.source_well_volume = MEDIA_TUBE_UL
 
         all_target_wells = [
-            *self.patient_plate.wells()[:20],
-            *self.staff_plate.wells()[: (6 * 3 + 12 * 3)],
-            *self.equipment_plate.wells()[:20],
-            *self.surface_plate.wells()[:60],
+            well
+            for plate, well_count in FILLED_WELL_COUNTS.items()
+            for well in self.plates_dict[plate].wells()[:well_count]
         ]
 
         for i in range(iterations):
-            self.p300.pick_up_tip()  # Pick up a new tip at the start of each iteration
+            self.pick_up_tip(source_well)  # Pick up a new tip at the start of each iteration
             for well in all_target_wells:
-                aspiration_zone = self.determine_media_aspiration_zone()
-                if aspiration_zone == "bottom":
-                    source_well_aspiration_zone = source_well
-                else:
-                    source_well_aspiration_zone = source_well.top(aspiration_zone)
-
                 self.p300.transfer(
                     INITIAL_MEDIA_UL,
-                    source_well_aspiration_zone,
+                    self.media_aspiration_location(),
                     well,
                     new_tip="never",
                 )
                 self.p300.blow_out()
                 self.source_well_volume -= INITIAL_MEDIA_UL
-                self.protocol.comment(f"Remaining volume: {self.source_well_volume}")
-                self.protocol.comment(f"Aspiration zone: {aspiration_zone}")
+                if LOG_VERBOSITY >= 2:
+                    self.protocol.comment(f"Remaining volume: {self.source_well_volume}")
+                    self.protocol.comment(
+                        f"Aspiration height: {self.media_aspiration_height_mm()} mm"
+                    )
 
                 if self.source_well_volume <= 0:
                     self.p300.drop_tip()  # Drop the tip before pausing
                     self.p300.home()
                     self.protocol.pause("No liquid in media reservoir. Please refill.")
-                    self.source_well_volume = 50000  # Reset volume after refill
-                    self.p300.pick_up_tip()  # Pick up a new tip after refilling
+                    self.source_well_volume = MEDIA_TUBE_UL  # Reset volume after refill
+                    self.pick_up_tip(source_well)  # Pick up a new tip after refilling
 
             self.p300.mix(MIX_REPITITIONS, BLEACH_MIX_UL, self.bleach.top(-40))
             self.p300.blow_out(self.bleach.top())
-            self.protocol.delay(
-                BLEACH_CONTACT_WAIT_SECS,
-                msg=f"Waiting {BLEACH_CONTACT_WAIT_SECS} seconds for bleach contact",
-            )
+            self.scaled_delay(BLEACH_CONTACT_WAIT_SECS, "for bleach contact")
             self.p300.return_tip()  # Drop the tip at the end of each iteration
             # self.p300.drop_tip()
             self.p300.home()
@@ -154,26 +313,207 @@ class HospitalSimulation:
             "Media distribution complete. Please manually add initial bacteria to the first well of the patient plate, then resume the protocol."
         )
 
-    def determine_media_aspiration_zone(self):
-        if self.source_well_volume <= 10000:
-            return 'bottom'
-        elif self.source_well_volume<= 20000:
-            return -97
-        elif self.source_well_volume<= 30000:
-            return -76
-        elif self.source_well_volume<= 40000:
-            return -59
-        else:
-            return -40 
+    def media_aspiration_height_mm(self):
+        # The largest tabulated volume not above the current one, so the tip
+        # always ends up under the meniscus
+        volumes = [volume_ul for volume_ul, _ in MEDIA_LEVEL_TABLE]
+        index = max(bisect.bisect_right(volumes, self.source_well_volume) - 1, 0)
+        return MEDIA_LEVEL_TABLE[index][1]
+
+    def media_aspiration_location(self):
+        return self.media.bottom(self.media_aspiration_height_mm())
+
+    def travel_mm(self, start, end):
+        return math.dist((start.x, start.y), (end.x, end.y))
+
+    def pick_up_tip(self, first_stop):
+        # Take the next tip from whichever rack adds the least travel on the way
+        # to the first well of the operation, or from the first rack with tips
+        next_tips = {}
+        for rack_index, rack in enumerate(self.tipracks):
+            for well in rack.wells():
+                if well.well_name not in self.used_tips[rack_index]:
+                    next_tips[rack_index] = well
+                    break
+        if not next_tips:
+            raise OutOfTipsError
+
+        first_stop_point = first_stop.top().point
+
+        def tip_detour(rack_index):
+            tip_point = next_tips[rack_index].top().point
+            detour = self.travel_mm(tip_point, first_stop_point)
+            if self.head_location is not None:
+                detour += self.travel_mm(self.head_location, tip_point)
+            return detour
+
+        rack_index = min(next_tips, key=tip_detour) if NEAREST_TIPRACK else min(next_tips)
+        tip = next_tips[rack_index]
+        self.p300.pick_up_tip(tip)
+        self.used_tips[rack_index].add(tip.well_name)
+        self.head_location = tip.top().point
+
+    def scaled_delay(self, seconds, reason):
+        seconds *= TIME_SCALE
+        self.protocol.delay(seconds, msg=f"Waiting {seconds:g} seconds {reason}")
 
-    def sleep_seconds_after_start(self, seconds_after_start):
-        sleep_until = self.start_time + timedelta(seconds=seconds_after_start)
+    def delay_until(self, seconds_after_start, message=None):
+        self.deadline_secs = seconds_after_start
+        sleep_until = self.start_time + timedelta(
+            seconds=seconds_after_start * TIME_SCALE
+        )
         sleep_seconds = (sleep_until - datetime.now()).total_seconds()
-        self.protocol.delay(sleep_seconds, msg=f"Sleeping until next interaction")
+        # Catch up on deferred events while there is time to spare
+        while self.deferred and sleep_seconds >= DEFERRED_OPERATION_SECS[self.deferred[0][0]]:
+            name, args = self.deferred.pop(0)
+            self.protocol.comment(f"Running deferred {name}{tuple(args)}")
+            SHEDDABLE_OPERATIONS[name](self, *args)
+            sleep_seconds = (sleep_until - datetime.now()).total_seconds()
+        if sleep_seconds <= 0:
+            if sleep_seconds < 0:
+                # The robot could not move fast enough to keep up with the schedule
+                self.late_event_count += 1
+                self.late_secs += -sleep_seconds
+                self.worst_lateness = max(
+                    self.worst_lateness, (-sleep_seconds, self.event_index)
+                )
+            if message is not None:
+                self.protocol.comment(message)
+            return
+        self.waited_secs += sleep_seconds
+        msg = "Sleeping until next interaction"
+        if message is not None:
+            msg += f": {message}"
+        self.protocol.delay(sleep_seconds, msg=msg)
+
+    def reset_timing_report(self):
+        self.waited_secs = 0.0
+        self.late_event_count = 0
+        self.late_secs = 0.0
+        self.worst_lateness = (0.0, None)
+        self.shed_counts = {"defer": 0, "drop": 0}
+
+    def lateness_secs(self, due_secs):
+        # In schedule seconds, like the rules' late_secs
+        deadline = self.start_time + timedelta(seconds=due_secs * TIME_SCALE)
+        return (datetime.now() - deadline).total_seconds() / TIME_SCALE
+
+    def shed_rule(self, name, args, lateness_secs):
+        if name == "transfer":
+            plates = {args[0], args[1]}
+            volume_ul = args[4]
+        else:
+            plates = {args[0]}
+            volume_ul = args[2]
+        for rule in SHED_RULES:
+            if (
+                rule["operation"] == name
+                and lateness_secs >= rule.get("late_secs", 0)
+                and plates <= set(rule.get("plates", plates))
+                and volume_ul <= rule.get("max_ul", volume_ul)
+            ):
+                return rule
+        return None
+
+    def shed(self, name, args):
+        if not SHED_RULES:
+            return False
+        # Interactions are due at their sleep, cleans by the end of their cleaning window
+        lateness_secs = self.lateness_secs(args[3] if name == "clean" else self.deadline_secs)
+        rule = self.shed_rule(name, args, lateness_secs)
+        if rule is None:
+            return False
+        action = rule["action"]
+        if action == "defer":
+            self.deferred.append((name, args))
+        self.shed_counts[action] += 1
+        verb = "Deferring" if action == "defer" else "Dropping"
+        self.protocol.comment(
+            f"{verb} {name}{tuple(args)}, running {timedelta(seconds=round(lateness_secs))} late"
+        )
+        self.log_shed(action, name, args, lateness_secs=round(lateness_secs, 3))
+        return True
 
+    def log_shed(self, action, name, args, **details):
+        if self.operation_log is None:
+            return
+        record = {
+            "op": "shed",
+            "event": self.event_index,
+            "action": action,
+            "name": name,
+            **details,
+            "args": list(args),
+        }
+        self.operation_log.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def run_deferred_transfers(self, well_plate, well_number):
+        # A deferred contact with a well runs before the well is cleaned, not after
+        touching = [
+            (name, args)
+            for name, args in self.deferred
+            if name == "transfer" and (well_plate, well_number) in ((args[0], args[2]), (args[1], args[3]))
+        ]
+        for name, args in touching:
+            self.deferred.remove((name, args))
+            self.protocol.comment(f"Running deferred {name}{tuple(args)} before cleaning its well")
+            SHEDDABLE_OPERATIONS[name](self, *args)
+
+    def drop_deferred(self):
+        # Nothing deferred carries over into the next day and its tips
+        for name, args in self.deferred:
+            self.shed_counts["drop"] += 1
+            self.protocol.comment(f"Dropping deferred {name}{tuple(args)} at the end of the day")
+            self.log_shed("drop", name, args, reason="end of day")
+        self.deferred = []
+
+    def run_overdue_cleans(self):
+        # Cleans deferred past their shift run before the next shift's contacts
+        overdue = [
+            (name, args)
+            for name, args in self.deferred
+            if name == "clean" and args[3] <= self.deadline_secs
+        ]
+        for name, args in overdue:
+            self.deferred.remove((name, args))
+            self.run_deferred_transfers(args[0], args[1])
+            self.protocol.comment(f"Running deferred {name}{tuple(args)} before the next shift")
+            SHEDDABLE_OPERATIONS[name](self, *args)
+
+    def report_timing(self):
+        if self.protocol.is_simulating():
+            # Simulated time stands still, so the numbers would be meaningless
+            return
+        report = f"Waited {timedelta(seconds=round(self.waited_secs))} for the schedule"
+        if self.late_event_count:
+            worst_secs, worst_event_index = self.worst_lateness
+            report += (
+                f", {self.late_event_count} events started late by "
+                f"{timedelta(seconds=round(self.late_secs))} in total "
+                f"(worst {timedelta(seconds=round(worst_secs))} at event {worst_event_index}). "
+                "Motion, not waiting, is the bottleneck"
+            )
+        if any(self.shed_counts.values()):
+            report += (
+                f". Deferred {self.shed_counts['defer']} and dropped "
+                f"{self.shed_counts['drop']} events to keep up, "
+                f"{len(self.deferred)} still deferred"
+            )
+        self.protocol.comment(report)
+        self.reset_timing_report()
+
+    @simulation_event
+    @instrumented
+    def sleep_seconds_after_start(self, seconds_after_start, message=None):
+        self.delay_until(seconds_after_start, message)
+
+    @simulation_event
     def comment(self, comment):
         self.protocol.comment(comment)
 
+    @simulation_event
+    @sheddable
+    @instrumented
     def transfer(
         self,
         source_well_plate: str,
@@ -182,60 +522,58 @@ class HospitalSimulation:
         target_well_number: int,
         transfer_ul: int | float,
     ):
-        self.p300.pick_up_tip()
         source_well = self.plates_dict[source_well_plate].wells()[source_well_number]
         target_well = self.plates_dict[target_well_plate].wells()[target_well_number]
+        self.pick_up_tip(source_well)
         self.p300.transfer(transfer_ul, source_well, target_well, new_tip="never")
-        self.protocol.delay(
-            BACTERIA_TRANSFER_SETTLE_WAIT_SECS,
-            msg=f"Waiting for {target_well} bacteria to settle",
+        self.scaled_delay(
+            BACTERIA_TRANSFER_SETTLE_WAIT_SECS, f"for {target_well} bacteria to settle"
         )
         self.p300.transfer(transfer_ul, target_well, source_well, new_tip="never")
         self.p300.mix(MIX_REPITITIONS, BLEACH_MIX_UL, self.bleach.top(-40))
         self.p300.blow_out(self.bleach.top())
-        self.protocol.delay(
-                BLEACH_CONTACT_WAIT_SECS,
-                msg=f"Waiting {BLEACH_CONTACT_WAIT_SECS} seconds for bleach contact",
-            )
+        self.scaled_delay(BLEACH_CONTACT_WAIT_SECS, "for bleach contact")
         self.p300.return_tip()
         # self.p300.drop_tip()
 
+    @simulation_event
+    @sheddable
+    @instrumented
     def clean(
         self,
         well_plate: str,
         well_number: int,
         clean_ul: int | float,
+        due_secs: float,
     ):
         cleaning_well = self.plates_dict[well_plate].wells()[well_number]
 
-        aspiration_zone = self.determine_media_aspiration_zone()
-        if aspiration_zone == "bottom":
-            media_well_aspiration_zone = self.media
-        else:
-            media_well_aspiration_zone = self.media.top(aspiration_zone)
-
-        self.p300.pick_up_tip()
+        self.pick_up_tip(self.media)
         self.p300.transfer(
-            clean_ul, media_well_aspiration_zone, cleaning_well, new_tip="never"
+            clean_ul, self.media_aspiration_location(), cleaning_well, new_tip="never"
         )
+        self.source_well_volume -= clean_ul
         # It's fine to reuse the pipette tip here
         self.p300.transfer(clean_ul, cleaning_well, self.waste.top(), new_tip="never")
         # TODO: Sleep during clean?
         self.p300.mix(MIX_REPITITIONS, BLEACH_MIX_UL, self.bleach.top(-40))
         self.p300.blow_out(self.bleach.top())
-        self.protocol.delay(
-                BLEACH_CONTACT_WAIT_SECS,
-                msg=f"Waiting {BLEACH_CONTACT_WAIT_SECS} seconds for bleach contact",
-            )
+        self.scaled_delay(BLEACH_CONTACT_WAIT_SECS, "for bleach contact")
         self.p300.return_tip()
 
+    @simulation_event
     def wait_for_continue(self, resume_at: int):
         self.protocol.pause("Pausing for maintenance")
-        self.sleep_seconds_after_start(resume_at)
+        self.delay_until(resume_at)
 
+    @simulation_event
+    @instrumented
     def end_of_day_restock(self):
+        self.drop_deferred()
+        self.report_timing()
         self.p300.reset_tipracks()
-        self.source_well_volume = 50000
+        self.used_tips = [set() for _ in self.tipracks]
+        self.source_well_volume = MEDIA_TUBE_UL
 
 
 def run(protocol: protocol_api.ProtocolContext):
@@ -0,0 +1,189 @@
+import argparse
+import math
+from pathlib import Path
+
+from LiquidLevel import level_table
+from ScheduleToScript import render_script
+from TravelCost import load_labware_definition
+
+
+TEMPLATE_PATH = Path(__file__).parent / "SerialDilutionTemplate.py"
+PLATE_LOAD_NAME = "opentronsappliedbiosystems_96_aluminumblock_200ul"
+TUBE_LOAD_NAME = "opentrons_24_aluminumblock_nest_1.5ml_snapcap"
+SAMPLE_LOAD_NAME = "opentrons_24_aluminumblock_nest_1.5ml_snapcap"
+# Filter tips hold less than the pipettes can
+TIP_CAPACITY_UL = {"p20": 20, "p300": 200}
+TIPS_PER_RACK = 96
+MEDIA_TUBE_UL = 50000
+# Extra diluent drawn for a multi-dispense so every dispense is accurate,
+# blown back into the media tube at the end
+DISPOSAL_UL = 10
+MIX_FRACTION = 0.8
+
+
+def snake_order(load_name: str) -> list[str]:
+    # Along the first row, back along the second and so on, so every next
+    # well is the closest one
+    ordering = load_labware_definition(load_name)["ordering"]
+    rows = [list(row) for row in zip(*ordering)]
+    return [
+        well_name
+        for row_index, row in enumerate(rows)
+        for well_name in (row if row_index % 2 == 0 else reversed(row))
+    ]
+
+
+def well_volume_ul(load_name: str) -> float:
+    definition = load_labware_definition(load_name)
+    return min(well["totalLiquidVolume"] for well in definition["wells"].values())
+
+
+def choose_labware(well_count: int, final_ul: float) -> str:
+    # The 96 well block when the dilutions fit in it, tubes for larger volumes
+    for load_name in [PLATE_LOAD_NAME, TUBE_LOAD_NAME]:
+        if final_ul <= well_volume_ul(load_name) and well_count <= len(snake_order(load_name)):
+            return load_name
+    raise ValueError(
+        f"{well_count} dilutions of {final_ul} µL fit neither {PLATE_LOAD_NAME} "
+        f"nor {TUBE_LOAD_NAME}"
+    )
+
+
+def prefill_batches(diluent_ul: float, well_names: list[str]) -> list[tuple[float, float, list[str]]]:
+    # (diluent per well, disposal, wells) for each aspiration from the media tube
+    wells_per_aspiration = int((TIP_CAPACITY_UL["p300"] - DISPOSAL_UL) // diluent_ul)
+    if wells_per_aspiration >= 2:
+        return [
+            (diluent_ul, DISPOSAL_UL, well_names[start : start + wells_per_aspiration])
+            for start in range(0, len(well_names), wells_per_aspiration)
+        ]
+    # More than a tip per well, so fill each well with as few full tips as possible
+    aspirations = math.ceil(diluent_ul / TIP_CAPACITY_UL["p300"])
+    return [
+        (diluent_ul / aspirations, 0, [well_name])
+        for well_name in well_names
+        for _ in range(aspirations)
+    ]
+
+
+def plan_dilutions(
+    samples: int,
+    dilution_factor: float,
+    depth: int,
+    final_ul: float,
+    tip_per_step: bool = False,
+) -> tuple[list[tuple[str, tuple]], dict]:
+    if dilution_factor <= 1:
+        raise ValueError(f"dilution factor must be above 1, got {dilution_factor}")
+    if samples > len(snake_order(SAMPLE_LOAD_NAME)):
+        raise ValueError(f"at most {len(snake_order(SAMPLE_LOAD_NAME))} samples fit the sample block")
+
+    transfer_ul = final_ul / dilution_factor
+    diluent_ul = final_ul - transfer_ul
+    pipette = "p20" if transfer_ul <= TIP_CAPACITY_UL["p20"] else "p300"
+    mix_ul = min(final_ul * MIX_FRACTION, TIP_CAPACITY_UL[pipette])
+    dilution_load_name = choose_labware(samples * depth, final_ul)
+    wells = snake_order(dilution_load_name)[: samples * depth]
+    sample_tubes = snake_order(SAMPLE_LOAD_NAME)[:samples]
+
+    # Diluent is dispensed from above, so a single tip fills every well
+    operations = [("comment", ("Prefilling diluent",)), ("pick_up_tip", ("p300",))]
+    for batch in prefill_batches(diluent_ul, wells):
+        operations.append(("prefill", batch))
+    operations.append(("drop_tip", ("p300",)))
+    tips = {"p20": 0, "p300": 1}
+
+    for sample_index, sample_tube in enumerate(sample_tubes):
+        series = wells[sample_index * depth : (sample_index + 1) * depth]
+        operations.append(("comment", (f"Diluting sample {sample_tube}",)))
+        # Working from the sample towards the most dilute well, one tip per series
+        # only ever carries liquid into a weaker dilution
+        source = ("samples", sample_tube)
+        for step, well_name in enumerate(series):
+            if step == 0 or tip_per_step:
+                operations.append(("pick_up_tip", (pipette,)))
+                tips[pipette] += 1
+            operations.append(("dilute", (pipette, *source, well_name, transfer_ul, mix_ul)))
+            if tip_per_step:
+                operations.append(("drop_tip", (pipette,)))
+            source = ("dilutions", well_name)
+        if tip_per_step:
+            operations.append(("pick_up_tip", (pipette,)))
+            tips[pipette] += 1
+        operations.append(("discard", (pipette, series[-1], transfer_ul)))
+        operations.append(("drop_tip", (pipette,)))
+
+    # The disposal volume goes back into the media tube
+    media_ul = diluent_ul * len(wells)
+    for pipette_name, tip_count in tips.items():
+        if tip_count > TIPS_PER_RACK:
+            raise ValueError(f"plan needs {tip_count} {pipette_name} tips, one rack holds {TIPS_PER_RACK}")
+    if media_ul > MEDIA_TUBE_UL:
+        raise ValueError(f"plan needs {media_ul:.0f} µL of diluent, the media tube holds {MEDIA_TUBE_UL}")
+
+    summary = {
+        "dilution_labware": dilution_load_name,
+        "wells": len(wells),
+        "transfer_ul": transfer_ul,
+        "diluent_ul": diluent_ul,
+        "pipette": pipette,
+        "tips": tips,
+        "media_ul": media_ul,
+    }
+    return operations, summary
+
+
+def compile_dilutions(
+    samples: int,
+    dilution_factor: float,
+    depth: int,
+    final_ul: float,
+    tip_per_step: bool = False,
+) -> tuple[str, list[tuple[str, tuple]], dict]:
+    operations, summary = plan_dilutions(samples, dilution_factor, depth, final_ul, tip_per_step)
+    template_constants = {
+        "DILUTION_LOAD_NAME": summary["dilution_labware"],
+        "SAMPLE_LOAD_NAME": SAMPLE_LOAD_NAME,
+        "MEDIA_TUBE_UL": MEDIA_TUBE_UL,
+        "MEDIA_LEVEL_TABLE": level_table(MEDIA_TUBE_UL),
+    }
+    script = render_script(operations, template_constants, TEMPLATE_PATH)
+    return script, operations, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plan serial dilutions and compile them into an Opentrons protocol"
+    )
+    parser.add_argument("samples", type=int)
+    parser.add_argument("dilution_factor", type=float)
+    parser.add_argument("depth", type=int, help="dilutions per sample")
+    parser.add_argument(
+        "script_output_path", nargs="?", type=Path, default=Path("GeneratedDilution.py")
+    )
+    parser.add_argument(
+        "--final-ul",
+        type=float,
+        default=1000,
+        help="volume in every dilution; 200 µL or less uses the 96 well block",
+    )
+    parser.add_argument(
+        "--tip-per-step",
+        action="store_true",
+        help="use a fresh tip for every dilution step instead of one per sample",
+    )
+    args = parser.parse_args()
+
+    script, operations, summary = compile_dilutions(
+        args.samples, args.dilution_factor, args.depth, args.final_ul, args.tip_per_step
+    )
+    args.script_output_path.write_text(script)
+    print(
+        f"{summary['wells']} dilutions in {summary['dilution_labware']}: "
+        f"{summary['transfer_ul']:.1f} µL into {summary['diluent_ul']:.1f} µL diluent "
+        f"with the {summary['pipette']}"
+    )
+    print(
+        f"Tips: {summary['tips']['p300']} p300, {summary['tips']['p20']} p20; "
+        f"diluent {summary['media_ul'] / 1000:.1f} mL"
+    )
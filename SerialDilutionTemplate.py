@@ -0,0 +1,133 @@
+from opentrons import protocol_api
+import bisect
+
+metadata = {
+    "protocolName": "Generated Serial Dilution",
+    "author": "Jonnathan Saavedra",
+    "description": "Serial dilutions planned by SerialDilutionPlanner.py",
+    "apiLevel": "2.14",
+}
+
+# Set by SerialDilutionPlanner.py from the number of samples and dilution depth
+DILUTION_LOAD_NAME = "opentrons_24_aluminumblock_nest_1.5ml_snapcap"
+DECK_LAYOUT = {
+    "dilutions": "1",
+    "samples": "2",
+    "reservoir": "3",
+    "p20_tiprack": "7",
+    "p300_tiprack": "11",
+}
+SAMPLE_LOAD_NAME = "opentrons_24_aluminumblock_nest_1.5ml_snapcap"
+MEDIA_TUBE_UL = 50000
+# [media volume (uL), aspiration height above the tube bottom (mm)] pairs
+# just below the meniscus, from LiquidLevel.py
+MEDIA_LEVEL_TABLE = [
+    [0, 1.0], [500, 8.4], [1000, 11.0], [1500, 12.9], [2000, 14.4], [2500, 15.7],
+    [3000, 16.8], [3500, 17.8], [4000, 18.7], [4500, 19.5], [5000, 20.4], [5500, 21.2],
+    [6000, 22.0], [6500, 22.8], [7000, 23.7], [7500, 24.5], [8000, 25.3], [8500, 26.1],
+    [9000, 27.0], [9500, 27.8], [10000, 28.6], [10500, 29.4], [11000, 30.2], [11500, 31.1],
+    [12000, 31.9], [12500, 32.7], [13000, 33.5], [13500, 34.4], [14000, 35.2], [14500, 36.0],
+    [15000, 36.8], [15500, 37.7], [16000, 38.5], [16500, 39.3], [17000, 40.1], [17500, 40.9],
+    [18000, 41.8], [18500, 42.6], [19000, 43.4], [19500, 44.2], [20000, 45.1], [20500, 45.9],
+    [21000, 46.7], [21500, 47.5], [22000, 48.4], [22500, 49.2], [23000, 50.0], [23500, 50.8],
+    [24000, 51.6], [24500, 52.5], [25000, 53.3], [25500, 54.1], [26000, 54.9], [26500, 55.8],
+    [27000, 56.6], [27500, 57.4], [28000, 58.2], [28500, 59.1], [29000, 59.9], [29500, 60.7],
+    [30000, 61.5], [30500, 62.3], [31000, 63.2], [31500, 64.0], [32000, 64.8], [32500, 65.6],
+    [33000, 66.5], [33500, 67.3], [34000, 68.1], [34500, 68.9], [35000, 69.8], [35500, 70.6],
+    [36000, 71.4], [36500, 72.2], [37000, 73.0], [37500, 73.9], [38000, 74.7], [38500, 75.5],
+    [39000, 76.3], [39500, 77.2], [40000, 78.0], [40500, 78.8], [41000, 79.6], [41500, 80.5],
+    [42000, 81.3], [42500, 82.1], [43000, 82.9], [43500, 83.7], [44000, 84.6], [44500, 85.4],
+    [45000, 86.2], [45500, 87.0], [46000, 87.9], [46500, 88.7], [47000, 89.5], [47500, 90.3],
+    [48000, 91.2], [48500, 92.0], [49000, 92.8], [49500, 93.6], [50000, 94.4],
+]
+MIX_REPITITIONS = 3
+# Identifies the generated plan
+SCHEDULE_HASH = ""
+
+
+class SerialDilution:
+    def __init__(self, protocol: protocol_api.ProtocolContext):
+        self.protocol = protocol
+        self.dilutions = self.protocol.load_labware(DILUTION_LOAD_NAME, DECK_LAYOUT["dilutions"])
+        self.samples = self.protocol.load_labware(SAMPLE_LOAD_NAME, DECK_LAYOUT["samples"])
+        self.reservoir = self.protocol.load_labware(
+            "opentrons_6_tuberack_falcon_50ml_conical", DECK_LAYOUT["reservoir"]
+        )
+        p20_tiprack = self.protocol.load_labware(
+            "opentrons_96_filtertiprack_20ul", DECK_LAYOUT["p20_tiprack"]
+        )
+        p300_tiprack = self.protocol.load_labware(
+            "opentrons_96_filtertiprack_200ul", DECK_LAYOUT["p300_tiprack"]
+        )
+        self.pipettes = {
+            "p20": self.protocol.load_instrument(
+                "p20_single_gen2", "left", tip_racks=[p20_tiprack]
+            ),
+            "p300": self.protocol.load_instrument(
+                "p300_single_gen2", "right", tip_racks=[p300_tiprack]
+            ),
+        }
+        self.media = self.reservoir.wells()[1]
+        self.media_volume_ul = MEDIA_TUBE_UL
+        self.protocol.comment(f"Serial dilution plan {SCHEDULE_HASH[:12]}")
+
+    def media_aspiration_location(self):
+        # The largest tabulated volume not above the current one, so the tip
+        # always ends up under the meniscus
+        volumes = [volume_ul for volume_ul, _ in MEDIA_LEVEL_TABLE]
+        index = max(bisect.bisect_right(volumes, self.media_volume_ul) - 1, 0)
+        return self.media.bottom(MEDIA_LEVEL_TABLE[index][1])
+
+    def pick_up_tip(self, pipette: str):
+        self.pipettes[pipette].pick_up_tip()
+
+    def drop_tip(self, pipette: str):
+        self.pipettes[pipette].drop_tip()
+
+    def prefill(self, diluent_ul: float, disposal_ul: float, well_names: list[str]):
+        # One aspiration dispensed above each well in turn, so the tip never
+        # touches a sample and can be kept for the whole prefill
+        pipette = self.pipettes["p300"]
+        pipette.aspirate(
+            diluent_ul * len(well_names) + disposal_ul, self.media_aspiration_location()
+        )
+        for well_name in well_names:
+            pipette.dispense(diluent_ul, self.dilutions[well_name].top(-2))
+        if disposal_ul:
+            pipette.blow_out(self.media.top())
+        self.media_volume_ul -= diluent_ul * len(well_names)
+
+    def dilute(
+        self,
+        pipette: str,
+        source_labware: str,
+        source_well_name: str,
+        well_name: str,
+        transfer_ul: float,
+        mix_ul: float,
+    ):
+        source = getattr(self, source_labware)[source_well_name]
+        self.pipettes[pipette].transfer(
+            transfer_ul,
+            source,
+            self.dilutions[well_name],
+            new_tip="never",
+            mix_after=(MIX_REPITITIONS, mix_ul),
+        )
+
+    def discard(self, pipette: str, well_name: str, discard_ul: float):
+        # Leaves the last well of a series with the same volume as the others
+        self.pipettes[pipette].transfer(
+            discard_ul,
+            self.dilutions[well_name],
+            self.protocol.fixed_trash["A1"],
+            new_tip="never",
+        )
+        self.pipettes[pipette].blow_out()
+
+    def comment(self, text: str):
+        self.protocol.comment(text)
+
+
+def run(protocol: protocol_api.ProtocolContext):
+    simulation = SerialDilution(protocol)
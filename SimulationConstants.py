@@ -0,0 +1,39 @@
+from GenerateSchedule import (
+    DOCTOR_WELL_COUNT,
+    EQUIPMENT_WELL_COUNT,
+    NURSE_WELL_COUNT,
+    PATIENT_WELL_COUNT,
+    SURFACE_WELL_COUNT,
+)
+
+
+# Settings of the simulated run itself. ScheduleToScript.py writes them into
+# ScheduleToScriptTemplate.py, and the JSON backend and the analysis modules
+# read them from here, so every compile target and model agrees.
+INITIAL_MEDIA_UL = 250
+MEDIA_TUBE_UL = 50000
+BACTERIA_TRANSFER_SETTLE_WAIT_SECS = 30
+BLEACH_CONTACT_WAIT_SECS = 30
+BLEACH_MIX_UL = 200
+MIX_REPITITIONS = 4
+MODULE_TEMPERATURE_C = 37
+# Wells fill_all_wells_with_media fills on each plate, every well the schedule uses
+FILLED_WELL_COUNTS = {
+    "patient": PATIENT_WELL_COUNT,
+    "staff": DOCTOR_WELL_COUNT + NURSE_WELL_COUNT,
+    "equipment": EQUIPMENT_WELL_COUNT,
+    "surface": SURFACE_WELL_COUNT,
+}
+
+
+def simulation_constants() -> dict:
+    return {
+        "INITIAL_MEDIA_UL": INITIAL_MEDIA_UL,
+        "MEDIA_TUBE_UL": MEDIA_TUBE_UL,
+        "BACTERIA_TRANSFER_SETTLE_WAIT_SECS": BACTERIA_TRANSFER_SETTLE_WAIT_SECS,
+        "BLEACH_CONTACT_WAIT_SECS": BLEACH_CONTACT_WAIT_SECS,
+        "BLEACH_MIX_UL": BLEACH_MIX_UL,
+        "MIX_REPITITIONS": MIX_REPITITIONS,
+        "MODULE_TEMPERATURE_C": MODULE_TEMPERATURE_C,
+        "FILLED_WELL_COUNTS": FILLED_WELL_COUNTS,
+    }
@@ -0,0 +1,195 @@
+import json
+import math
+from datetime import timedelta
+from functools import cache
+from pathlib import Path
+
+
+LABWARE_DIR = Path(__file__).parent / "labware"
+
+# Front left corner of each OT-2 deck slot in deck coordinates (mm)
+DECK_SLOT_ORIGINS = {
+    "1": (0.0, 0.0),
+    "2": (132.5, 0.0),
+    "3": (265.0, 0.0),
+    "4": (0.0, 90.5),
+    "5": (132.5, 90.5),
+    "6": (265.0, 90.5),
+    "7": (0.0, 181.0),
+    "8": (132.5, 181.0),
+    "9": (265.0, 181.0),
+    "10": (0.0, 271.5),
+    "11": (132.5, 271.5),
+}
+# Labware on a temperature module sits slightly shifted from the slot corner
+TEMPERATURE_MODULE_LABWARE_OFFSET = (-0.15, -0.15)
+
+GANTRY_XY_MM_PER_SEC = 400
+# Time spent rising to a safe height and descending into the next labware
+ARC_SECS = 0.6
+
+# Matches DECK_LAYOUT in ScheduleToScriptTemplate.py
+DEFAULT_DECK_LAYOUT = {
+    "patient": "10",
+    "staff": "7",
+    "equipment": "8",
+    "surface": "11",
+    "reservoir": "3",
+    "tipracks": ["6", "5", "4", "1", "2", "9"],
+}
+TEMPERATURE_MODULE_PLATES = ["patient", "staff"]
+
+WELL_PLATE_LOAD_NAME = "corning_96_wellplate_360ul_flat"
+TIPRACK_LOAD_NAME = "opentrons_96_tiprack_300ul"
+RESERVOIR_LOAD_NAME = "opentrons_6_tuberack_falcon_50ml_conical"
+
+# Indices into the reservoir wells, matching HospitalSimulation.setup_reagents
+MEDIA_WELL = 0
+WASTE_WELL = 2
+BLEACH_WELL = 3
+
+Point = tuple[float, float]
+
+
+@cache
+def load_labware_definition(load_name: str) -> dict:
+    for path in LABWARE_DIR.glob("*.json"):
+        definition = json.loads(path.read_text())
+        if definition["parameters"]["loadName"] == load_name:
+            return definition
+
+    from opentrons_shared_data.labware import load_definition
+
+    return load_definition(load_name, 1)
+
+
+def well_positions(load_name: str, slot: str, on_module: bool = False) -> list[Point]:
+    definition = load_labware_definition(load_name)
+    slot_x, slot_y = DECK_SLOT_ORIGINS[slot]
+    corner_offset = definition.get("cornerOffsetFromSlot", {"x": 0, "y": 0})
+    origin_x = slot_x + corner_offset["x"]
+    origin_y = slot_y + corner_offset["y"]
+    if on_module:
+        origin_x += TEMPERATURE_MODULE_LABWARE_OFFSET[0]
+        origin_y += TEMPERATURE_MODULE_LABWARE_OFFSET[1]
+
+    # Opentrons orders labware.wells() column by column
+    return [
+        (origin_x + definition["wells"][name]["x"], origin_y + definition["wells"][name]["y"])
+        for column in definition["ordering"]
+        for name in column
+    ]
+
+
+class TravelModel:
+    def __init__(self, layout: dict = DEFAULT_DECK_LAYOUT):
+        self.layout = layout
+        self.plate_wells = {
+            plate: well_positions(
+                WELL_PLATE_LOAD_NAME, layout[plate], plate in TEMPERATURE_MODULE_PLATES
+            )
+            for plate in ["patient", "staff", "equipment", "surface"]
+        }
+        self.reservoir_wells = well_positions(RESERVOIR_LOAD_NAME, layout["reservoir"])
+        self.tiprack_wells = [
+            well_positions(TIPRACK_LOAD_NAME, slot) for slot in layout["tipracks"]
+        ]
+
+    def move_secs(self, start: Point, end: Point) -> float:
+        if start == end:
+            return 0.0
+        return ARC_SECS + math.dist(start, end) / GANTRY_XY_MM_PER_SEC
+
+    def operation_stops(self, name: str, args: tuple) -> list[Point] | None:
+        # Wells the head visits between picking up and returning a tip
+        if name == "transfer":
+            source_plate, target_plate, source_number, target_number, _ = args
+            source = self.plate_wells[source_plate][source_number]
+            target = self.plate_wells[target_plate][target_number]
+            return [source, target, source, self.reservoir_wells[BLEACH_WELL]]
+        elif name == "clean":
+            plate, number, *_ = args
+            return [
+                self.reservoir_wells[MEDIA_WELL],
+                self.plate_wells[plate][number],
+                self.reservoir_wells[WASTE_WELL],
+                self.reservoir_wells[BLEACH_WELL],
+            ]
+        return None
+
+    def choose_tiprack(
+        self, next_tips: list[int], head: Point | None, first_stop: Point, nearest: bool
+    ) -> int:
+        racks_with_tips = [
+            rack
+            for rack, next_tip in enumerate(next_tips)
+            if next_tip < len(self.tiprack_wells[rack])
+        ]
+        if not racks_with_tips:
+            raise ValueError("schedule uses more tips than the tip racks hold")
+        if not nearest:
+            return racks_with_tips[0]
+
+        def tip_detour(rack: int) -> float:
+            tip = self.tiprack_wells[rack][next_tips[rack]]
+            detour = self.move_secs(tip, first_stop)
+            if head is not None:
+                detour += self.move_secs(head, tip)
+            return detour
+
+        return min(racks_with_tips, key=tip_detour)
+
+    def estimate_travel_secs(self, operations: list, nearest_tiprack: bool) -> float:
+        next_tips = [0] * len(self.tiprack_wells)
+        # One tip fills the wells with media before the schedule starts
+        fill_rack = self.choose_tiprack(
+            next_tips, None, self.reservoir_wells[MEDIA_WELL], nearest_tiprack
+        )
+        next_tips[fill_rack] += 1
+        head = None
+        total_secs = 0.0
+        for name, args in operations:
+            if name == "end_of_day_restock":
+                next_tips = [0] * len(self.tiprack_wells)
+                continue
+            stops = self.operation_stops(name, args)
+            if stops is None:
+                continue
+
+            rack = self.choose_tiprack(next_tips, head, stops[0], nearest_tiprack)
+            tip = self.tiprack_wells[rack][next_tips[rack]]
+            # Returned tips are not reused until the racks are restocked
+            next_tips[rack] += 1
+
+            if head is not None:
+                total_secs += self.move_secs(head, tip)
+            path = [tip, *stops, tip]
+            total_secs += sum(
+                self.move_secs(start, end) for start, end in zip(path, path[1:])
+            )
+            head = tip
+        return total_secs
+
+
+def nearest_tiprack_saves(operations: list, model: TravelModel) -> bool:
+    # Taking each tip from the nearest rack is greedy and can add travel, so
+    # compiled scripts only do it when the model says it saves some
+    return model.estimate_travel_secs(operations, nearest_tiprack=True) < model.estimate_travel_secs(
+        operations, nearest_tiprack=False
+    )
+
+
+def travel_report(operations: list, model: TravelModel) -> str:
+    # Every clean is a round trip from its tip through the media tube, so the
+    # order of a clean block does not change travel; only the tip racks do
+    first_rack_secs = model.estimate_travel_secs(operations, nearest_tiprack=False)
+    nearest_rack_secs = model.estimate_travel_secs(operations, nearest_tiprack=True)
+    saved_secs = first_rack_secs - nearest_rack_secs
+    if saved_secs > 0:
+        choice = f"saved {timedelta(seconds=round(saved_secs))}, taking tips from the nearest rack"
+    else:
+        choice = f"the nearest rack would add {timedelta(seconds=round(-saved_secs))}, taking tips rack by rack"
+    return (
+        f"Estimated head travel: {timedelta(seconds=round(first_rack_secs))} taking tips rack by rack, "
+        f"{timedelta(seconds=round(nearest_rack_secs))} from the nearest tip rack ({choice})"
+    )
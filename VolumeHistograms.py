@@ -0,0 +1,156 @@
+import argparse
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from GenerateSchedule import (
+    BACTERIA_TRANSFER_BASE_UL,
+    BACTERIA_TRANSFER_GAUSS_MUL,
+    CLEANING_AMOUNT_BASE_UL,
+    CLEANING_AMOUNT_GAUSS_MUL,
+)
+from RunLogParser import iter_run_log_commands, iter_schedule_events
+from ScheduleAligner import ExecutedOperations, planned_operations
+
+
+# Values are binned this many at a time
+CHUNK_SIZE = 4096
+
+# Fixed bins (low, high, bin count) so histograms from any run can be added up
+HISTOGRAM_BINS = {
+    "transfer_ul": (
+        BACTERIA_TRANSFER_BASE_UL - BACTERIA_TRANSFER_GAUSS_MUL,
+        BACTERIA_TRANSFER_BASE_UL + BACTERIA_TRANSFER_GAUSS_MUL,
+        50,
+    ),
+    "clean_ul": (
+        CLEANING_AMOUNT_BASE_UL - CLEANING_AMOUNT_GAUSS_MUL,
+        CLEANING_AMOUNT_BASE_UL + CLEANING_AMOUNT_GAUSS_MUL,
+        50,
+    ),
+    "interaction_gap_secs": (0, 30 * 60, 60),
+}
+HISTOGRAM_TITLES = {
+    "transfer_ul": "Bacteria transfer volume (µL)",
+    "clean_ul": "Clean volume (µL)",
+    "interaction_gap_secs": "Seconds between interactions",
+}
+
+
+class FixedBinHistogram:
+    def __init__(self, low: float, high: float, bins: int):
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        bins = np.searchsorted(self.edges, values, side="right") - 1
+        # The top edge belongs to the last bin, like np.histogram
+        bins[values == self.edges[-1]] = len(self.counts) - 1
+        in_range = (bins >= 0) & (bins < len(self.counts))
+        self.counts += np.bincount(bins[in_range], minlength=len(self.counts))
+        self.underflow += int(np.count_nonzero(values < self.edges[0]))
+        self.overflow += int(np.count_nonzero(values > self.edges[-1]))
+        self.total += len(values)
+        self.sum += float(values.sum())
+
+    def merge(self, other: "FixedBinHistogram") -> "FixedBinHistogram":
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Only histograms with the same bins can be merged")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.total += other.total
+        self.sum += other.sum
+        return self
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else float("nan")
+
+
+def new_histograms() -> dict[str, FixedBinHistogram]:
+    return {name: FixedBinHistogram(*bins) for name, bins in HISTOGRAM_BINS.items()}
+
+
+def operation_values(operations: Iterable[dict], time_key: str) -> Iterator[tuple[str, float]]:
+    # Flattens operations into (histogram name, value) pairs
+    previous_transfer_secs = None
+    for operation in operations:
+        if operation["operation"] == "clean":
+            yield "clean_ul", operation["volume_ul"]
+            continue
+        yield "transfer_ul", operation["volume_ul"]
+        transfer_secs = operation[time_key]
+        if transfer_secs is not None and previous_transfer_secs is not None:
+            yield "interaction_gap_secs", transfer_secs - previous_transfer_secs
+        previous_transfer_secs = transfer_secs
+
+
+def histogram_file(path: Path) -> dict[str, FixedBinHistogram]:
+    # Run logs are JSON objects, schedules are bare lists of events
+    with open(path) as file:
+        is_run_log = file.read(4096).lstrip().startswith("{")
+    if is_run_log:
+        operations = ExecutedOperations(iter_run_log_commands(path))
+        values = operation_values(operations, "executed_secs")
+    else:
+        operations = planned_operations(iter_schedule_events(path))
+        values = operation_values(operations, "planned_secs")
+
+    histograms = new_histograms()
+    pending = {name: [] for name in histograms}
+    for name, value in values:
+        pending[name].append(value)
+        if len(pending[name]) >= CHUNK_SIZE:
+            histograms[name].add(pending[name])
+            pending[name] = []
+    for name, values in pending.items():
+        if values:
+            histograms[name].add(values)
+    return histograms
+
+
+def histogram_files(paths: list[Path], jobs: int | None = None) -> dict[str, FixedBinHistogram]:
+    histograms = new_histograms()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for file_histograms in executor.map(histogram_file, paths):
+            for name, histogram in file_histograms.items():
+                histograms[name].merge(histogram)
+    return histograms
+
+
+def plot_histograms(histograms: dict[str, FixedBinHistogram], file_count: int):
+    fig, axes = plt.subplots(1, len(histograms), figsize=(6 * len(histograms), 5))
+    for ax, (name, histogram) in zip(axes, histograms.items()):
+        ax.stairs(histogram.counts, histogram.edges, fill=True)
+        ax.set_title(
+            f"{HISTOGRAM_TITLES[name]}\n{histogram.total} values, mean {histogram.mean():.1f}"
+            + (f", {histogram.overflow} above range" if histogram.overflow else "")
+        )
+        ax.set_ylabel("Count")
+    fig.suptitle(f"Histograms over {file_count} files")
+    fig.tight_layout()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Histogram volumes and interaction gaps across schedules or run logs"
+    )
+    parser.add_argument("paths", nargs="+", type=Path, help="schedule or run log JSON files")
+    parser.add_argument("--jobs", type=int, help="files to read at once")
+    parser.add_argument("--output", type=Path, help="save the figure instead of showing it")
+    args = parser.parse_args()
+
+    histograms = histogram_files(args.paths, args.jobs)
+    plot_histograms(histograms, len(args.paths))
+    if args.output is not None:
+        plt.savefig(args.output)
+    else:
+        plt.show()